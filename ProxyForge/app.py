@@ -1,4 +1,3 @@
-import json
 from pathlib import Path
 
 import streamlit as st
@@ -10,6 +9,8 @@ from w40k_builder import run_40k_builder
 from library_ui import run_library_ui
 from army_book_ui import run_army_book_ui
 from w40k_army_book_ui import run_w40k_army_book_ui
+from query_profile import begin_rerun, render_query_profile_panel
+from source_cache import load_json
 
 try:
     from alpha_logging import log_page_view, log_feature
@@ -28,69 +29,7 @@ OPR_GAME_SYSTEM_NUM_TO_SLUG = {
 SLUG_TO_GAME_SYSTEM_NUM = {v: k for k, v in OPR_GAME_SYSTEM_NUM_TO_SLUG.items()}
 
 
-def _load_opr_factions_from_source_list(opr_mode_slug):
-    """Load faction display options for the Create New List dropdown from army_forge_armies.json.
-    This ensures all armies (including creator) show up even if the DB hasn't been hydrated yet."""
-    try:
-        path = Path(__file__).resolve().parent.parent / "data" / "opr" / "army_forge_armies.json"
-        if not path.exists():
-            return None
-        with open(path, "r", encoding="utf-8") as f:
-            armies = json.load(f)
-    except Exception:
-        return None
-    game_system_num = SLUG_TO_GAME_SYSTEM_NUM.get(opr_mode_slug)
-    if game_system_num is None:
-        return None
-    # (armyName strip, source) per faction; prefer creator if same name appears twice
-    by_name = {}
-    for a in armies:
-        if a.get("gameSystem") != game_system_num:
-            continue
-        name = (a.get("armyName") or "").strip()
-        if not name:
-            continue
-        src = a.get("source", "official")
-        if name not in by_name or src == "creator":
-            by_name[name] = src
-    official = sorted(n for n, s in by_name.items() if s == "official")
-    creator = sorted(n for n, s in by_name.items() if s == "creator")
-
-    def _opr_faction_display(name, source_label):
-        tag = ""
-        if opr_mode_slug == "age-of-fantasy-skirmish" and name in GUILDS_OF_THE_NEXUS_FACTIONS:
-            tag = " (Guilds)"
-        elif opr_mode_slug == "grimdark-future-firefight" and name in GANGS_OF_NEW_EDEN_FACTIONS:
-            tag = " (Gangs)"
-        return name + tag + " " + source_label
-
-    return (
-        [_opr_faction_display(f, "(Official)") for f in official]
-        + [_opr_faction_display(f, "(Creator)") for f in creator]
-    )
-
-
-def _load_opr_army_source_lookup():
-    """(army_name, game_system_slug) -> 'official' | 'creator'. Uses data/opr/army_forge_armies.json.
-    When the same (armyName, slug) appears as both official and creator, prefer 'creator' so creator books are visible."""
-    try:
-        path = Path(__file__).resolve().parent.parent / "data" / "opr" / "army_forge_armies.json"
-        if not path.exists():
-            return {}
-        with open(path, "r", encoding="utf-8") as f:
-            armies = json.load(f)
-        # Collect all sources per (armyName, slug); then prefer "creator" if any entry is creator
-        by_key = {}
-        for a in armies:
-            gs = a.get("gameSystem")
-            slug = OPR_GAME_SYSTEM_NUM_TO_SLUG.get(gs)
-            if slug and a.get("armyName"):
-                key = (a["armyName"].strip(), slug)
-                by_key.setdefault(key, set()).add(a.get("source", "official"))
-        return {k: ("creator" if "creator" in v else "official") for k, v in by_key.items()}
-    except Exception:
-        return {}
-
+OPR_ARMIES_PATH = Path(__file__).resolve().parent.parent / "data" / "opr" / "army_forge_armies.json"
 
 # Guilds of the Nexus subfactions (Age of Fantasy Skirmish) — show "(Guilds)" tag in dropdown
 GUILDS_OF_THE_NEXUS_FACTIONS = frozenset({
@@ -107,6 +46,71 @@ GANGS_OF_NEW_EDEN_FACTIONS = frozenset({
 })
 
 
+def _opr_faction_display(name, opr_mode_slug, source_label):
+    """Dropdown label: name, then ' (Guilds)' / ' (Gangs)' for those subfactions, then the source label."""
+    tag = ""
+    if opr_mode_slug == "age-of-fantasy-skirmish" and name in GUILDS_OF_THE_NEXUS_FACTIONS:
+        tag = " (Guilds)"
+    elif opr_mode_slug == "grimdark-future-firefight" and name in GANGS_OF_NEW_EDEN_FACTIONS:
+        tag = " (Gangs)"
+    return name + tag + " " + source_label
+
+
+@st.cache_resource(max_entries=1)
+def _build_opr_army_index(path: str, mtime_ns: int):
+    """
+    Faction index of one version of army_forge_armies.json, shared by all sessions:
+      factions  {slug: (display label, ...)}  official armies sorted, then creator armies sorted
+      sources   {(army_name, slug): 'official' | 'creator'}
+    When the same (armyName, slug) appears as both official and creator, prefer 'creator' so creator books are visible.
+    """
+    # All sources per (armyName, slug) in file order
+    by_key = {}
+    for a in load_json(path):
+        slug = OPR_GAME_SYSTEM_NUM_TO_SLUG.get(a.get("gameSystem"))
+        name = (a.get("armyName") or "").strip()
+        if slug and name:
+            by_key.setdefault((name, slug), {})[a.get("source", "official")] = None
+    by_slug = {slug: {"official": [], "creator": []} for slug in SLUG_TO_GAME_SYSTEM_NUM}
+    for (name, slug), srcs in by_key.items():
+        src = "creator" if "creator" in srcs else next(iter(srcs))
+        if src in by_slug[slug]:
+            by_slug[slug][src].append(name)
+    factions = {
+        slug: tuple(
+            [_opr_faction_display(f, slug, "(Official)") for f in sorted(lists["official"])]
+            + [_opr_faction_display(f, slug, "(Creator)") for f in sorted(lists["creator"])]
+        )
+        for slug, lists in by_slug.items()
+    }
+    sources = {k: ("creator" if "creator" in v else "official") for k, v in by_key.items()}
+    return {"factions": factions, "sources": sources}
+
+
+def _opr_army_index():
+    """Faction index of army_forge_armies.json (rebuilt when the file changes), or None if missing/unreadable."""
+    try:
+        mtime_ns = OPR_ARMIES_PATH.stat().st_mtime_ns
+        return _build_opr_army_index(str(OPR_ARMIES_PATH), mtime_ns)
+    except Exception:
+        return None
+
+
+def _load_opr_factions_from_source_list(opr_mode_slug):
+    """Faction display options for the Create New List dropdown from army_forge_armies.json.
+    This ensures all armies (including creator) show up even if the DB hasn't been hydrated yet."""
+    index = _opr_army_index()
+    if index is None or opr_mode_slug not in index["factions"]:
+        return None
+    return list(index["factions"][opr_mode_slug])
+
+
+def _load_opr_army_source_lookup():
+    """(army_name, game_system_slug) -> 'official' | 'creator' from army_forge_armies.json ({} if missing)."""
+    index = _opr_army_index()
+    return index["sources"] if index is not None else {}
+
+
 def _strip_opr_faction_label(display_value):
     """Remove ' (Official)', ' (Creator)', ' (Guilds)', ' (Gangs)' from dropdown selection to get faction_primary."""
     if not display_value:
@@ -125,6 +129,7 @@ def _strip_opr_faction_label(display_value):
 
 
 st.set_page_config(layout="wide", page_title="ProxyForge")
+begin_rerun()
 
 try:
     conn = get_db_connection()
@@ -198,17 +203,9 @@ try:
                     if source_lookup.get((f, opr_mode_slug), "official") == "creator"
                 )
 
-                def _opr_faction_display(name, source_label):
-                    tag = ""
-                    if opr_mode_slug == "age-of-fantasy-skirmish" and name in GUILDS_OF_THE_NEXUS_FACTIONS:
-                        tag = " (Guilds)"
-                    elif opr_mode_slug == "grimdark-future-firefight" and name in GANGS_OF_NEW_EDEN_FACTIONS:
-                        tag = " (Gangs)"
-                    return name + tag + " " + source_label
-
                 fac_options = (
-                    [_opr_faction_display(f, "(Official)") for f in official_factions]
-                    + [_opr_faction_display(f, "(Creator)") for f in creator_factions]
+                    [_opr_faction_display(f, opr_mode_slug, "(Official)") for f in official_factions]
+                    + [_opr_faction_display(f, opr_mode_slug, "(Creator)") for f in creator_factions]
                 )
             if not fac_options:
                 st.caption("No armies found for this game mode. Add armies to data/opr/army_forge_armies.json and run build_unified_army_list.py, or run fetch and hydrator to load OPR data.")
@@ -302,6 +299,7 @@ try:
         else:
             st.warning("Create a 40K list in the sidebar to begin.")
 
+    render_query_profile_panel(page)
     conn.close()
 except Exception as e:
     st.error(f"System Error: {e}")
@@ -1,14 +1,15 @@
 """
 Army Forge-style army book view: display OPR JSON data for a selected army.
 Shows army detail (background, rules, spells from opr_army_detail) and all units
-and their upgrade options from data/opr/data.json.
+and their upgrade options from data/opr/data.json, indexed once per file version by opr_book_store.
 """
-import json
 from pathlib import Path
 
 import streamlit as st
 
 from database_utils import get_db_connection
+from opr_book_store import build_book_store
+from opr_rules import load_rule_glossary
 
 # Repo root: ProxyForge/army_book_ui.py -> parent = ProxyForge, parent.parent = repo
 _REPO_ROOT = Path(__file__).resolve().parent.parent
@@ -24,42 +25,19 @@ SYSTEM_LABELS = {
 }
 
 
-@st.cache_data(ttl=300)
-def load_opr_data():
-    """Load and return the OPR units array from data.json. Cached for 5 min."""
-    if not OPR_DATA_PATH.exists():
-        return None
-    with open(OPR_DATA_PATH, "r", encoding="utf-8") as f:
-        return json.load(f)
-
+@st.cache_resource(max_entries=1, show_spinner="Indexing OPR army books…")
+def _load_book_store(path: str, mtime_ns: int):
+    """BookStore for one version of data.json; shared by all sessions, rebuilt when the file changes."""
+    return build_book_store(path)
 
-def get_systems_and_armies(data):
-    """Return (systems, system_to_armies). systems = sorted list; system_to_armies = {slug: [army1, army2, ...]}."""
-    system_to_armies = {}
-    for entry in data:
-        if not isinstance(entry, dict):
-            continue
-        sys_slug = entry.get("system") or "grimdark-future"
-        army = entry.get("army") or "Unknown"
-        if sys_slug not in system_to_armies:
-            system_to_armies[sys_slug] = set()
-        system_to_armies[sys_slug].add(army)
-    # Sort armies per system, and system order by label
-    for k in system_to_armies:
-        system_to_armies[k] = sorted(system_to_armies[k])
-    systems = sorted(system_to_armies.keys(), key=lambda s: SYSTEM_LABELS.get(s, s))
-    return systems, system_to_armies
 
-
-def filter_entries(data, system_slug, army_name):
-    """Return entries for the given system and army."""
-    return [
-        e
-        for e in data
-        if isinstance(e, dict)
-        and (e.get("system") or "grimdark-future") == system_slug
-        and (e.get("army") or "") == army_name
-    ]
+def load_opr_store():
+    """Indexed army book store for data.json (see opr_book_store), or None if the file is missing."""
+    try:
+        mtime_ns = OPR_DATA_PATH.stat().st_mtime_ns
+    except OSError:
+        return None
+    return _load_book_store(str(OPR_DATA_PATH), mtime_ns)
 
 
 # Display order for unit groups (Army Forge style)
@@ -73,79 +51,31 @@ UNIT_GROUP_ORDER = (
 )
 
 
-def _generic_name_to_group(generic_name):
-    """Derive unit group from genericName when unitGroup is missing (e.g. old data)."""
-    if not generic_name or not isinstance(generic_name, str):
-        return "Other"
-    g = generic_name.strip().lower()
-    if "hero" in g:
-        return "Heroes"
-    if "titan" in g or ("great" in g and "monster" in g):
-        return "Vehicles & Monsters"
-    if any(x in g for x in ("monster", "vehicle", "tank", "walker", "gunship", "speeder", "chariot", "drop pod", "artillery beast", "brute giant")):
-        return "Vehicles & Monsters"
-    if "artillery" in g or "support " in g or "altar" in g:
-        return "Support"
-    non_core = ("elite", "heavy", "assault", "support", "veteran", "psychic", "flying", "shield", "brute")
-    if any(x in g for x in ("light infantry", "scouts", "fanatics", "swarms")) and not any(x in g for x in non_core):
-        return "Core"
-    if g == "infantry" or g == "bikers":
-        return "Core"
-    if ("infantry" in g or "bikers" in g) and not any(x in g for x in non_core):
-        return "Core"
-    return "Special"
-
-
-def group_entries_by_unit_group(entries):
-    """Return dict: group_label -> list of entries (sorted by cost, name)."""
-    groups = {}
-    for e in entries:
-        grp = e.get("unitGroup")
-        if not grp:
-            generic = (e.get("unit") or {}).get("genericName") or ""
-            grp = _generic_name_to_group(generic)
-        if grp not in groups:
-            groups[grp] = []
-        groups[grp].append(e)
-    for grp in groups:
-        groups[grp].sort(key=lambda x: (x.get("cost") or 0, (x.get("name") or "")))
-    return groups
-
-
-def render_unit(entry):
-    """Render one unit card: stats + upgrade sets."""
-    unit = entry.get("unit") or {}
-    bases = unit.get("bases") or {}
-    round_base = bases.get("round") or bases.get("square") or "—"
-    generic = unit.get("genericName") or "—"
-
+def render_unit(unit):
+    """Render one unit card (a BookUnit): stats + upgrade sets."""
     with st.container(border=True):
         # Header row: name, cost, Q, D, wounds, size
-        st.subheader(entry.get("name") or "Unnamed")
+        st.subheader(unit.name)
         col1, col2, col3, col4, col5 = st.columns(5)
-        col1.metric("Cost", f"{entry.get('cost', 0)} pts")
-        col2.metric("Quality", f"{entry.get('quality', '-')}+")
-        col3.metric("Defense", f"{entry.get('defense', '-')}+")
-        col4.metric("Wounds", entry.get("wounds", 1))
-        col5.metric("Size", entry.get("size", 1))
+        col1.metric("Cost", f"{unit.cost} pts")
+        col2.metric("Quality", f"{unit.quality}+")
+        col3.metric("Defense", f"{unit.defense}+")
+        col4.metric("Wounds", unit.wounds)
+        col5.metric("Size", unit.size)
 
-        st.caption(f"**Type:** {generic}  ·  **Base:** {round_base} mm round")
+        st.caption(f"**Type:** {unit.generic_name}  ·  **Base:** {unit.round_base} mm round")
 
         # Upgrade sets
-        upgrade_sets = entry.get("upgradeSets") or []
-        if upgrade_sets:
+        if unit.upgrade_sets:
             st.markdown("**Upgrades**")
-            for section in upgrade_sets:
-                label = section.get("label") or "Options"
-                options = section.get("options") or []
+            for label, options in unit.upgrade_sets:
                 with st.expander(label, expanded=False):
                     if not options:
                         st.caption("No options")
                     else:
-                        for opt in options:
-                            cost = opt.get("cost")
+                        for opt_label, cost in options:
                             cost_str = f"+{cost} pts" if cost else ""
-                            st.write(f"• **{opt.get('label', '')}** {cost_str}")
+                            st.write(f"• **{opt_label}** {cost_str}")
         st.divider()
 
 
@@ -194,17 +124,34 @@ def render_army_detail(army_name: str, game_system: str):
     return True
 
 
+def render_rule_glossary_download(army_name: str, game_system: str):
+    """Download button for the army's compiled rule glossary (opr_rules) as compact JSON."""
+    try:
+        payload = load_rule_glossary().to_json(army_name, game_system)
+    except Exception:
+        return False
+    slug = "".join(ch if ch.isalnum() else "_" for ch in army_name).strip("_").lower() or "army"
+    st.download_button(
+        "⬇️ Rule glossary (JSON)",
+        data=payload,
+        file_name=f"opr_rules_{slug}_{game_system}.json",
+        mime="application/json",
+        key="army_book_rule_glossary",
+    )
+    return True
+
+
 def run_army_book_ui():
     """Main entry: system/army selectors and unit list."""
     st.title("OPR Army Book Reference")
     st.caption("Browse units and upgrade options from the OPR data. Data source: `data/opr/data.json`.")
 
-    data = load_opr_data()
-    if data is None:
+    store = load_opr_store()
+    if store is None:
         st.error(f"OPR data file not found: {OPR_DATA_PATH}. Run the OPR fetcher first.")
         return
 
-    systems, system_to_armies = get_systems_and_armies(data)
+    systems = sorted(store.systems, key=lambda s: SYSTEM_LABELS.get(s, s))
     if not systems:
         st.warning("No systems found in data.")
         return
@@ -216,40 +163,33 @@ def run_army_book_ui():
         format_func=lambda s: SYSTEM_LABELS.get(s, s.replace("-", " ").title()),
         key="army_book_system",
     )
-    armies = system_to_armies.get(sys_slug, [])
+    armies = store.armies(sys_slug)
     if not armies:
         st.warning("No armies for this system.")
         return
 
     army_name = st.selectbox("Army", options=armies, key="army_book_army")
-    entries = filter_entries(data, sys_slug, army_name)
-    grouped = group_entries_by_unit_group(entries)
+    grouped = store.groups(sys_slug, army_name)
 
     # Optional: show army cover once (from first unit that has it)
-    army_image_url = None
-    for e in entries:
-        url = (e.get("unit") or {}).get("product") or {}
-        if isinstance(url, dict):
-            url = url.get("imageUrl")
-        if url:
-            army_image_url = url
-            break
+    army_image_url = store.cover_image(sys_slug, army_name)
     if army_image_url:
         st.image(army_image_url, width=200, caption=f"{army_name} — Army Book")
 
     # Army detail (background, rules, spells) from opr_army_detail
     render_army_detail(army_name, sys_slug)
+    render_rule_glossary_download(army_name, sys_slug)
 
     st.divider()
-    st.markdown(f"**{army_name}** — {len(entries)} units")
+    st.markdown(f"**{army_name}** — {store.unit_count(sys_slug, army_name)} units")
     for group_label in UNIT_GROUP_ORDER:
         group_entries = grouped.get(group_label, [])
         if not group_entries:
             continue
         st.subheader(group_label)
         st.caption(f"{len(group_entries)} unit(s)")
-        for entry in group_entries:
-            render_unit(entry)
+        for unit in group_entries:
+            render_unit(unit)
     # Any group not in UNIT_GROUP_ORDER (e.g. from older data)
     for group_label in sorted(grouped.keys()):
         if group_label in UNIT_GROUP_ORDER:
@@ -257,5 +197,5 @@ def run_army_book_ui():
         group_entries = grouped[group_label]
         st.subheader(group_label)
         st.caption(f"{len(group_entries)} unit(s)")
-        for entry in group_entries:
-            render_unit(entry)
+        for unit in group_entries:
+            render_unit(unit)
@@ -1,5 +1,18 @@
-"""Database connection for ProxyForge. Reads config from environment (see repo .env.example)."""
+"""Database connection for ProxyForge. Reads config from environment (see repo .env.example).
+
+Connections are pooled per process: get_db_connection() checks one out of a pool keyed by the
+resolved MYSQL_* config, and calling close() on it returns it to the pool instead of tearing down
+the TLS session. Pool tuning (all optional):
+  MYSQL_POOL_SIZE           max idle connections kept per config (default 5; 0 disables pooling)
+  MYSQL_POOL_PING_AFTER     seconds idle before a checkout pings the server first (default 10)
+  MYSQL_POOL_MAX_IDLE       seconds idle before a connection is recycled instead of reused (default 300)
+  MYSQL_POOL_MAX_LIFETIME   seconds since connect before a connection is recycled (default 1800)
+Set PROXYFORGE_QUERY_PROFILE=1 to hand out instrumented cursors (see query_profile.py).
+"""
 import os
+import threading
+import time
+from contextlib import contextmanager
 
 try:
     from dotenv import load_dotenv
@@ -11,8 +24,21 @@ except ImportError:
 
 import mysql.connector
 
+from query_profile import wrap_connection, wrap_cursor
 
-def get_db_connection():
+
+def _env_number(name, default, cast=float):
+    raw = (os.environ.get(name) or "").strip()
+    if not raw:
+        return default
+    try:
+        return cast(raw)
+    except ValueError:
+        return default
+
+
+def _connection_kwargs():
+    """Resolve MYSQL_* env into mysql.connector.connect kwargs."""
     host = (os.environ.get("MYSQL_HOST") or "localhost").strip()
     password = (os.environ.get("MYSQL_PASSWORD") or "").strip()
     port_str = (os.environ.get("MYSQL_PORT") or "").strip()
@@ -34,4 +60,219 @@ def get_db_connection():
         kwargs["ssl_disabled"] = False
         if (os.environ.get("MYSQL_SSL_VERIFY") or "1").strip().lower() in ("0", "false", "no"):
             kwargs["ssl_verify_cert"] = False
-    return mysql.connector.connect(**kwargs)
+    return kwargs
+
+
+class _PoolSlot:
+    """A raw connection plus the bookkeeping the pool needs to decide whether to reuse it."""
+    __slots__ = ("raw", "created_at", "last_used")
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+
+
+class PooledConnection:
+    """Facade over a pooled mysql.connector connection. close() checks it back in; everything else
+    (cursor, commit, rollback, autocommit, ...) is delegated to the underlying connection."""
+
+    def __init__(self, pool, slot):
+        object.__setattr__(self, "_pool", pool)
+        object.__setattr__(self, "_slot", slot)
+
+    def __getattr__(self, name):
+        slot = object.__getattribute__(self, "_slot")
+        if slot is None:
+            raise mysql.connector.errors.OperationalError("Connection already returned to the pool")
+        return getattr(slot.raw, name)
+
+    def __setattr__(self, name, value):
+        slot = object.__getattribute__(self, "_slot")
+        if slot is None:
+            raise mysql.connector.errors.OperationalError("Connection already returned to the pool")
+        setattr(slot.raw, name, value)
+
+    def cursor(self, *args, **kwargs):
+        # Instrumented when PROXYFORGE_QUERY_PROFILE is set; plain cursor otherwise.
+        return wrap_cursor(self.__getattr__("cursor")(*args, **kwargs))
+
+    def close(self):
+        """Return the connection to its pool. Safe to call more than once."""
+        slot = object.__getattribute__(self, "_slot")
+        if slot is None:
+            return
+        object.__setattr__(self, "_slot", None)
+        object.__getattribute__(self, "_pool")._checkin(slot)
+
+    def discard(self):
+        """Close the underlying connection for real (e.g. after a fatal error) instead of reusing it."""
+        slot = object.__getattribute__(self, "_slot")
+        if slot is None:
+            return
+        object.__setattr__(self, "_slot", None)
+        object.__getattribute__(self, "_pool")._discard(slot)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+class ConnectionPool:
+    """Process-wide pool for one resolved MySQL config. Idle connections are kept LIFO so the warmest
+    one is reused first; connections past their idle/lifetime budget are closed and replaced."""
+
+    def __init__(self, kwargs, size, ping_after, max_idle, max_lifetime):
+        self._kwargs = kwargs
+        self.size = size
+        self.ping_after = ping_after
+        self.max_idle = max_idle
+        self.max_lifetime = max_lifetime
+        self._idle = []
+        self._lock = threading.Lock()
+        self._stats = dict(created=0, reused=0, pinged=0, ping_failures=0, recycled=0, discarded=0, checked_out=0)
+
+    def _connect(self):
+        raw = mysql.connector.connect(**self._kwargs)
+        with self._lock:
+            self._stats["created"] += 1
+        return _PoolSlot(raw)
+
+    @staticmethod
+    def _close_raw(slot):
+        try:
+            slot.raw.close()
+        except Exception:
+            pass
+
+    def _usable(self, slot, now):
+        """Liveness check: recycle stale connections, ping ones that have been idle a while."""
+        if now - slot.created_at > self.max_lifetime or now - slot.last_used > self.max_idle:
+            with self._lock:
+                self._stats["recycled"] += 1
+            return False
+        if now - slot.last_used > self.ping_after:
+            with self._lock:
+                self._stats["pinged"] += 1
+            try:
+                slot.raw.ping(reconnect=False)
+            except Exception:
+                with self._lock:
+                    self._stats["ping_failures"] += 1
+                return False
+        return True
+
+    def checkout(self):
+        while True:
+            with self._lock:
+                slot = self._idle.pop() if self._idle else None
+            if slot is None:
+                slot = self._connect()
+                break
+            if self._usable(slot, time.monotonic()):
+                with self._lock:
+                    self._stats["reused"] += 1
+                break
+            self._close_raw(slot)
+        with self._lock:
+            self._stats["checked_out"] += 1
+        return PooledConnection(self, slot)
+
+    def _checkin(self, slot):
+        with self._lock:
+            self._stats["checked_out"] -= 1
+        raw = slot.raw
+        try:
+            # Leave the session the way get_db_connection() hands it out.
+            if getattr(raw, "in_transaction", False):
+                raw.rollback()
+            if not raw.autocommit:
+                raw.autocommit = True
+        except Exception:
+            self._close_raw(slot)
+            with self._lock:
+                self._stats["discarded"] += 1
+            return
+        slot.last_used = time.monotonic()
+        with self._lock:
+            if len(self._idle) < self.size:
+                self._idle.append(slot)
+                return
+        self._close_raw(slot)
+
+    def _discard(self, slot):
+        with self._lock:
+            self._stats["checked_out"] -= 1
+            self._stats["discarded"] += 1
+        self._close_raw(slot)
+
+    def clear(self):
+        """Close every idle connection (checked-out ones are closed when returned past capacity)."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for slot in idle:
+            self._close_raw(slot)
+
+    def stats(self):
+        with self._lock:
+            out = dict(self._stats)
+            out["idle"] = len(self._idle)
+        out.update(size=self.size, host=self._kwargs.get("host"), database=self._kwargs.get("database"))
+        return out
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def _pool_for(kwargs):
+    key = tuple(sorted(kwargs.items()))
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = ConnectionPool(
+                kwargs,
+                size=_env_number("MYSQL_POOL_SIZE", 5, int),
+                ping_after=_env_number("MYSQL_POOL_PING_AFTER", 10.0),
+                max_idle=_env_number("MYSQL_POOL_MAX_IDLE", 300.0),
+                max_lifetime=_env_number("MYSQL_POOL_MAX_LIFETIME", 1800.0),
+            )
+            _pools[key] = pool
+        return pool
+
+
+def get_db_connection():
+    """Return a MySQL connection for the current MYSQL_* config. Pooled unless MYSQL_POOL_SIZE=0;
+    call close() as before to hand it back."""
+    kwargs = _connection_kwargs()
+    if _env_number("MYSQL_POOL_SIZE", 5, int) <= 0:
+        return wrap_connection(mysql.connector.connect(**kwargs))
+    return _pool_for(kwargs).checkout()
+
+
+@contextmanager
+def db_connection():
+    """with db_connection() as conn: ... -- checks a pooled connection out and always returns it."""
+    conn = get_db_connection()
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+
+def get_pool_stats():
+    """Stats for every pool in this process (one per distinct MYSQL_* config)."""
+    with _pools_lock:
+        pools = list(_pools.values())
+    return [p.stats() for p in pools]
+
+
+def close_all_pools():
+    """Close idle pooled connections, e.g. before a hydrator exits or after changing credentials."""
+    with _pools_lock:
+        pools = list(_pools.values())
+    for p in pools:
+        p.clear()
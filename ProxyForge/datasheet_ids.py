@@ -0,0 +1,90 @@
+"""
+Canonical 40K datasheet ids: one normalizer for Python lookups and one indexed equality for SQL.
+
+Ids reach the app as '000000123' (Wahapedia CSVs), '123' (older dumps), 123.0 (pandas floats) or
+with stray whitespace. clean_id() is the display/dict-key form (stripped, no '.0'); datasheet_key()
+also drops leading zeros and equals the STORED generated key columns added by
+migrations/add_waha_datasheet_keys.sql (datasheet_key, leader_key, attached_key; all indexed).
+rows_by_datasheet() runs a lookup as a single `key_col = %s`, or `col = %s` on databases where the
+migration has not been run yet.
+"""
+import math
+
+# Source id column -> generated key column (migrations/add_waha_datasheet_keys.sql).
+KEY_COLUMNS = {
+    "waha_datasheet_id": "datasheet_key",
+    "datasheet_id": "datasheet_key",
+    "leader_id": "leader_key",
+    "attached_id": "attached_key",
+}
+
+# Whether the key columns exist. None until the first lookup checks, then cached for the process.
+_has_key_columns = None
+# MySQL ER_BAD_FIELD_ERROR ("Unknown column"): the only probe failure that means the columns are missing.
+_ER_BAD_FIELD_ERROR = 1054
+
+
+def clean_id(value):
+    """Datasheet/entry id as a stripped string without a pandas float suffix ('123.0' -> '123'); '' for None/NaN."""
+    if value is None:
+        return ""
+    try:
+        if isinstance(value, float) and math.isnan(value):
+            return ""
+    except TypeError:
+        pass
+    s = str(value).strip()
+    return s[:-2] if s.endswith(".0") and s[:-2].isdigit() else s
+
+
+def entry_int(value):
+    """Roster entry id as int; None for None/NaN/unparseable values."""
+    if value is None:
+        return None
+    try:
+        if isinstance(value, float) and math.isnan(value):
+            return None
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def datasheet_key(value):
+    """Canonical matching key: clean_id() without leading zeros ('000000123' and 123.0 -> '123')."""
+    return clean_id(value).lstrip("0")
+
+
+def key_column(col):
+    """Generated key column for an id column, keeping any table alias ('l.leader_id' -> 'l.leader_key')."""
+    alias, _, name = col.rpartition(".")
+    key = KEY_COLUMNS[name]
+    return f"{alias}.{key}" if alias else key
+
+
+def has_key_columns(cursor):
+    """True when migrations/add_waha_datasheet_keys.sql has been run (cached once the probe succeeds or hits an unknown column)."""
+    global _has_key_columns
+    if _has_key_columns is None:
+        try:
+            cursor.execute("SELECT datasheet_key FROM waha_datasheets LIMIT 0")
+            cursor.fetchall()
+            _has_key_columns = True
+        except Exception as e:
+            if getattr(e, "errno", None) != _ER_BAD_FIELD_ERROR:
+                return False  # e.g. a dropped connection: raw columns this time, probe again next call
+            _has_key_columns = False
+    return _has_key_columns
+
+
+def datasheet_where(cursor, col, datasheet_id):
+    """(`{col} = %s` clause, param) for one id lookup, on the indexed key column when available."""
+    if has_key_columns(cursor):
+        return f"{key_column(col)} = %s", datasheet_key(datasheet_id)
+    return f"{col} = %s", clean_id(datasheet_id)
+
+
+def rows_by_datasheet(cursor, sql, col, datasheet_id):
+    """Run sql with {where} filled in by datasheet_where() and return all rows as a list."""
+    where, param = datasheet_where(cursor, col, datasheet_id)
+    cursor.execute(sql.format(where=where), (param,))
+    return list(cursor.fetchall())
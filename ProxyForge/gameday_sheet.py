@@ -0,0 +1,281 @@
+"""
+Printable 40K Game-Day sheet: one self-contained HTML file (optionally a PDF) built server-side.
+
+show_gameday_view used to rely on browser print of the live Streamlit page plus @media print CSS
+overrides. build_sheet_html() renders the same briefing (rules, leader+bodyguard groups, unit stats,
+weapons, abilities, enhancements, stratagems) from the Game-Day prefetch into plain HTML with inline
+CSS; build_sheet_pdf() renders a text-only PDF with fpdf2 when it is installed (pure Python, optional).
+
+Generated files are cached on disk by sheet_key(): a hash of the list settings, every roster entry
+(quantity, points, wargear, attachment), its enhancement and STL choices, the resolved card images
+(default STL links change from the Digital Library without touching the roster or a data version)
+and the waha/mmf data versions. While none of those change, the download is served from the cached
+file instead of being rendered again. Unit images stay links (STL previews / Wahapedia URLs);
+everything else is inline.
+Cache dir: PROXYFORGE_SHEET_CACHE_DIR (default data/cache/gameday_sheets).
+"""
+import hashlib
+import html
+import json
+import os
+from pathlib import Path
+
+from reference_cache import get_data_version
+from text_utils import fix_apostrophe_mojibake
+from w40k_datasheets import gameday_unit_image
+from wargear_parser import _loadout_to_display, _strip_html, _strip_option_html
+
+try:
+    from fpdf import FPDF  # fpdf2
+except ImportError:
+    FPDF = None
+SHEET_PDF_AVAILABLE = FPDF is not None
+
+# Bump when the sheet layout changes so cached files are rebuilt.
+SHEET_FORMAT = 2
+
+_REPO_ROOT = Path(__file__).resolve().parent.parent
+SHEET_CACHE_DIR = Path((os.environ.get("PROXYFORGE_SHEET_CACHE_DIR") or "").strip() or _REPO_ROOT / "data" / "cache" / "gameday_sheets")
+
+_ENTRY_FIELDS = ("entry_id", "datasheet_id", "Qty", "Total_Pts", "wargear_list", "attached_to_entry_id")
+
+_CSS = """
+body { font-family: Arial, Helvetica, sans-serif; font-size: 10pt; color: #111; margin: 1.2cm; }
+h1 { font-size: 16pt; margin: 0 0 4px; }
+h2 { font-size: 12pt; margin: 14px 0 4px; border-bottom: 1px solid #999; }
+h3 { font-size: 11pt; margin: 8px 0 2px; }
+.meta, .muted { color: #555; }
+.card { border: 1px solid #bbb; border-radius: 4px; padding: 6px 8px; margin: 8px 0; page-break-inside: avoid; }
+.card img { float: right; max-width: 110px; max-height: 110px; margin: 0 0 4px 8px; }
+table { border-collapse: collapse; width: 100%; table-layout: fixed; margin: 4px 0; }
+th, td { border: 1px solid #ccc; padding: 2px 4px; font-size: 8.5pt; text-align: left; word-wrap: break-word; }
+th { background: #eee; }
+p { margin: 2px 0; }
+.clear { clear: both; }
+"""
+
+
+def _text(value):
+    return fix_apostrophe_mojibake(str(value)) if value is not None else ""
+
+
+def _e(value):
+    """HTML-escaped display text (mojibake fixed)."""
+    return html.escape(_text(value))
+
+
+def _multiline(text):
+    return "<br>".join(html.escape(ln) for ln in _text(text).split("\n") if ln.strip())
+
+
+def _unique(rows, cols):
+    """Rows deduped on the given columns, compared case-insensitively on column names (DB casing varies)."""
+    seen, out = set(), []
+    for r in rows or []:
+        low = {str(k).lower(): v for k, v in r.items()}
+        key = tuple(str(low.get(c)) for c in cols)
+        if key not in seen:
+            seen.add(key)
+            out.append(r)
+    return out
+
+
+def _table(rows, cols, headers):
+    if not rows:
+        return ""
+    head = "".join(f"<th>{html.escape(h)}</th>" for h in headers)
+    body = "".join(
+        "<tr>" + "".join(f"<td>{_e(r.get(c) if r.get(c) not in (None, '') else '—')}</td>" for c in cols) + "</tr>"
+        for r in rows
+    )
+    return f"<table><tr>{head}</tr>{body}</table>"
+
+
+def _entry_id(row):
+    try:
+        return int(row.get("entry_id", row.get("Entry_ID")))
+    except (TypeError, ValueError):
+        return None
+
+
+def _unit_html(row, label, data, image=True):
+    """Sections for one roster entry from the Game-Day prefetch (see w40k_datasheets.prefetch_gameday_data)."""
+    eid = _entry_id(row)
+    sid = data["sid_by_entry"].get(eid) or ""
+    parts = []
+    if image:
+        img, caption = gameday_unit_image(data, eid, sid)
+        if img:
+            parts.append(f'<img src="{html.escape(str(img), quote=True)}" alt="{_e(caption or label)}">')
+    parts.append(f"<h3>{_e(row.get('Qty', 1))}x {_e(label)} ({_e(row.get('Total_Pts', 0))} pts)</h3>")
+    if data["led_by"].get(eid):
+        parts.append(f"<p><b>Led by:</b> {_e(data['led_by'][eid])}</p>")
+    if data["leading"].get(eid):
+        parts.append(f"<p><b>Leading:</b> {_e(data['leading'][eid])}</p>")
+    if not sid:
+        parts.append('<p class="muted">Unit not linked to datasheet.</p>')
+        return "".join(parts)
+    try:
+        chosen = json.loads(row.get("wargear_list") or "[]")
+    except (TypeError, ValueError):
+        chosen = []
+    if isinstance(chosen, list) and chosen:
+        parts.append(f"<p><b>Chosen loadout:</b> {_e(', '.join(str(x) for x in chosen))}</p>")
+    enh = data["enhancement"].get(eid)
+    if enh:
+        parts.append(f"<p><b>Enhancement:</b> {_e(enh.get('name'))} (+{_e(enh.get('cost', 0))} pts) — "
+                     f"{_e(_strip_html(enh.get('description')))}</p>")
+    ds = data["datasheet"].get(sid) or {}
+    models = _unique(data["models"].get(sid), ("model", "m", "t", "sv", "w", "ld", "oc"))
+    parts.append(_table(models, ("Model", "M", "T", "Sv", "W", "Ld", "OC"), ("Model", "M", "T", "Sv", "W", "Ld", "OC")))
+    if ds.get("loadout"):
+        parts.append(f"<p><b>Default loadout:</b><br>{_multiline(_loadout_to_display(ds['loadout']))}</p>")
+    wargear = [
+        {**w, "description": _strip_html(w.get("description"))}
+        for w in _unique(data["wargear"].get(sid), ("name", "range_val", "attacks", "bs_ws", "ap", "damage"))
+    ]
+    parts.append(_table(wargear, ("name", "range_val", "attacks", "bs_ws", "ap", "damage", "description"),
+                        ("Weapon", "Range", "A", "BS/WS", "AP", "D", "Special")))
+    comp = _unique(data["composition"].get(sid), ("description", "base_size", "base_size_descr"))
+    if comp:
+        items = []
+        for c in comp:
+            base = (c.get("base_size") or c.get("base_size_descr") or "").strip()
+            items.append(_e(_strip_html(c.get("description"))) + (f" — {_e(_strip_html(base))}" if base else ""))
+        parts.append("<p><b>Composition:</b> " + "; ".join(items) + "</p>")
+    for ab in _unique(data["abilities"].get(sid), ("ab_name", "ab_desc", "type")):
+        name = _e(_strip_html(ab.get("ab_name")))
+        desc = _multiline(_strip_option_html(ab.get("ab_desc")))
+        prefix = "FACTION: " if (ab.get("type") or "").strip().lower() == "faction" else ""
+        parts.append(f"<p><b>{prefix}{name}</b>" + (f": {desc}" if desc else "") + "</p>")
+    led, lead = data["leader_names"].get(sid), data["can_lead_names"].get(sid)
+    if led:
+        parts.append(f"<p><b>Led by (options):</b> {_e(', '.join(led))}</p>")
+    if lead:
+        parts.append(f"<p><b>Can lead:</b> {_e(', '.join(lead))}</p>")
+    if ds.get("transport"):
+        parts.append(f"<p><b>Transport:</b> {_e(_strip_html(ds['transport']))}</p>")
+    return "".join(parts)
+
+
+def build_sheet_html(active_list, total_pts, groups, labels, data, rules=None, stratagems=(), images=True):
+    """
+    Self-contained HTML tactical sheet. groups: [(leader_row or None, row)] as built for the
+    Game-Day view; labels: {entry_id: 'Boyz A'}; data: prefetch_gameday_data() with "images" from
+    gameday_images(); rules: the view_40k_army_rules row (or None); stratagems: merged detachment +
+    Core rows.
+    """
+    title = f"Tactical Briefing: {_text(active_list.get('list_name'))}"
+    out = [
+        "<!DOCTYPE html><html><head><meta charset=\"utf-8\">",
+        f"<title>{html.escape(title)}</title><style>{_CSS}</style></head><body>",
+        f"<h1>{html.escape(title)}</h1>",
+        f"<p class=\"meta\">{_e(active_list.get('faction_primary'))} | {_e(total_pts)} / {_e(active_list.get('point_limit'))} pts</p>",
+    ]
+    if rules:
+        out.append("<h2>Army &amp; Detachment Rules</h2>")
+        out.append(f"<h3>Army Rule: {_e(rules.get('army_rule_name'))}</h3><p>{_multiline(_strip_option_html(rules.get('army_rule_desc')))}</p>")
+        if rules.get("detachment_rule_name"):
+            out.append(f"<h3>Detachment Rule: {_e(rules.get('detachment_rule_name'))}</h3>"
+                       f"<p>{_multiline(_strip_option_html(rules.get('detachment_rule_desc')))}</p>")
+    out.append("<h2>Units</h2>")
+    for leader_row, row in groups:
+        cards = [leader_row, row] if leader_row is not None else [row]
+        out.append('<div class="card">')
+        for i, r in enumerate(cards):
+            if i:
+                out.append('<hr class="clear">')
+            label = labels.get(_entry_id(r)) or r.get("Unit") or "Unit"
+            out.append(_unit_html(r, label, data, image=images))
+        out.append('<div class="clear"></div></div>')
+    if stratagems:
+        out.append("<h2>Stratagems</h2>")
+        for s in stratagems:
+            out.append(f"<h3>{_e(s.get('name'))} ({_e(s.get('cp_cost', 0))}CP)</h3>")
+            out.append(f"<p class=\"muted\">{_e(s.get('type'))} - {_e(s.get('phase'))}</p>")
+            out.append(f"<p>{_multiline(_strip_option_html(s.get('description')))}</p>")
+    out.append("</body></html>")
+    return "".join(out)
+
+
+def build_sheet_pdf(active_list, total_pts, groups, labels, data, rules=None, stratagems=()):
+    """PDF bytes of the sheet (text only, core fonts), or None when fpdf2 is not installed."""
+    if FPDF is None:
+        return None
+    body = build_sheet_html(active_list, total_pts, groups, labels, data, rules, stratagems, images=False)
+    body = body[body.index("<body>") + len("<body>"):body.rindex("</body>")]
+    # Core PDF fonts are Latin-1 only
+    body = body.replace("–", "-").replace("—", "-").replace("•", "*")
+    body = body.encode("latin-1", "replace").decode("latin-1")
+    pdf = FPDF()
+    pdf.set_auto_page_break(auto=True, margin=12)
+    pdf.add_page()
+    pdf.set_font("Helvetica", size=9)
+    pdf.write_html(body)
+    return bytes(pdf.output())
+
+
+def fetch_selection_state(cursor, list_id):
+    """Sorted (kind, entry_id, id) rows for a list's enhancements and STL choices (part of sheet_key)."""
+    state = []
+    queries = (
+        ("enh", "SELECT enh.entry_id AS entry_id, enh.enhancement_id AS ref FROM play_armylist_enhancements enh "
+                "JOIN play_armylist_entries e ON e.entry_id = enh.entry_id WHERE e.list_id = %s"),
+        ("stl", "SELECT c.entry_id AS entry_id, c.mmf_id AS ref FROM play_armylist_stl_choices c "
+                "JOIN play_armylist_entries e ON e.entry_id = c.entry_id WHERE e.list_id = %s"),
+    )
+    for kind, sql in queries:
+        try:
+            cursor.execute(sql, (list_id,))
+            state.extend((kind, str(r["entry_id"]), str(r["ref"])) for r in cursor.fetchall())
+        except Exception:
+            pass  # Optional table missing on this DB
+    return sorted(state)
+
+
+def sheet_key(active_list, roster_rows, selection_state, images=None, data_versions=None):
+    """
+    Content hash of everything the sheet shows: list settings, entries, selections, card images
+    ({entry_id: (url, caption)}, data["images"]) and data versions (default: waha, mmf).
+    """
+    if data_versions is None:
+        data_versions = (get_data_version("waha"), get_data_version("mmf"))
+    payload = {
+        "format": SHEET_FORMAT,
+        "list": [str(active_list.get(k)) for k in ("list_id", "list_name", "faction_primary", "point_limit",
+                                                    "waha_detachment_id", "chapter_subfaction")],
+        "entries": [[str(r.get(k)) for k in _ENTRY_FIELDS] for r in roster_rows],
+        "selections": [list(s) for s in selection_state],
+        "images": sorted([str(eid), str(url), str(caption)] for eid, (url, caption) in (images or {}).items()),
+        "versions": [str(v) for v in data_versions],
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()[:24]
+
+
+def _sheet_path(list_id, key, ext):
+    return SHEET_CACHE_DIR / f"list{list_id}_{key}.{ext}"
+
+
+def cached_sheet(list_id, key, ext="html"):
+    """Bytes of a cached sheet for this key, or None."""
+    try:
+        return _sheet_path(list_id, key, ext).read_bytes()
+    except OSError:
+        return None
+
+
+def store_sheet(list_id, key, ext, content):
+    """Write a sheet to the cache and drop older sheets of the same list and type. Returns the bytes."""
+    content = content.encode("utf-8") if isinstance(content, str) else content
+    try:
+        SHEET_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        path = _sheet_path(list_id, key, ext)
+        tmp = path.with_suffix(path.suffix + ".tmp")
+        tmp.write_bytes(content)
+        os.replace(tmp, path)
+        for old in SHEET_CACHE_DIR.glob(f"list{list_id}_*.{ext}"):
+            if old != path:
+                old.unlink(missing_ok=True)
+    except OSError:
+        pass  # Read-only install: serve the freshly built sheet without caching it
+    return content
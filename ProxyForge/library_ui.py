@@ -3,6 +3,8 @@ import re
 import streamlit as st
 import pandas as pd
 from database_utils import get_db_connection
+from datasheet_ids import entry_int
+from unit_images import load_stl_choices
 
 
 def _parse_images_json(images_json):
@@ -299,14 +301,7 @@ def render_roster_stl_section(entry_id, unit_id, unit_name, game_system, army_la
     conn = get_db_connection()
     cursor = conn.cursor(dictionary=True)
     try:
-        cursor.execute("""
-            SELECT c.id, c.mmf_id, c.sort_order, l.name, l.preview_url
-            FROM play_armylist_stl_choices c
-            JOIN stl_library l ON c.mmf_id = l.mmf_id
-            WHERE c.entry_id = %s
-            ORDER BY c.sort_order, c.id
-        """, (entry_id,))
-        choices = cursor.fetchall()
+        choices = load_stl_choices(conn, [entry_id]).get(entry_int(entry_id), [])
     except Exception as e:
         choices = []
         if "doesn't exist" in str(e).lower():
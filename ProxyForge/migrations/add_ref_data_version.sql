@@ -0,0 +1,14 @@
+-- ref_data_version: one row per reference-data domain (waha, opr, mmf) with a counter the hydrators
+-- bump when they finish. The app's reference cache (ProxyForge/reference_cache.py) compares this stamp
+-- to decide whether its in-memory copy of waha_* / opr_* / stl_* data is still current.
+-- Run once. Safe to re-run (CREATE IF NOT EXISTS, INSERT IGNORE).
+
+CREATE TABLE IF NOT EXISTS ref_data_version (
+  domain VARCHAR(32) NOT NULL,
+  version BIGINT UNSIGNED NOT NULL DEFAULT 1,
+  source VARCHAR(100) NULL COMMENT 'Script that last bumped the version',
+  updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (domain)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
+
+INSERT IGNORE INTO ref_data_version (domain, version) VALUES ('waha', 1), ('opr', 1), ('mmf', 1);
@@ -0,0 +1,37 @@
+-- Canonical datasheet-id key columns for the 40K lookups (see ProxyForge/datasheet_ids.py).
+-- Wahapedia ids arrive both zero-padded ('000000001') and bare ('1'); every waha_* table that holds a
+-- datasheet id gets a STORED generated column TRIM(LEADING '0' FROM TRIM(id)) with an index, so the
+-- app looks a unit up with one indexed equality (`datasheet_key = %s`, key from datasheet_key() in
+-- Python) instead of `id = %s` followed by a CAST(id AS CHAR) = %s retry.
+-- Hydrators need no change (generated columns fill themselves on INSERT).
+-- Idempotent: safe to run multiple times (skips columns that already exist).
+
+DROP PROCEDURE IF EXISTS add_waha_key_column_if_missing;
+DELIMITER //
+CREATE PROCEDURE add_waha_key_column_if_missing(IN tbl VARCHAR(64), IN src VARCHAR(64), IN key_col VARCHAR(64))
+BEGIN
+  IF (SELECT COUNT(*) FROM INFORMATION_SCHEMA.COLUMNS
+      WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = tbl AND COLUMN_NAME = key_col) = 0 THEN
+    SET @ddl = CONCAT(
+      'ALTER TABLE `', tbl, '` ADD COLUMN `', key_col, '` VARCHAR(50) ',
+      'GENERATED ALWAYS AS (TRIM(LEADING ''0'' FROM TRIM(`', src, '`))) STORED, ',
+      'ADD INDEX `idx_', tbl, '_', key_col, '` (`', key_col, '`)'
+    );
+    PREPARE stmt FROM @ddl;
+    EXECUTE stmt;
+    DEALLOCATE PREPARE stmt;
+  END IF;
+END //
+DELIMITER ;
+
+CALL add_waha_key_column_if_missing('waha_datasheets', 'waha_datasheet_id', 'datasheet_key');
+CALL add_waha_key_column_if_missing('waha_datasheets_keywords', 'datasheet_id', 'datasheet_key');
+CALL add_waha_key_column_if_missing('waha_datasheets_models', 'datasheet_id', 'datasheet_key');
+CALL add_waha_key_column_if_missing('waha_datasheets_wargear', 'datasheet_id', 'datasheet_key');
+CALL add_waha_key_column_if_missing('waha_datasheets_options', 'datasheet_id', 'datasheet_key');
+CALL add_waha_key_column_if_missing('waha_datasheets_abilities', 'datasheet_id', 'datasheet_key');
+CALL add_waha_key_column_if_missing('waha_datasheet_unit_composition', 'datasheet_id', 'datasheet_key');
+CALL add_waha_key_column_if_missing('waha_datasheets_leader', 'leader_id', 'leader_key');
+CALL add_waha_key_column_if_missing('waha_datasheets_leader', 'attached_id', 'attached_key');
+
+DROP PROCEDURE add_waha_key_column_if_missing;
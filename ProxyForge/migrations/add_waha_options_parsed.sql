@@ -0,0 +1,22 @@
+-- Precompiled wargear option parses for the 40K builder (see ProxyForge/wargear_parser.py).
+-- parsed_json holds parse_wargear_option() output for the row's description; parser_version is the
+-- PARSER_VERSION that produced it (the builder re-parses live when it does not match).
+-- Idempotent: safe to run multiple times (no-op if the columns already exist).
+-- After running, populate via: python scripts/wahapedia/hydrate_waha_full.py --tables datasheets_options_parse
+
+DROP PROCEDURE IF EXISTS add_waha_options_parsed_if_missing;
+DELIMITER //
+CREATE PROCEDURE add_waha_options_parsed_if_missing()
+BEGIN
+  IF (SELECT COUNT(*) FROM INFORMATION_SCHEMA.COLUMNS
+      WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'waha_datasheets_options' AND COLUMN_NAME = 'parsed_json') = 0 THEN
+    ALTER TABLE waha_datasheets_options ADD COLUMN parsed_json TEXT NULL COMMENT 'parse_wargear_option() output as JSON';
+  END IF;
+  IF (SELECT COUNT(*) FROM INFORMATION_SCHEMA.COLUMNS
+      WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'waha_datasheets_options' AND COLUMN_NAME = 'parser_version') = 0 THEN
+    ALTER TABLE waha_datasheets_options ADD COLUMN parser_version SMALLINT NULL COMMENT 'wargear_parser.PARSER_VERSION of parsed_json';
+  END IF;
+END //
+DELIMITER ;
+CALL add_waha_options_parsed_if_missing();
+DROP PROCEDURE add_waha_options_parsed_if_missing;
@@ -0,0 +1,62 @@
+"""
+In-memory substring index over unit names for the library pickers (no Streamlit/DB dependencies).
+
+NameIndex answers "name contains <query>" the way MySQL `name LIKE '%query%'` does under the
+app's utf8mb4_0900_ai_ci collation (case- and accent-insensitive), without scanning: every
+normalized name is indexed by its 1-, 2- and 3-character substrings, so a query of up to three
+characters is a single posting lookup and a longer one intersects its trigram postings before
+confirming the substring on the few remaining candidates.
+"""
+import unicodedata
+
+_GRAM = 3
+
+
+def normalize_name(text):
+    """Case- and accent-folded name with whitespace collapsed ('Ćhaos  Lord' -> 'chaos lord')."""
+    if text is None:
+        return ""
+    s = unicodedata.normalize("NFKD", str(text))
+    s = "".join(ch for ch in s if not unicodedata.combining(ch))
+    s = s.replace("’", "'").replace("‘", "'")
+    return " ".join(s.casefold().split())
+
+
+def _grams(s, n):
+    return {s[i:i + n] for i in range(len(s) - n + 1)}
+
+
+class NameIndex:
+    """Substring index over a fixed list of names. Results are positions into that list."""
+
+    __slots__ = ("names", "_postings")
+
+    def __init__(self, names):
+        self.names = tuple(normalize_name(n) for n in names)
+        postings = {}
+        for pos, name in enumerate(self.names):
+            for n in range(1, _GRAM + 1):
+                for g in _grams(name, n):
+                    postings.setdefault(g, []).append(pos)
+        # Positions were appended in ascending order; freeze as tuples to keep the index immutable.
+        self._postings = {g: tuple(p) for g, p in postings.items()}
+
+    def __len__(self):
+        return len(self.names)
+
+    def search(self, query):
+        """Positions (ascending) of names containing query; every position for an empty query."""
+        q = normalize_name(query)
+        if not q:
+            return list(range(len(self.names)))
+        if len(q) <= _GRAM:
+            return list(self._postings.get(q, ()))
+        lists = sorted((self._postings.get(g, ()) for g in _grams(q, _GRAM)), key=len)
+        if not lists[0]:
+            return []
+        candidates = set(lists[0])
+        for p in lists[1:]:
+            candidates.intersection_update(p)
+            if not candidates:
+                return []
+        return sorted(pos for pos in candidates if q in self.names[pos])
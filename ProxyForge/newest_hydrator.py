@@ -1,4 +1,3 @@
-import json
 import os
 from pathlib import Path
 
@@ -10,6 +9,9 @@ except ImportError:
 
 import mysql.connector
 
+from ref_data_version import bump_data_version
+from source_cache import load_json
+
 def _mysql_config():
     cfg = {
         "host": (os.environ.get("MYSQL_HOST") or "127.0.0.1").strip(),
@@ -33,10 +35,10 @@ DB_CONFIG = _mysql_config
 _REPO = Path(__file__).resolve().parent.parent
 JSON_PATH = os.environ.get("OPR_DATA_JSON") or str(_REPO / "data" / "opr" / "data.json")
 
+
 def dual_system_sync():
     try:
-        with open(JSON_PATH, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        data = load_json(JSON_PATH)
     except FileNotFoundError:
         print(f"JSON not found at {JSON_PATH}")
         return
@@ -88,6 +90,7 @@ def dual_system_sync():
             cursor.execute(sql, val)
             count += 1
 
+        bump_data_version(cursor, "opr", "newest_hydrator.py")
         conn.commit()
         print(f"DONE! Database now contains {count} entries.")
 
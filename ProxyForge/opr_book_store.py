@@ -0,0 +1,115 @@
+"""
+Compact, indexed store of the OPR army book data (data/opr/data.json) for army_book_ui.
+
+data.json is a flat list of thousands of unit entries, each carrying its upgrade sets inlined
+(Army Forge upgrade packages are shared by many units, so the same sections repeat over and over).
+build_book_store() turns it once into system -> army -> unit group -> units of slotted BookUnit
+records: every distinct upgrade section and upgrade-set list is stored once and referenced by all
+units that use it, repeated strings are interned, and the parsed JSON is dropped after the build.
+Picking a system or army is then a dict lookup instead of a rescan of the whole list.
+"""
+import sys
+
+from opr_library import _opr_generic_name_to_group
+from source_cache import load_json
+
+DEFAULT_SYSTEM = "grimdark-future"
+
+
+class BookUnit:
+    """One army book unit. upgrade_sets is a shared tuple of (section label, ((option label, cost), ...))."""
+
+    __slots__ = ("name", "cost", "quality", "defense", "wounds", "size", "generic_name", "round_base", "upgrade_sets")
+
+    def __init__(self, name, cost, quality, defense, wounds, size, generic_name, round_base, upgrade_sets):
+        self.name = name
+        self.cost = cost
+        self.quality = quality
+        self.defense = defense
+        self.wounds = wounds
+        self.size = size
+        self.generic_name = generic_name
+        self.round_base = round_base
+        self.upgrade_sets = upgrade_sets
+
+
+def _text(value):
+    return sys.intern(str(value)) if value is not None else None
+
+
+class BookStore:
+    """Army book units indexed by system, army and unit group; built by build_book_store()."""
+
+    __slots__ = ("_index", "_covers", "_counts", "shared_sections", "shared_upgrade_sets")
+
+    def __init__(self, entries):
+        sections, upgrade_sets = {}, {}
+        index, covers, counts = {}, {}, {}
+
+        def _section(sec):
+            options = tuple((_text(o.get("label") or ""), o.get("cost")) for o in sec.get("options") or ())
+            key = (_text(sec.get("label") or "Options"), options)
+            return sections.setdefault(key, key)
+
+        for e in entries:
+            if not isinstance(e, dict):
+                continue
+            system = _text(e.get("system") or DEFAULT_SYSTEM)
+            army = _text(e.get("army") or "Unknown")
+            unit = e.get("unit") or {}
+            generic = unit.get("genericName") or ""
+            group = _text(e.get("unitGroup") or _opr_generic_name_to_group(generic))
+            bases = unit.get("bases") or {}
+            sets = tuple(_section(s) for s in e.get("upgradeSets") or ())
+            sets = upgrade_sets.setdefault(sets, sets)
+            record = BookUnit(
+                e.get("name") or "Unnamed", e.get("cost") or 0, e.get("quality", "-"), e.get("defense", "-"),
+                e.get("wounds", 1), e.get("size", 1), _text(generic or "—"),
+                _text(bases.get("round") or bases.get("square") or "—"), sets,
+            )
+            index.setdefault(system, {}).setdefault(army, {}).setdefault(group, []).append(record)
+            counts[(system, army)] = counts.get((system, army), 0) + 1
+            if (system, army) not in covers:
+                product = unit.get("product") or {}
+                url = product.get("imageUrl") if isinstance(product, dict) else product
+                if url:
+                    covers[(system, army)] = url
+
+        # Units per group by cost then name (Army Forge order); freeze everything as tuples.
+        self._index = {
+            system: {
+                army: {group: tuple(sorted(units, key=lambda u: (u.cost, u.name))) for group, units in groups.items()}
+                for army, groups in sorted(armies.items())
+            }
+            for system, armies in index.items()
+        }
+        self._covers = covers
+        self._counts = counts
+        self.shared_sections = len(sections)
+        self.shared_upgrade_sets = len(upgrade_sets)
+
+    @property
+    def systems(self):
+        return tuple(self._index)
+
+    def armies(self, system):
+        """Army names of a system, sorted."""
+        return tuple(self._index.get(system, {}))
+
+    def groups(self, system, army):
+        """{unit group: (BookUnit, ...)} of one army."""
+        return self._index.get(system, {}).get(army, {})
+
+    def unit_count(self, system, army):
+        return self._counts.get((system, army), 0)
+
+    def cover_image(self, system, army):
+        """Army book cover URL (from the first unit that has one), or None."""
+        return self._covers.get((system, army))
+
+
+def build_book_store(path):
+    """BookStore from an OPR data.json file (a list of unit entries, see scripts/opr/fetch_opr_json.py),
+    parsed through source_cache."""
+    data = load_json(path)
+    return BookStore(data if isinstance(data, list) else [])
@@ -1,43 +1,22 @@
 import streamlit as st
 import pandas as pd
 from database_utils import get_db_connection
+from datasheet_ids import clean_id
 from library_ui import render_inline_link_unit, render_roster_stl_section
+from opr_library import AOF_SYSTEMS, search_opr_library
+from opr_roster import ROSTER_COLUMNS, get_roster_opr, prefetch_opr_gameday
+from opr_rules import load_rule_glossary
+from roster_fingerprint import roster_fingerprint, roster_memo
+from unit_images import resolve_unit_images
 
 #  ---- Stable Release 1.0 ----
 
-# Group order for OPR library (sort/group by type): Heroes, Core, Special, Support, Vehicles & Monsters, Other
-OPR_GROUP_ORDER = {"Heroes": 0, "Core": 1, "Special": 2, "Support": 3, "Vehicles & Monsters": 4, "Other": 5}
-
-
-def _opr_generic_name_to_group(generic_name):
-    """Map generic_name to display group (Heroes, Core, Special, Support, Vehicles & Monsters, Other)."""
-    if not generic_name or not isinstance(generic_name, str):
-        return "Other"
-    g = generic_name.strip().lower()
-    if "hero" in g:
-        return "Heroes"
-    if "titan" in g or ("great" in g and "monster" in g):
-        return "Vehicles & Monsters"
-    if any(x in g for x in ("monster", "vehicle", "tank", "walker", "gunship", "speeder", "chariot", "drop pod", "artillery beast", "brute giant")):
-        return "Vehicles & Monsters"
-    if "artillery" in g or "support " in g or "altar" in g:
-        return "Support"
-    non_core = ("elite", "heavy", "assault", "support", "veteran", "psychic", "flying", "shield", "brute")
-    if any(x in g for x in ("light infantry", "scouts", "fanatics", "swarms")) and not any(x in g for x in non_core):
-        return "Core"
-    if g == "infantry" or g == "bikers":
-        return "Core"
-    if ("infantry" in g or "bikers" in g) and not any(x in g for x in non_core):
-        return "Core"
-    return "Special"
-
-
-def show_opr_gameday_view(active_list, roster_df, total_pts):
+
+def show_opr_gameday_view(active_list, roster_df, total_pts, current_system=None, fingerprint=None):
     """Surgical tactical sheet for OPR match play: Shows active gear and struck-through replaced gear."""
     st.title(f"📑 OPR Tactical Briefing: {active_list['list_name']}")
     
     conn = get_db_connection()
-    cursor = conn.cursor(dictionary=True)
     
     c1, c2 = st.columns([0.7, 0.3])
     with c1:
@@ -55,18 +34,30 @@ def show_opr_gameday_view(active_list, roster_df, total_pts):
     def strike(text):
         return ''.join([u'\u0336' + char for char in str(text)])
 
+    # Upgrades, weapons, rules, sizes and spells for every card in one query per table, reused until
+    # the roster fingerprint changes; images are resolved live (default STL links change from the library)
+    def _prefetch():
+        records = roster_df.to_dict("records") if not roster_df.empty else []
+        return prefetch_opr_gameday(conn, records, active_list['faction_primary'], current_system)
+
+    data = roster_memo("gameday_opr", active_list['list_id'], fingerprint, _prefetch, current_system, domains=("opr",))
+    images = resolve_unit_images(conn, data["unit_by_entry"].items(), current_system)
+
     for _, row in roster_df.iterrows():
-        entry_id = row['entry_id']
-        unit_id = row['unit_id']
+        entry_id = int(row['entry_id'])
+        unit_id = clean_id(row['unit_id'])
 
         with st.container(border=True):
             # 1. HEADER: Tactical Stats
             h1, h2, h3, h4 = st.columns([0.4, 0.2, 0.2, 0.2])
             
             # Logic: [Models Per Unit] Name (Total Models)
-            models_per_unit = row.get('size', 1)
+            models_per_unit = data["size"].get(unit_id) or 1
             total_models = row['Qty'] * models_per_unit
             
+            img_url, img_caption = images.get(entry_id, (None, None))
+            if img_url:
+                h1.image(img_url, width=120, caption=img_caption)
             h1.markdown(f"### {row['Qty']}x {row['Unit']}")
             h1.caption(f"👥 **Squad Size:** {models_per_unit} | **Total Models:** {total_models}")
             
@@ -75,17 +66,13 @@ def show_opr_gameday_view(active_list, roster_df, total_pts):
             h4.metric("PTS", row['Total_Pts'])
 
 
-            # 2. DATA FETCH: Upgrades and Context
-            cursor.execute("SELECT option_label FROM play_armylist_opr_upgrades WHERE entry_id = %s", (entry_id,))
-            active_upgs = [r['option_label'] for r in cursor.fetchall()]
-
-            cursor.execute("SELECT section_label, option_label FROM opr_unit_upgrades WHERE unit_id = %s", (unit_id,))
-            upg_context = cursor.fetchall()
+            # 2. DATA: Upgrades and the sections they were picked from (prefetched)
+            active_upgs = data["upgrades"].get(entry_id, [])
+            upg_context = data["sections"].get(unit_id, {})
 
             # 3. WEAPONS: All Gear (Replaced gear gets Strikethrough)
             st.markdown("##### ⚔️ Arsenal")
-            cursor.execute("SELECT weapon_label, attacks, ap, special_rules, count FROM opr_unitweapons WHERE unit_id = %s", (unit_id,))
-            base_weapons = cursor.fetchall()
+            base_weapons = data["weapons"].get(unit_id, [])
             
             final_weapons = []
             
@@ -96,7 +83,7 @@ def show_opr_gameday_view(active_list, roster_df, total_pts):
                 
                 is_replaced = False
                 for upg in active_upgs:
-                    ctx = next((c['section_label'] for c in upg_context if c['option_label'] == upg), "").upper()
+                    ctx = (upg_context.get(upg) or "").upper()
                     if "REPLACE" in ctx and name_upper in ctx:
                         is_replaced = True
                         break
@@ -154,8 +141,7 @@ def show_opr_gameday_view(active_list, roster_df, total_pts):
             
             with col_r:
                 st.markdown("##### 📜 Rules")
-                cursor.execute("SELECT rule_name, rating FROM view_opr_unit_rules_detailed WHERE unit_id = %s", (unit_id,))
-                rules = cursor.fetchall()
+                rules = data["rules"].get(unit_id, [])
                 displayed_rules = set()
                 for r in rules:
                     name = f"{r['rule_name']} ({r['rating']})" if r['rating'] else r['rule_name']
@@ -164,13 +150,9 @@ def show_opr_gameday_view(active_list, roster_df, total_pts):
                         displayed_rules.add(name)
 
             with col_s:
-                is_caster = any("Caster" in str(r['rule_name']) for r in rules) or \
-                            any(key in str(u) for u in active_upgs for key in ["Archivist", "Psychic", "Caster"])
-                
-                if is_caster:
+                if entry_id in data["casters"]:
                     st.markdown("##### 🔮 Spells")
-                    cursor.execute("SELECT name, threshold FROM opr_spells WHERE faction = %s", (active_list['faction_primary'],))
-                    spells = cursor.fetchall()
+                    spells = data["spells"]
                     if spells:
                         for s in spells:
                             st.write(f"• **{s['name']}** ({s['threshold']}+)")
@@ -223,12 +205,7 @@ def show_opr_details(unit_id, entry_id=None, faction=None, game_system="grimdark
 
         
         # 2. FETCH DATA EARLY
-        cursor.execute("""
-            SELECT rule_name, rating, description 
-            FROM view_opr_unit_rules_detailed 
-            WHERE unit_id = %s
-        """, (unit_id,))
-        all_rules_data = cursor.fetchall()
+        all_rules_data = load_rule_glossary().unit_rules(unit_id, unit.get('faction'), unit.get('game_system'))
 
         active_upgrades = []
         if entry_id:
@@ -352,7 +329,7 @@ def show_opr_details(unit_id, entry_id=None, faction=None, game_system="grimdark
                     if display_name in displayed_rules: continue
                     
                     with st.expander(f"**{display_name}**", expanded=False):
-                        st.write(rule.get('description', '📚 Rule definition missing.'))
+                        st.write(rule.get('description') or '📚 Rule definition missing.')
                     displayed_rules.add(display_name)
         # --- TAB 2: UPGRADES ---
         with tabs[2]:
@@ -425,10 +402,16 @@ def run_opr_builder(active_list):
     active_id = active_list['list_id']
     
     # --- 1. DATA PREP ---
-    cursor.callproc('GetArmyRoster', (active_id,))
-    roster_df = pd.DataFrame()
-    for result in cursor.stored_results():
-        roster_df = pd.DataFrame(result.fetchall())
+    # Roster rows (same columns as GetArmyRoster) only reload when the roster fingerprint changed
+    def _load_roster():
+        return pd.DataFrame(get_roster_opr(conn, active_id), columns=ROSTER_COLUMNS)
+
+    fingerprint = None
+    try:
+        fingerprint = roster_fingerprint(cursor, active_id)
+    except Exception:
+        pass
+    roster_df = roster_memo("roster_opr", active_id, fingerprint, _load_roster, domains=("opr",)).copy()
     
     total_pts = 0
     if not roster_df.empty:
@@ -478,105 +461,20 @@ def run_opr_builder(active_list):
     # --- 3. MODE TOGGLE ---
     if 'opr_gameday' not in st.session_state: st.session_state.opr_gameday = False
     if st.session_state.opr_gameday:
-        show_opr_gameday_view(active_list, roster_df, total_pts)
+        show_opr_gameday_view(active_list, roster_df, total_pts, current_system, fingerprint)
         conn.close(); return 
 
     # --- 4. LIBRARY SIDEBAR (Surgical & Visible) ---
-    # Same logic for GDF and AoF: filter by faction + game_system (view_opr_master_picker.faction = opr_units.army, .game_system = opr_units.game_system)
+    # Same logic for GDF and AoF: faction + game_system family, from the in-memory picker index (opr_library)
     st.sidebar.header(f"OPR Library ({current_system})")
     primary_fac = active_list["faction_primary"].strip()
     search = st.sidebar.text_input("Search by unit name…", key=f"search_opr_{active_id}", placeholder="Search by unit name…")
     fallback_msg = None
-    aof_systems = ("age-of-fantasy", "age-of-fantasy-skirmish", "age-of-fantasy-regiments")
-    # For AoF modes, accept any AoF system slug (data may be stored as age-of-fantasy, -skirmish, or -regiments)
-    aof_slugs = ("age-of-fantasy", "age-of-fantasy-skirmish", "age-of-fantasy-regiments")
-
-    # 1. Main query: faction + game_system; for AoF accept any AoF slug so we find units regardless of stored slug
-    # For GF "* Prime Brothers" variants: also include base Prime Brothers units for full roster.
-    # For GF "* Brothers" (Battle Brothers variants, e.g. Blood Brothers, Wolf Brothers): also include Battle Brothers.
-    is_prime_variant = (
-        current_system not in aof_systems
-        and primary_fac != "Prime Brothers"
-        and primary_fac.endswith(" Prime Brothers")
-    )
-    is_battle_variant = (
-        current_system not in aof_systems
-        and primary_fac != "Battle Brothers"
-        and primary_fac.endswith(" Brothers")
-        and not primary_fac.endswith(" Prime Brothers")
-    )
-    if current_system in aof_systems:
-        lib_query = """
-            SELECT * FROM view_opr_master_picker
-            WHERE faction = %s AND game_system IN (%s, %s, %s)
-        """
-        params = [primary_fac, aof_slugs[0], aof_slugs[1], aof_slugs[2]]
-    elif is_prime_variant:
-        lib_query = """
-            SELECT * FROM view_opr_master_picker
-            WHERE (faction = %s OR faction = 'Prime Brothers') AND game_system = %s
-        """
-        params = [primary_fac, current_system]
-    elif is_battle_variant:
-        lib_query = """
-            SELECT * FROM view_opr_master_picker
-            WHERE (faction = %s OR faction = 'Battle Brothers') AND game_system = %s
-        """
-        params = [primary_fac, current_system]
-    else:
-        lib_query = """
-            SELECT * FROM view_opr_master_picker
-            WHERE faction = %s AND game_system = %s
-        """
-        params = [primary_fac, current_system]
-    if search:
-        lib_query += " AND name LIKE %s"
-        params.append(f"%{search}%")
-    lib_limit = 500
-    lib_query += f" ORDER BY name ASC LIMIT {lib_limit}"
-    cursor.execute(lib_query, tuple(params))
-    raw_results = cursor.fetchall()
-
-    if not raw_results:
-        fallback_query = "SELECT * FROM view_opr_master_picker WHERE faction = %s"
-        fallback_params = [primary_fac]
-        if search:
-            fallback_query += " AND name LIKE %s"
-            fallback_params.append(f"%{search}%")
-        fallback_query += f" ORDER BY name ASC LIMIT {lib_limit}"
-        cursor.execute(fallback_query, tuple(fallback_params))
-        raw_results = cursor.fetchall()
-        if raw_results:
-            fallback_msg = f"No units for **{primary_fac}** with mode **{mode_display.get(current_system, current_system)}** in DB; showing all **{primary_fac}** units (any mode)."
-
-    if not raw_results and current_system in aof_systems:
-        fallback2_query = "SELECT * FROM view_opr_master_picker WHERE game_system = %s"
-        fallback2_params = [current_system]
-        if search:
-            fallback2_query += " AND name LIKE %s"
-            fallback2_params.append(f"%{search}%")
-        fallback2_query += f" ORDER BY name ASC LIMIT {lib_limit}"
-        cursor.execute(fallback2_query, tuple(fallback2_params))
-        raw_results = cursor.fetchall()
-        if raw_results:
-            fallback_msg = f"No **{primary_fac}** units in database for this mode; showing sample **{mode_display.get(current_system, current_system)}** units from other armies."
-
-    # When showing variant + base army, prefer the variant's row per unit (so points/label match list)
-    if (is_prime_variant or is_battle_variant) and raw_results:
-        raw_results = sorted(raw_results, key=lambda u: (0 if (u.get("faction") or "") == primary_fac else 1, (u.get("name") or "").lower()))
-    # Dedupe by unit id
-    seen_id = set()
-    lib_results = []
-    for u in raw_results:
-        uid = str(u.get("id") or "").strip()
-        if uid and uid in seen_id:
-            continue
-        seen_id.add(uid)
-        lib_results.append(u)
-    for u in lib_results:
-        grp = _opr_generic_name_to_group(u.get("generic_name"))
-        u["_group"] = grp
-        u["_group_order"] = OPR_GROUP_ORDER.get(grp, 99)
+    lib_results, fallback = search_opr_library(primary_fac, current_system, search)
+    if fallback == "faction":
+        fallback_msg = f"No units for **{primary_fac}** with mode **{mode_display.get(current_system, current_system)}** in DB; showing all **{primary_fac}** units (any mode)."
+    elif fallback == "system":
+        fallback_msg = f"No **{primary_fac}** units in database for this mode; showing sample **{mode_display.get(current_system, current_system)}** units from other armies."
 
     sort_options = ["Name A–Z", "Name Z–A", "Points ↑", "Points ↓", "Role (Heroes first)"]
     sort_choice = st.sidebar.selectbox("Sort by", sort_options, key=f"opr_sort_{active_id}")
@@ -627,7 +525,7 @@ def run_opr_builder(active_list):
                     rows = cursor.fetchall()
                     sample_armies = [str(r.get("army", "")) for r in rows if r and r.get("army")]
                     st.markdown(f"Sample armies in DB: {', '.join(sample_armies)}.")
-                if current_system in aof_systems and sys_count == 0:
+                if current_system in AOF_SYSTEMS and sys_count == 0:
                     st.markdown("Run `python scripts/opr/newest_hydrator.py` from repo root (same .env as app) to sync OPR data.")
             except Exception as e:
                 st.markdown(f"**Diagnostic error:** {e}")
@@ -0,0 +1,133 @@
+"""
+OPR library picker served from memory (no Streamlit dependencies).
+
+view_opr_master_picker is read once per opr data version (the OPR hydrators bump it, see
+reference_cache). load_opr_picker_index() then builds one OprPickerIndex per (factions, systems)
+the sidebar asks for: the "* Prime Brothers" / "* Brothers" variant merged with its base army
+(variant rows win per unit id), every Age of Fantasy slug folded into one family, each unit's
+display group (Heroes, Core, ...) and a NameIndex over the names. search_opr_library() applies the
+sidebar's rules and fallbacks on top, so typing in the search box or paging never hits MySQL.
+"""
+from types import MappingProxyType
+
+from datasheet_ids import clean_id
+from name_index import NameIndex, normalize_name
+from reference_cache import fetch_all, reference_data
+
+# Group order for OPR library (sort/group by type): Heroes, Core, Special, Support, Vehicles & Monsters, Other
+OPR_GROUP_ORDER = {"Heroes": 0, "Core": 1, "Special": 2, "Support": 3, "Vehicles & Monsters": 4, "Other": 5}
+
+# Age of Fantasy system slugs; OPR data may store an AoF army under any of them.
+AOF_SYSTEMS = ("age-of-fantasy", "age-of-fantasy-skirmish", "age-of-fantasy-regiments")
+
+
+def _opr_generic_name_to_group(generic_name):
+    """Map generic_name to display group (Heroes, Core, Special, Support, Vehicles & Monsters, Other)."""
+    if not generic_name or not isinstance(generic_name, str):
+        return "Other"
+    g = generic_name.strip().lower()
+    if "hero" in g:
+        return "Heroes"
+    if "titan" in g or ("great" in g and "monster" in g):
+        return "Vehicles & Monsters"
+    if any(x in g for x in ("monster", "vehicle", "tank", "walker", "gunship", "speeder", "chariot", "drop pod", "artillery beast", "brute giant")):
+        return "Vehicles & Monsters"
+    if "artillery" in g or "support " in g or "altar" in g:
+        return "Support"
+    non_core = ("elite", "heavy", "assault", "support", "veteran", "psychic", "flying", "shield", "brute")
+    if any(x in g for x in ("light infantry", "scouts", "fanatics", "swarms")) and not any(x in g for x in non_core):
+        return "Core"
+    if g == "infantry" or g == "bikers":
+        return "Core"
+    if ("infantry" in g or "bikers" in g) and not any(x in g for x in non_core):
+        return "Core"
+    return "Special"
+
+
+def _fold(value):
+    """Faction/system as SQL `=` compares it under the app's case-insensitive collation."""
+    return str(value or "").strip().casefold()
+
+
+def library_factions(primary_faction, current_system):
+    """Armies shown for a list: the army itself, plus the base army of a GF Prime/Battle Brothers variant."""
+    primary = (primary_faction or "").strip()
+    if current_system in AOF_SYSTEMS:
+        return (primary,)
+    if primary != "Prime Brothers" and primary.endswith(" Prime Brothers"):
+        return (primary, "Prime Brothers")
+    if primary != "Battle Brothers" and primary.endswith(" Brothers"):
+        return (primary, "Battle Brothers")
+    return (primary,)
+
+
+def system_family(current_system):
+    """game_system values that count as the list's system (every AoF slug for AoF modes)."""
+    return AOF_SYSTEMS if current_system in AOF_SYSTEMS else (current_system,)
+
+
+@reference_data("opr", maxsize=1)
+def _picker_rows():
+    """All of view_opr_master_picker, ordered by name (one query per opr data version)."""
+    rows = fetch_all("SELECT * FROM view_opr_master_picker")
+    return tuple(sorted(rows, key=lambda r: normalize_name(r.get("name"))))
+
+
+class OprPickerIndex:
+    """Picker rows for some armies/systems (deduped by unit id, by name) plus a NameIndex over them."""
+
+    __slots__ = ("factions", "systems", "units", "names")
+
+    def __init__(self, factions, systems, rows):
+        self.factions = factions
+        self.systems = systems
+        preferred = _fold(factions[0]) if factions else ""
+        # Variant rows first so the list's own army wins the dedupe (points/label match the list).
+        ranked = sorted(rows, key=lambda r: 0 if _fold(r.get("faction")) == preferred else 1)
+        seen, units = set(), []
+        for r in ranked:
+            uid = clean_id(r.get("id"))
+            if uid and uid in seen:
+                continue
+            seen.add(uid)
+            group = _opr_generic_name_to_group(r.get("generic_name"))
+            units.append(MappingProxyType(dict(r, _group=group, _group_order=OPR_GROUP_ORDER.get(group, 99))))
+        units.sort(key=lambda u: normalize_name(u.get("name")))
+        self.units = tuple(units)
+        self.names = NameIndex(u.get("name") for u in self.units)
+
+    def search(self, query):
+        return self.names.search(query)
+
+
+@reference_data("opr", maxsize=32)
+def load_opr_picker_index(factions=None, systems=None):
+    """OprPickerIndex over the rows of these armies (None: any) in these game systems (None: any)."""
+    wanted_f = {_fold(f) for f in factions} if factions is not None else None
+    wanted_s = {_fold(s) for s in systems} if systems is not None else None
+    rows = [
+        r for r in _picker_rows()
+        if (wanted_f is None or _fold(r.get("faction")) in wanted_f)
+        and (wanted_s is None or _fold(r.get("game_system")) in wanted_s)
+    ]
+    return OprPickerIndex(factions, systems, rows)
+
+
+def search_opr_library(primary_faction, current_system, search="", limit=500):
+    """
+    (units, fallback) for the OPR library sidebar, units as fresh dicts with _group/_group_order.
+    Same rules as the SQL it replaces: the list's armies in its system family whose name contains
+    `search`; if none, the army in any system (fallback "faction"); for AoF modes, if still none,
+    any army in current_system (fallback "system"). At most `limit` units, by name.
+    """
+    primary = (primary_faction or "").strip()
+    attempts = [(library_factions(primary, current_system), system_family(current_system), None),
+                ((primary,), None, "faction")]
+    if current_system in AOF_SYSTEMS:
+        attempts.append((None, (current_system,), "system"))
+    for factions, systems, fallback in attempts:
+        index = load_opr_picker_index(factions, systems)
+        hits = index.search(search or "")
+        if hits:
+            return [dict(index.units[pos]) for pos in hits[:limit]], fallback
+    return [], None
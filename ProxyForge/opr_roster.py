@@ -0,0 +1,258 @@
+"""
+OPR roster data layer: the rows GetArmyRoster returns for an OPR list, from flat queries.
+
+GetArmyRoster LEFT JOINs both systems and, per entry row, evaluates the opr_army_settings subquery
+(inside the opr_units join), the upgrade SUM and the wargear JSON_ARRAYAGG. get_roster_opr() resolves
+the list header and its OPR system once, then runs three set-based queries (entries with their
+grouped wargear, the roster's opr_units rows, upgrade costs grouped per entry) and computes
+    Total_Pts = (base_cost + SUM(upgrade cost)) * quantity
+in Python with the procedure's NULL semantics: an entry whose unit is not found (wrong army or
+system), or without base_cost or quantity, gets None. Columns and column order match the procedure,
+so DataFrames built from either are interchangeable (see scripts/check_opr_roster_parity.py).
+
+prefetch_opr_gameday() loads what the OPR Game-Day cards show for a whole roster (selected upgrades
+and the sections they came from, weapons, squad size, spells) with one IN (...) query per table
+instead of five queries per unit; rules come from the in-memory glossary (opr_rules). Card images
+(unit_images.resolve_unit_images) are left to the caller, outside the roster memo, since default STL
+links change from the Digital Library without touching the roster.
+"""
+from datasheet_ids import clean_id, entry_int
+from opr_rules import load_rule_glossary
+
+# Column order of GetArmyRoster's result set; the 40K stat columns stay None for OPR lists.
+ROSTER_COLUMNS = ("entry_id", "unit_id", "Qty", "Unit", "Total_Pts", "M", "T", "SV", "W_Waha", "OC", "QUA", "DEF", "W_OPR", "wargear_list")
+
+# What GetArmyRoster matches o.game_system against when the army has no opr_army_settings row.
+DEFAULT_OPR_SYSTEM = "grimdark-future"
+
+# Whether opr_units has game_system (migrations/opr_units_pk_include_game_system.sql). None until checked.
+_has_game_system_col = None
+# MySQL ER_BAD_FIELD_ERROR ("Unknown column"): the only probe failure that means the column is missing.
+_ER_BAD_FIELD_ERROR = 1054
+
+_LIST_SQL = """
+    SELECT l.game_system, l.faction_primary,
+           (SELECT s.setting_name FROM opr_army_settings s WHERE s.army_name = l.faction_primary LIMIT 1) AS setting_name
+    FROM play_armylists l
+    WHERE l.list_id = %s
+"""
+
+_ENTRIES_SQL = """
+    SELECT e.entry_id, e.unit_id, e.quantity AS Qty, w.wargear_list
+    FROM play_armylist_entries e
+    LEFT JOIN (
+        SELECT ws.entry_id, JSON_ARRAYAGG(ws.option_text) AS wargear_list
+        FROM play_armylist_wargear_selections ws
+        JOIN play_armylist_entries we ON we.entry_id = ws.entry_id
+        WHERE we.list_id = %s
+        GROUP BY ws.entry_id
+    ) w ON w.entry_id = e.entry_id
+    WHERE e.list_id = %s
+    ORDER BY e.entry_id
+"""
+
+_UPGRADE_COSTS_SQL = """
+    SELECT sel.entry_id, SUM(up.cost) AS cost
+    FROM play_armylist_upgrades sel
+    JOIN opr_unit_upgrades up ON sel.upgrade_id = up.id
+    JOIN play_armylist_entries e ON e.entry_id = sel.entry_id
+    WHERE e.list_id = %s
+    GROUP BY sel.entry_id
+"""
+
+
+def _as_number(value):
+    """Whole-number totals as int (what the UI prints), anything else as float."""
+    value = float(value)
+    return int(value) if value.is_integer() else value
+
+
+def _placeholders(values):
+    return ", ".join(["%s"] * len(values))
+
+
+def opr_system_for(setting_name):
+    """opr_units.game_system a list's units are matched in (GetArmyRoster's COALESCE)."""
+    return setting_name if setting_name is not None else DEFAULT_OPR_SYSTEM
+
+
+def _fetch_units(cursor, unit_ids, army, system):
+    """{unit_id: opr_units row} for the roster's units of this army (and system, when the column exists)."""
+    global _has_game_system_col
+    if not unit_ids:
+        return {}
+    sql = f"""
+        SELECT opr_unit_id, name, base_cost, quality, defense, wounds
+        FROM opr_units
+        WHERE army = %s AND opr_unit_id IN ({_placeholders(unit_ids)}){{system}}
+    """
+    rows = None
+    if _has_game_system_col is not False:
+        try:
+            cursor.execute(sql.format(system=" AND game_system = %s"), [army, *unit_ids, system])
+            rows = cursor.fetchall()
+            _has_game_system_col = True
+        except Exception as e:
+            if _has_game_system_col or getattr(e, "errno", None) != _ER_BAD_FIELD_ERROR:
+                raise  # e.g. a dropped connection: leave the flag unset so the next call probes again
+            _has_game_system_col = False
+    if rows is None:
+        cursor.execute(sql.format(system=""), [army, *unit_ids])
+        rows = cursor.fetchall()
+    units = {}
+    for r in rows:
+        units.setdefault(clean_id(r["opr_unit_id"]), r)
+    return units
+
+
+def compute_opr_points(base_cost, upgrade_cost, quantity):
+    """(base_cost + upgrade_cost) * quantity, None when base_cost or quantity is NULL (as in SQL)."""
+    if base_cost is None or quantity is None:
+        return None
+    return _as_number((float(base_cost) + float(upgrade_cost or 0)) * float(quantity))
+
+
+def get_roster_opr(conn, list_id):
+    """
+    Roster rows of an OPR list as dicts with ROSTER_COLUMNS (same values as GetArmyRoster).
+    Lists of another game system return their entries with the unit columns left None.
+    """
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute(_LIST_SQL, (list_id,))
+        header = cursor.fetchone()
+        if not header:
+            return []
+        cursor.execute(_ENTRIES_SQL, (list_id, list_id))
+        entries = [dict(r) for r in cursor.fetchall()]
+        if not entries:
+            return []
+
+        units, upgrade_costs = {}, {}
+        if header.get("game_system") == "OPR":
+            unit_ids = sorted({clean_id(e["unit_id"]) for e in entries if e.get("unit_id") is not None})
+            units = _fetch_units(cursor, unit_ids, header.get("faction_primary"), opr_system_for(header.get("setting_name")))
+            cursor.execute(_UPGRADE_COSTS_SQL, (list_id,))
+            upgrade_costs = {int(r["entry_id"]): r["cost"] for r in cursor.fetchall()}
+    finally:
+        cursor.close()
+
+    rows = []
+    for e in entries:
+        unit = units.get(clean_id(e.get("unit_id"))) if e.get("unit_id") is not None else None
+        row = dict.fromkeys(ROSTER_COLUMNS)
+        row.update(entry_id=e["entry_id"], unit_id=e["unit_id"], Qty=e["Qty"], wargear_list=e.get("wargear_list"))
+        if unit:
+            row.update(
+                Unit=unit.get("name"),
+                Total_Pts=compute_opr_points(unit.get("base_cost"), upgrade_costs.get(int(e["entry_id"])), e["Qty"]),
+                QUA=unit.get("quality"),
+                DEF=unit.get("defense"),
+                W_OPR=unit.get("wounds"),
+            )
+        rows.append(row)
+    return rows
+
+
+def _group(rows, key):
+    out = {}
+    for r in rows:
+        out.setdefault(clean_id(r.pop(key)), []).append(r)
+    return out
+
+
+def is_caster(rules, upgrades):
+    """Whether a unit gets the spell list: a Caster rule, or an Archivist/Psychic/Caster upgrade."""
+    return any("Caster" in str(r.get("rule_name")) for r in rules) or \
+        any(key in str(u) for u in upgrades for key in ("Archivist", "Psychic", "Caster"))
+
+
+def prefetch_opr_gameday(conn, roster_rows, faction, current_system=None):
+    """
+    Load OPR Game-Day card data for every entry in the roster (get_roster_opr rows or DataFrame
+    records). Returns a dict:
+      unit_by_entry   {entry_id: unit_id}
+      upgrades        {entry_id: [selected option_label]}  (play_armylist_opr_upgrades)
+      sections        {unit_id: {option_label: section_label}}  (first section offering the option)
+      weapons         {unit_id: [rows (weapon_label, attacks, ap, special_rules, count)]}
+      rules           {unit_id: [rows (rule_name, rating, description)]} from opr_rules.load_rule_glossary
+      size            {unit_id: models per unit}  (opr_units of this army, in current_system if given)
+      casters         set of entry_ids that get the spell list
+      spells          [rows (name, threshold)] of the faction, only loaded when a caster is present
+    Every table is one query regardless of roster size (rules none). Missing tables/columns leave that key empty.
+    """
+    data = {
+        "unit_by_entry": {}, "upgrades": {}, "sections": {}, "weapons": {}, "rules": {},
+        "size": {}, "casters": set(), "spells": [],
+    }
+    for r in roster_rows or []:
+        eid = entry_int(r.get("entry_id"))
+        if eid is not None:
+            data["unit_by_entry"][eid] = clean_id(r.get("unit_id"))
+    eids = sorted(data["unit_by_entry"])
+    uids = sorted({u for u in data["unit_by_entry"].values() if u})
+    if not eids:
+        return data
+    cursor = conn.cursor(dictionary=True)
+
+    def _run(fn):
+        try:
+            fn()
+        except Exception:
+            pass  # Optional table/column missing on this DB: leave that part empty
+
+    def _upgrades():
+        cursor.execute(
+            f"SELECT entry_id, option_label FROM play_armylist_opr_upgrades WHERE entry_id IN ({_placeholders(eids)}) ORDER BY entry_id",
+            eids,
+        )
+        for r in cursor.fetchall():
+            data["upgrades"].setdefault(int(r["entry_id"]), []).append(r["option_label"])
+
+    def _sections():
+        # Only units with a selected upgrade need to know which section each option replaces.
+        wanted = sorted({data["unit_by_entry"][e] for e in data["upgrades"] if data["unit_by_entry"].get(e)})
+        if not wanted:
+            return
+        cursor.execute(
+            f"SELECT unit_id, section_label, option_label FROM opr_unit_upgrades WHERE unit_id IN ({_placeholders(wanted)}) ORDER BY unit_id, id",
+            wanted,
+        )
+        for uid, rows in _group(cursor.fetchall(), "unit_id").items():
+            sections = data["sections"].setdefault(uid, {})
+            for r in rows:
+                sections.setdefault(r["option_label"], r["section_label"])
+
+    def _weapons():
+        cursor.execute(
+            f"SELECT unit_id, weapon_label, attacks, ap, special_rules, count FROM opr_unitweapons WHERE unit_id IN ({_placeholders(uids)})",
+            uids,
+        )
+        data["weapons"] = _group(cursor.fetchall(), "unit_id")
+
+    def _rules():
+        glossary = load_rule_glossary()
+        data["rules"] = {uid: glossary.unit_rules(uid, faction, current_system) for uid in uids}
+
+    def _sizes():
+        sql = f"SELECT opr_unit_id, size FROM opr_units WHERE army = %s AND opr_unit_id IN ({_placeholders(uids)})"
+        params = [faction, *uids]
+        if current_system and _has_game_system_col is not False:
+            sql += " AND game_system = %s"
+            params.append(current_system)
+        cursor.execute(sql, params)
+        for r in cursor.fetchall():
+            data["size"].setdefault(clean_id(r["opr_unit_id"]), r["size"])
+
+    def _spells():
+        for eid, uid in data["unit_by_entry"].items():
+            if is_caster(data["rules"].get(uid, ()), data["upgrades"].get(eid, ())):
+                data["casters"].add(eid)
+        if data["casters"]:
+            cursor.execute("SELECT name, threshold FROM opr_spells WHERE faction = %s", (faction,))
+            data["spells"] = list(cursor.fetchall())
+
+    for fn in (_upgrades, _sections) + ((_weapons, _rules, _sizes) if uids else ()) + (_spells,):
+        _run(fn)
+    cursor.close()
+    return data
@@ -0,0 +1,145 @@
+"""
+OPR special-rule glossary compiled once per opr data version (no Streamlit dependencies).
+
+Units carry rules like "Tough(3)" or "Impact(6)"; OPR describes them once with an X for the rating
+("... roll X dice ..."). load_rule_glossary() reads opr_unitrules, opr_specialrules and the
+army-wide / special / aura rule texts of opr_army_detail ("**Name**: description" blocks, see
+scripts/opr/fetch_opr_json.py) into a RuleGlossary: rule templates keyed by normalized name (per
+army and global) and each unit's parsed (name, rating) list. describe() and unit_rules() are dict
+lookups plus the X -> rating substitution, replacing the per-unit view_opr_unit_rules_detailed
+joins. to_json() exports the templates as compact JSON for the army book reference page.
+"""
+import json
+import re
+
+from datasheet_ids import clean_id
+from name_index import normalize_name
+from reference_cache import fetch_all, reference_data
+
+GLOSSARY_FORMAT = 1
+
+# "Tough(3)", "Tough (3)", "Impact(X)", "Caster(+1)" -> name and rating text
+_LABEL_RE = re.compile(r"^\s*(.*?)\s*\(\s*([^()]*?)\s*\)\s*$")
+# "**Name**: description" blocks of the opr_army_detail rule texts
+_BLOCK_RE = re.compile(r"^\*\*(.+?)\*\*\s*:?\s*(.*)$", re.DOTALL)
+_RATING_RE = re.compile(r"\bX\b")
+
+_DETAIL_COLUMNS = ("army_wide_rules", "special_rules", "aura_rules")
+
+
+def parse_rule_label(label, rating=None):
+    """(name, rating) from a rule label: 'Tough(3)' -> ('Tough', 3). An explicit rating wins."""
+    name = str(label or "").strip()
+    m = _LABEL_RE.match(name)
+    if m and m.group(1):
+        name, parsed = m.group(1), m.group(2)
+        if rating is None and parsed and parsed.upper() != "X":
+            rating = int(parsed) if parsed.isdigit() else parsed
+    return name, rating
+
+
+def rule_key(name):
+    """Lookup key of a rule name ('Tough(X)' and 'tough' -> 'tough')."""
+    return normalize_name(parse_rule_label(name)[0])
+
+
+def render_description(template, rating=None):
+    """Rule text with the rating substituted for X (unchanged without a rating)."""
+    if not template or rating in (None, ""):
+        return template
+    return _RATING_RE.sub(str(rating), template)
+
+
+def parse_rule_text(text):
+    """{key: (name, description)} from '**Name**: description' blocks separated by blank lines."""
+    rules = {}
+    for block in re.split(r"\n\s*\n", str(text or "")):
+        m = _BLOCK_RE.match(block.strip())
+        if not m:
+            continue
+        name = parse_rule_label(m.group(1))[0]
+        desc = m.group(2).strip()
+        if name and desc:
+            rules.setdefault(normalize_name(name), (name, desc))
+    return rules
+
+
+class RuleGlossary:
+    """Rule templates (global and per army) plus each unit's parsed rules, all keyed for O(1) lookups."""
+
+    __slots__ = ("_global", "_army_system", "_army", "_unit_rules")
+
+    def __init__(self, special_rules, army_details, unit_rules):
+        self._global = {}
+        for r in special_rules:
+            name = parse_rule_label(r.get("name"))[0]
+            desc = (r.get("description") or "").strip()
+            if name and desc:
+                self._global.setdefault(normalize_name(name), (name, desc))
+        self._army_system, self._army = {}, {}
+        for r in army_details:
+            army, system = normalize_name(r.get("army_name")), normalize_name(r.get("game_system"))
+            parsed = {}
+            for col in _DETAIL_COLUMNS:
+                for key, value in parse_rule_text(r.get(col)).items():
+                    parsed.setdefault(key, value)
+            self._army_system[(army, system)] = parsed
+            merged = self._army.setdefault(army, {})
+            for key, value in parsed.items():
+                merged.setdefault(key, value)
+        self._unit_rules = {}
+        for r in unit_rules:
+            name, rating = parse_rule_label(r.get("label"), r.get("rating"))
+            if name:
+                self._unit_rules.setdefault(clean_id(r.get("unit_id")), []).append((name, rating))
+        self._unit_rules = {k: tuple(v) for k, v in self._unit_rules.items()}
+
+    def _scoped(self, army, system):
+        if army:
+            a = normalize_name(army)
+            return self._army_system.get((a, normalize_name(system))) or self._army.get(a) or {}
+        return {}
+
+    def template(self, name, army=None, system=None):
+        """(display name, description with X) for a rule name or label, army text first; None if unknown."""
+        key = rule_key(name)
+        return self._scoped(army, system).get(key) or self._global.get(key)
+
+    def describe(self, name, rating=None, army=None, system=None):
+        """Description of a rule ('Tough', 3 or 'Tough(3)') with the rating substituted; None if unknown."""
+        label_name, label_rating = parse_rule_label(name, rating)
+        found = self.template(label_name, army, system)
+        return render_description(found[1], label_rating) if found else None
+
+    def unit_rules(self, unit_id, army=None, system=None):
+        """[{rule_name, rating, description}] of a unit (the shape view_opr_unit_rules_detailed returned)."""
+        return [
+            {"rule_name": name, "rating": rating, "description": self.describe(name, rating, army, system)}
+            for name, rating in self._unit_rules.get(clean_id(unit_id), ())
+        ]
+
+    def to_json(self, army=None, system=None):
+        """Compact JSON {"format", "rules": {name: description with X}}; army rules override global ones."""
+        rules = {name: desc for name, desc in self._global.values()}
+        rules.update({name: desc for name, desc in self._scoped(army, system).values()})
+        payload = {"format": GLOSSARY_FORMAT, "rules": dict(sorted(rules.items(), key=lambda kv: kv[0].casefold()))}
+        if army:
+            payload["army"], payload["system"] = army, system
+        return json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+
+
+@reference_data("opr", maxsize=1)
+def load_rule_glossary():
+    """RuleGlossary from one scan each of opr_unitrules, opr_specialrules and opr_army_detail."""
+    unit_rules = fetch_all("SELECT unit_id, label, rating FROM opr_unitrules")
+    try:
+        special_rules = fetch_all("SELECT name, description FROM opr_specialrules")
+    except Exception:
+        special_rules = []
+    try:
+        army_details = fetch_all(
+            "SELECT army_name, game_system, army_wide_rules, special_rules, aura_rules FROM opr_army_detail"
+        )
+    except Exception:
+        army_details = []  # migrations/add_opr_army_detail.sql not run yet
+    return RuleGlossary(special_rules, army_details, unit_rules)
@@ -0,0 +1,314 @@
+"""
+Optional per-rerun SQL profiling. Gated by env PROXYFORGE_QUERY_PROFILE=1.
+When enabled, database_utils hands out instrumented cursors that record, for every statement run
+during the current Streamlit rerun: SQL fingerprint, parameter arity, rows returned, wall time and
+the ProxyForge call site. render_query_profile_panel() shows the slowest / most repeated statements
+in the sidebar and offers the raw records as JSONL for offline analysis.
+
+Only a full rerun calls begin_rerun() (app.py); an st.fragment rerun (roster rows, library picker)
+does not, and does not redraw the sidebar either. Queries run during fragment reruns are therefore
+tagged run="fragment" and kept apart from the full rerun's records; the next full rerun shows them
+as a separate "fragment reruns since the previous full rerun" total instead of mixing them in.
+"""
+import json
+import os
+import re
+import sys
+import threading
+import time
+
+ENABLED = (os.environ.get("PROXYFORGE_QUERY_PROFILE") or "").strip() in ("1", "true", "yes")
+
+# Keep one rerun from growing without bound (e.g. a runaway loop of lookups).
+_MAX_RECORDS = 5000
+_APP_DIR = os.path.dirname(os.path.abspath(__file__))
+_SKIP_FILES = {os.path.join(_APP_DIR, "query_profile.py"), os.path.join(_APP_DIR, "database_utils.py")}
+
+_fallback_records = []
+_fallback_lock = threading.Lock()
+
+_RE_STRING = re.compile(r"'(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.)*\"")
+_RE_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_RE_PLACEHOLDER = re.compile(r"%s|%\(\w+\)s")
+_RE_IN_LIST = re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)", re.IGNORECASE)
+_RE_SPACE = re.compile(r"\s+")
+
+
+def fingerprint(sql):
+    """Normalize a statement so the same query with different literals/params groups together."""
+    if isinstance(sql, (bytes, bytearray)):
+        sql = sql.decode("utf-8", "replace")
+    s = _RE_STRING.sub("?", str(sql or ""))
+    s = _RE_PLACEHOLDER.sub("?", s)
+    s = _RE_NUMBER.sub("?", s)
+    s = _RE_IN_LIST.sub("IN (?+)", s)
+    return _RE_SPACE.sub(" ", s).strip()
+
+
+def _call_site():
+    """First frame in ProxyForge code outside the profiler/connection layer, as 'file.py:line in func'."""
+    frame = sys._getframe(2)
+    while frame is not None:
+        fname = os.path.abspath(frame.f_code.co_filename)
+        if fname.startswith(_APP_DIR) and fname not in _SKIP_FILES:
+            return f"{os.path.basename(fname)}:{frame.f_lineno} in {frame.f_code.co_name}"
+        frame = frame.f_back
+    return "?"
+
+
+def _script_run_ctx():
+    try:
+        try:
+            from streamlit.runtime.scriptrunner import get_script_run_ctx
+        except ImportError:
+            from streamlit.runtime.scriptrunner_utils.script_run_context import get_script_run_ctx
+        return get_script_run_ctx()
+    except Exception:
+        return None
+
+
+def _fragment_ids(ctx):
+    """Fragment ids being rerun, or [] on a full rerun (or a Streamlit without fragment support)."""
+    try:
+        return list(getattr(ctx, "fragment_ids_this_run", None) or [])
+    except Exception:
+        return []
+
+
+def _records(ctx=None, fragment=False):
+    """Record list for the current Streamlit session (reset by begin_rerun); module-level outside Streamlit.
+    fragment=True returns the list for queries run during st.fragment reruns instead."""
+    try:
+        if ctx is None:
+            ctx = _script_run_ctx()
+        if ctx is not None:
+            import streamlit as st
+            key = "_query_profile_fragments" if fragment else "_query_profile"
+            if key not in st.session_state:
+                st.session_state[key] = []
+            return st.session_state[key]
+    except Exception:
+        pass
+    return _fallback_records
+
+
+def _record(kind, sql, params, rows, elapsed, error=None):
+    try:
+        ctx = _script_run_ctx()
+        fragment_ids = _fragment_ids(ctx) if ctx is not None else []
+        records = _records(ctx, fragment=bool(fragment_ids))
+        if len(records) >= _MAX_RECORDS:
+            return
+        if params is None:
+            arity = 0
+        elif isinstance(params, dict):
+            arity = len(params)
+        elif kind == "executemany":
+            params = list(params)
+            arity = len(params[0]) if params and hasattr(params[0], "__len__") else 0
+        else:
+            arity = len(params) if hasattr(params, "__len__") else 1
+        rec = {
+            "ts": round(time.time(), 3),
+            "kind": kind,
+            "fingerprint": fingerprint(sql)[:1000],
+            "params": arity,
+            "rows": rows,
+            "ms": round(elapsed * 1000.0, 3),
+            "site": _call_site(),
+            "run": "fragment" if fragment_ids else "full",
+        }
+        if fragment_ids:
+            rec["fragments"] = fragment_ids
+        if kind == "executemany":
+            rec["batch"] = len(params or [])
+        if error:
+            rec["error"] = str(error)[:300]
+        if records is _fallback_records:
+            with _fallback_lock:
+                records.append(rec)
+        else:
+            records.append(rec)
+    except Exception:
+        pass  # Profiling must never break a query
+
+
+class InstrumentedCursor:
+    """Wraps a mysql.connector cursor; times execute/executemany/callproc and records them."""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._cursor.close()
+        return False
+
+    def _rows(self):
+        try:
+            return self._cursor.rowcount
+        except Exception:
+            return -1
+
+    def _timed(self, kind, fn, sql, params, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            _record(kind, sql, params, -1, time.perf_counter() - start, error=e)
+            raise
+        _record(kind, sql, params, self._rows(), time.perf_counter() - start)
+        return result
+
+    def execute(self, operation, params=None, *args, **kwargs):
+        return self._timed("execute", self._cursor.execute, operation, params, operation, params, *args, **kwargs)
+
+    def executemany(self, operation, seq_params, *args, **kwargs):
+        seq_params = list(seq_params)
+        return self._timed("executemany", self._cursor.executemany, operation, seq_params, operation, seq_params, *args, **kwargs)
+
+    def callproc(self, procname, args=(), *rest, **kwargs):
+        return self._timed("callproc", self._cursor.callproc, f"CALL {procname}", args, procname, args, *rest, **kwargs)
+
+
+def wrap_cursor(cursor):
+    return InstrumentedCursor(cursor) if ENABLED else cursor
+
+
+class InstrumentedConnection:
+    """Wraps an unpooled mysql.connector connection (MYSQL_POOL_SIZE=0) so its cursors are recorded too."""
+
+    def __init__(self, conn):
+        object.__setattr__(self, "_conn", conn)
+
+    def __getattr__(self, name):
+        return getattr(object.__getattribute__(self, "_conn"), name)
+
+    def __setattr__(self, name, value):
+        setattr(object.__getattribute__(self, "_conn"), name, value)
+
+    def cursor(self, *args, **kwargs):
+        return InstrumentedCursor(object.__getattribute__(self, "_conn").cursor(*args, **kwargs))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+def wrap_connection(conn):
+    return InstrumentedConnection(conn) if ENABLED else conn
+
+
+def begin_rerun():
+    """Call once at the top of the script (full reruns only) so the panel shows only the current rerun.
+    Queries from fragment reruns since the previous full rerun are kept aside for fragment_records()."""
+    if not ENABLED:
+        return
+    try:
+        import streamlit as st
+        st.session_state["_query_profile"] = []
+        st.session_state["_query_profile_last_fragments"] = st.session_state.get("_query_profile_fragments") or []
+        st.session_state["_query_profile_fragments"] = []
+    except Exception:
+        with _fallback_lock:
+            del _fallback_records[:]
+
+
+def current_records():
+    return list(_records())
+
+
+def fragment_records():
+    """Records from st.fragment reruns between the previous full rerun and this one."""
+    try:
+        import streamlit as st
+        return list(st.session_state.get("_query_profile_last_fragments") or [])
+    except Exception:
+        return []
+
+
+def summarize(records, top_n=10):
+    """Aggregate records by fingerprint. Returns (slowest, most_repeated) lists of dicts."""
+    groups = {}
+    for r in records:
+        g = groups.setdefault(r["fingerprint"], {
+            "fingerprint": r["fingerprint"], "calls": 0, "total_ms": 0.0, "max_ms": 0.0, "rows": 0, "site": r["site"],
+        })
+        g["calls"] += 1
+        g["total_ms"] += r["ms"]
+        g["max_ms"] = max(g["max_ms"], r["ms"])
+        g["rows"] += max(r.get("rows") or 0, 0)
+    rows = list(groups.values())
+    for g in rows:
+        g["avg_ms"] = round(g["total_ms"] / g["calls"], 2)
+        g["total_ms"] = round(g["total_ms"], 2)
+    slowest = sorted(rows, key=lambda g: g["total_ms"], reverse=True)[:top_n]
+    repeated = sorted(rows, key=lambda g: (g["calls"], g["total_ms"]), reverse=True)[:top_n]
+    return slowest, repeated
+
+
+def to_jsonl(records):
+    return "\n".join(json.dumps(r, ensure_ascii=False) for r in records) + ("\n" if records else "")
+
+
+def render_query_profile_panel(page=None, top_n=10):
+    """Sidebar expander with per-rerun query stats. No-op unless PROXYFORGE_QUERY_PROFILE is set."""
+    if not ENABLED:
+        return
+    try:
+        import streamlit as st
+        import pandas as pd
+        records = current_records()
+        frag_records = fragment_records()
+        slowest, repeated = summarize(records, top_n=top_n)
+        total_ms = sum(r["ms"] for r in records)
+        cols = ["total_ms", "calls", "avg_ms", "max_ms", "rows", "site", "fingerprint"]
+        with st.sidebar.expander(f"🔎 Query profile ({len(records)} queries, {total_ms:.0f} ms)"):
+            if not records and not frag_records:
+                st.caption("No queries recorded this rerun.")
+                return
+            distinct = len(set(r["fingerprint"] for r in records))
+            st.caption(f"Page: {page or '—'} · {distinct} distinct statements (this full rerun only)")
+            if records:
+                st.markdown("**Slowest (total time)**")
+                st.dataframe(pd.DataFrame(slowest)[cols], hide_index=True)
+                st.markdown("**Most repeated**")
+                st.dataframe(pd.DataFrame(repeated)[cols], hide_index=True)
+            if frag_records:
+                frag_ms = sum(r["ms"] for r in frag_records)
+                st.markdown(
+                    f"**Fragment reruns since the previous full rerun** "
+                    f"({len(frag_records)} queries, {frag_ms:.0f} ms)"
+                )
+                frag_slowest, _ = summarize(frag_records, top_n=top_n)
+                st.dataframe(pd.DataFrame(frag_slowest)[cols], hide_index=True)
+            try:
+                from database_utils import get_pool_stats
+                for p in get_pool_stats():
+                    st.caption(
+                        f"Pool {p['host']}/{p['database']}: created {p['created']}, reused {p['reused']}, "
+                        f"idle {p['idle']}, out {p['checked_out']}, recycled {p['recycled']}"
+                    )
+            except Exception:
+                pass
+            slug = (page or "page").lower().replace(" ", "_")
+            st.download_button(
+                "Export JSONL",
+                data=to_jsonl(frag_records + records),
+                file_name=f"query_profile_{slug}_{int(time.time())}.jsonl",
+                mime="application/x-ndjson",
+                key="query_profile_export",
+            )
+    except Exception:
+        pass
@@ -0,0 +1,22 @@
+"""
+Writer side of ref_data_version (migrations/add_ref_data_version.sql), shared by the hydrators.
+
+bump_data_version() is called on the hydrator's cursor right before it commits, so running app
+instances see the new stamp (reference_cache.get_data_version) and reload their cached copy of that
+domain's reference data. No Streamlit or app imports: scripts/ add ProxyForge/ to sys.path and
+import it directly.
+"""
+import mysql.connector
+
+_BUMP_SQL = (
+    "INSERT INTO ref_data_version (domain, version, source) VALUES (%s, 1, %s) "
+    "ON DUPLICATE KEY UPDATE version = version + 1, source = VALUES(source)"
+)
+
+
+def bump_data_version(cursor, domain, source):
+    """Bump a domain's ("waha", "opr", "mmf") version; source names the script. No-op if the table is missing."""
+    try:
+        cursor.execute(_BUMP_SQL, (domain, source))
+    except mysql.connector.Error:
+        pass  # migrations/add_ref_data_version.sql not run yet
@@ -0,0 +1,230 @@
+"""
+Process-wide cache for reference data (waha_*, opr_*, stl_*) that only changes when a hydrator runs.
+
+Every cached value is stored with the data-version stamp of its domain ("waha", "opr", "mmf") from
+table ref_data_version (migrations/add_ref_data_version.sql). The hydrators bump that stamp when they
+finish; readers re-check it at most every PROXYFORGE_REF_STAMP_TTL seconds (default 15) with one
+tiny query, and rebuild a cached value only when its stamp changed. The cache lives at module level,
+so it is shared by all Streamlit sessions in the process (like st.cache_resource) and each cached
+function is LRU-bounded.
+
+Usage:
+    @reference_data("waha", maxsize=8)
+    def load_something(arg):
+        ...  # open its own connection via get_db_connection(); return an immutable-ish structure
+"""
+import functools
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from database_utils import get_db_connection
+
+DOMAINS = ("waha", "opr", "mmf")
+
+try:
+    _STAMP_TTL = float((os.environ.get("PROXYFORGE_REF_STAMP_TTL") or "15").strip())
+except ValueError:
+    _STAMP_TTL = 15.0
+# Without the ref_data_version table, fall back to expiring cached data on this interval (seconds).
+_NO_TABLE_BUCKET = 3600
+
+_stamps = {}
+_stamps_checked = 0.0
+_stamps_lock = threading.Lock()
+_registry = []
+
+
+def _read_stamps():
+    conn = get_db_connection()
+    try:
+        cur = conn.cursor(dictionary=True)
+        cur.execute("SELECT domain, version FROM ref_data_version")
+        rows = cur.fetchall()
+        cur.close()
+    finally:
+        conn.close()
+    return {str(r["domain"]): int(r["version"] or 0) for r in rows}
+
+
+def get_data_version(domain):
+    """Current data-version stamp for a domain. Served from memory for up to _STAMP_TTL seconds."""
+    global _stamps, _stamps_checked
+    now = time.monotonic()
+    with _stamps_lock:
+        if now - _stamps_checked < _STAMP_TTL and _stamps:
+            return _stamps.get(domain, 0)
+    try:
+        stamps = _read_stamps()
+    except Exception:
+        # Table missing (migration not run) or DB hiccup: time-bucket the cache instead.
+        stamps = {d: f"t{int(time.time() // _NO_TABLE_BUCKET)}" for d in DOMAINS}
+    with _stamps_lock:
+        _stamps = stamps
+        _stamps_checked = now
+        return _stamps.get(domain, 0)
+
+
+def refresh_data_versions():
+    """Force the next get_data_version() call to re-read the stamps (e.g. right after a hydrator run)."""
+    global _stamps_checked
+    with _stamps_lock:
+        _stamps_checked = 0.0
+
+
+class _LRU:
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, version):
+        entry = self.data.get(key)
+        if entry is None or entry[0] != version:
+            self.misses += 1
+            return False, None
+        self.data.move_to_end(key)
+        self.hits += 1
+        return True, entry[1]
+
+    def put(self, key, version, value):
+        self.data[key] = (version, value)
+        self.data.move_to_end(key)
+        while len(self.data) > self.maxsize:
+            self.data.popitem(last=False)
+
+
+def reference_data(domain, maxsize=32):
+    """Decorator: memoize fn(*args) process-wide, invalidated when the domain's data version changes."""
+    if domain not in DOMAINS:
+        raise ValueError(f"Unknown reference-data domain: {domain}")
+
+    def decorator(fn):
+        lru = _LRU(maxsize)
+        lock = threading.RLock()
+
+        @functools.wraps(fn)
+        def wrapper(*args):
+            version = get_data_version(domain)
+            with lock:
+                found, value = lru.get(args, version)
+                if found:
+                    return value
+                # Build under the lock so concurrent sessions share one rebuild.
+                value = fn(*args)
+                lru.put(args, version, value)
+                return value
+
+        def cache_clear():
+            with lock:
+                lru.data.clear()
+
+        wrapper.cache_clear = cache_clear
+        _registry.append((f"{fn.__module__}.{fn.__qualname__}", domain, lru))
+        return wrapper
+
+    return decorator
+
+
+def cache_stats():
+    """One dict per cached function: name, domain, entries, hits, misses."""
+    return [
+        dict(name=name, domain=domain, entries=len(lru.data), hits=lru.hits, misses=lru.misses)
+        for name, domain, lru in _registry
+    ]
+
+
+def clear_all():
+    for _, _, lru in _registry:
+        lru.data.clear()
+    refresh_data_versions()
+
+
+def _id_key(value):
+    return str(value).strip() if value is not None else ""
+
+
+def fetch_all(sql, params=None):
+    """Run one query on a pooled connection and return all rows as dicts."""
+    conn = get_db_connection()
+    try:
+        cur = conn.cursor(dictionary=True)
+        cur.execute(sql, params or ())
+        rows = cur.fetchall()
+        cur.close()
+    finally:
+        conn.close()
+    return rows
+
+
+# waha_datasheets_* tables that hang off a datasheet, and how to order each datasheet's rows.
+WAHA_DATASHEET_TABLES = {
+    "waha_datasheets_keywords": "keyword",
+    "waha_datasheets_wargear": "line_id, line_in_wargear",
+    "waha_datasheets_abilities": "line_id",
+    "waha_datasheets_models": "line_id",
+    "waha_datasheets_options": "line_id",
+    "waha_datasheet_unit_composition": "line_id",
+}
+
+
+@reference_data("waha", maxsize=1)
+def load_waha_datasheets():
+    """waha_datasheets keyed by waha_datasheet_id (stripped string)."""
+    rows = fetch_all("SELECT * FROM waha_datasheets")
+    return {_id_key(r.get("waha_datasheet_id")): r for r in rows}
+
+
+@reference_data("waha", maxsize=1)
+def load_waha_faction_names():
+    """{faction id (casefolded, the views join on a case-insensitive collation): faction name}."""
+    rows = fetch_all("SELECT id, name FROM waha_factions")
+    return {_id_key(r.get("id")).casefold(): r.get("name") for r in rows}
+
+
+@reference_data("waha", maxsize=len(WAHA_DATASHEET_TABLES))
+def load_waha_rows(table):
+    """All rows of one waha_datasheets_* table grouped by datasheet_id: {datasheet_id: [row, ...]}."""
+    if table not in WAHA_DATASHEET_TABLES:
+        raise ValueError(f"Not a cached waha table: {table}")
+    rows = fetch_all(f"SELECT * FROM {table} ORDER BY datasheet_id, {WAHA_DATASHEET_TABLES[table]}")
+    grouped = {}
+    for r in rows:
+        grouped.setdefault(_id_key(r.get("datasheet_id")), []).append(r)
+    return grouped
+
+
+@reference_data("waha", maxsize=1)
+def load_waha_leader_links():
+    """waha_datasheets_leader as a list of (leader_id, attached_id) string pairs."""
+    rows = fetch_all("SELECT leader_id, attached_id FROM waha_datasheets_leader")
+    return [(_id_key(r.get("leader_id")), _id_key(r.get("attached_id"))) for r in rows]
+
+
+@reference_data("waha", maxsize=1)
+def keywords_by_datasheet():
+    """{datasheet_id: 'Kw1, Kw2, ...'} in the same shape as the old GROUP_CONCAT keyword queries."""
+    return {
+        ds_id: ", ".join(str(r.get("keyword")) for r in rows if r.get("keyword"))
+        for ds_id, rows in load_waha_rows("waha_datasheets_keywords").items()
+    }
+
+
+@reference_data("waha", maxsize=1)
+def load_unit_sizes():
+    """{datasheet_id: (min_size, max_size)} from view_40k_unit_composition (sizes may be None)."""
+    rows = fetch_all("SELECT datasheet_id, min_size, max_size FROM view_40k_unit_composition")
+    sizes = {}
+    for r in rows:
+        # setdefault: first row wins, like the roster's `... WHERE datasheet_id = ... LIMIT 1`
+        sizes.setdefault(_id_key(r.get("datasheet_id")), (r.get("min_size"), r.get("max_size")))
+    return sizes
+
+
+@reference_data("opr", maxsize=1)
+def load_opr_units():
+    """opr_units keyed by (opr_unit_id, game_system); game_system is None on pre-multi-system schemas."""
+    rows = fetch_all("SELECT * FROM opr_units")
+    return {(_id_key(r.get("opr_unit_id")), r.get("game_system")): r for r in rows}
@@ -0,0 +1,110 @@
+"""
+Roster fingerprints: skip rebuilding roster-derived data on reruns that did not change the roster.
+
+roster_fingerprint() is one small query of scalar subqueries: the list header (name, limit,
+detachment, faction, chapter, OPR system setting), COUNT and SUM(CRC32(...)) over the list's
+entries, and SUM(CRC32(...)) over every child table a write path touches (wargear selections,
+enhancements, OPR upgrades, STL choices). Any INSERT/UPDATE/DELETE from any code path or from the
+hydrators changes it; no version column or write-path bookkeeping is needed. Optional tables and
+columns are probed once per process, like w40k_roster._has_attached_col.
+
+roster_memo(kind, list_id, fingerprint, build, *extra) memoizes build() process-wide per
+(kind, list_id, *extra) for as long as the fingerprint and the reference data version match, so an
+unchanged roster costs the fingerprint query and dict lookups.
+"""
+import threading
+
+from reference_cache import _LRU, get_data_version
+
+# Child tables of play_armylist_entries and the columns hashed per row (x = the child row).
+_CHILD_PARTS = (
+    ("wargear", "play_armylist_wargear_selections", "x.option_text, COALESCE(x.is_active, 1)"),
+    ("enhancements", "play_armylist_enhancements", "x.enhancement_id, x.cost"),
+    ("upgrades", "play_armylist_upgrades", "x.upgrade_id"),
+    ("opr_upgrades", "play_armylist_opr_upgrades", "x.option_label, x.cost"),
+    ("stl_choices", "play_armylist_stl_choices", "x.mmf_id, x.sort_order"),
+)
+# Optional columns/tables: probe SQL (LIMIT 0) -> expression used when present.
+_OPTIONAL = {
+    "attached": ("SELECT attached_to_entry_id FROM play_armylist_entries LIMIT 0", "COALESCE(e.attached_to_entry_id, '')"),
+    "chapter": ("SELECT chapter_subfaction FROM play_armylists LIMIT 0", "COALESCE(l.chapter_subfaction, '')"),
+    "opr_setting": (
+        "SELECT setting_name FROM opr_army_settings LIMIT 0",
+        "COALESCE((SELECT s.setting_name FROM opr_army_settings s WHERE s.army_name = l.faction_primary LIMIT 1), '')",
+    ),
+}
+
+# Which optional parts exist on this DB. None until a fingerprint probes them all successfully.
+_available = None
+# MySQL "Unknown column" / "Table doesn't exist": the only probe failures that mean a part is missing.
+_MISSING_ERRNOS = (1054, 1146)
+_memo = _LRU(64)
+_memo_lock = threading.Lock()
+
+
+def _probe(cursor):
+    global _available
+    if _available is None:
+        found = set()
+        probes = [(name, sql) for name, (sql, _) in _OPTIONAL.items()]
+        probes += [(name, f"SELECT {cols} FROM {table} x LIMIT 0") for name, table, cols in _CHILD_PARTS]
+        for name, sql in probes:
+            try:
+                cursor.execute(sql)
+                cursor.fetchall()
+                found.add(name)
+            except Exception as e:
+                if getattr(e, "errno", None) not in _MISSING_ERRNOS:
+                    raise  # e.g. a dropped connection: leave _available unset so the next call probes again
+        _available = found
+    return _available
+
+
+def _fingerprint_sql(available):
+    header = ["l.list_name", "l.point_limit", "COALESCE(l.waha_detachment_id, '')", "COALESCE(l.faction_primary, '')"]
+    header += [expr for name, (_, expr) in _OPTIONAL.items() if name != "attached" and name in available]
+    entry_cols = ["e.entry_id", "e.unit_id", "e.quantity"]
+    if "attached" in available:
+        entry_cols.append(_OPTIONAL["attached"][1])
+    parts = [
+        f"(SELECT CRC32(CONCAT_WS('|', {', '.join(header)})) FROM play_armylists l WHERE l.list_id = %s) AS header",
+        "(SELECT COUNT(*) FROM play_armylist_entries e WHERE e.list_id = %s) AS entry_count",
+        f"(SELECT COALESCE(SUM(CRC32(CONCAT_WS('|', {', '.join(entry_cols)}))), 0) "
+        "FROM play_armylist_entries e WHERE e.list_id = %s) AS entries",
+    ]
+    for name, table, cols in _CHILD_PARTS:
+        if name in available:
+            parts.append(
+                f"(SELECT COALESCE(SUM(CRC32(CONCAT_WS('|', x.entry_id, {cols}))), 0) FROM {table} x "
+                f"JOIN play_armylist_entries e ON e.entry_id = x.entry_id WHERE e.list_id = %s) AS {name}"
+            )
+    return "SELECT " + ",\n       ".join(parts), len(parts)
+
+
+def roster_fingerprint(cursor, list_id):
+    """Tuple that changes whenever the list header, its entries or any entry selection changes."""
+    sql, n_params = _fingerprint_sql(_probe(cursor))
+    cursor.execute(sql, (list_id,) * n_params)
+    row = cursor.fetchone() or {}
+    values = row.values() if isinstance(row, dict) else row
+    return tuple(int(v) if v is not None else None for v in values)
+
+
+def roster_memo(kind, list_id, fingerprint, build, *extra, domains=("waha",)):
+    """
+    build() memoized per (kind, list_id, *extra) while fingerprint and the data versions of
+    `domains` are unchanged. fingerprint None (e.g. the query failed) always calls build().
+    Callers must not mutate the returned value (copy it first).
+    """
+    if fingerprint is None:
+        return build()
+    key = (kind, list_id) + tuple(extra)
+    version = (fingerprint,) + tuple(get_data_version(d) for d in domains)
+    with _memo_lock:
+        found, value = _memo.get(key, version)
+    if found:
+        return value
+    value = build()
+    with _memo_lock:
+        _memo.put(key, version, value)
+    return value
@@ -0,0 +1,140 @@
+"""
+Binary cache of parsed source files (data/opr/*.json, data/wahapedia/*.csv) for fast cold starts.
+
+The UI (app.py army lists, army_book_ui) and the hydrators used to re-parse these text files on
+every start. load_json() / load_csv_rows() return the parsed content from a cache file named after
+the source's SHA-1 (plus SOURCE_CACHE_FORMAT), parsing and storing it only when the source changed.
+A manifest of (size, mtime_ns) -> hash per source skips re-hashing unchanged files.
+
+Everything is stored as pickle (protocol 5). Callers want lists of row dicts, and building those
+dominates the load either way: a memory-mapped Arrow IPC file copied out with to_pylist() was no
+faster than unpickling the same rows, so pickle is the fast path and pyarrow is not needed. Cache
+files live in PROXYFORGE_SOURCE_CACHE_DIR (default data/cache/sources); scripts/build_source_cache.py
+warms it.
+Any cache problem (read-only dir, corrupt file) falls back to parsing the source.
+"""
+import csv
+import hashlib
+import json
+import os
+import pickle
+import threading
+from pathlib import Path
+
+# Bump when a parser below changes what it returns, so old cache files are ignored.
+SOURCE_CACHE_FORMAT = 2
+
+_REPO_ROOT = Path(__file__).resolve().parent.parent
+SOURCE_CACHE_DIR = Path((os.environ.get("PROXYFORGE_SOURCE_CACHE_DIR") or "").strip() or _REPO_ROOT / "data" / "cache" / "sources")
+_MANIFEST = "manifest.json"
+
+_manifest = None
+_manifest_lock = threading.Lock()
+
+
+def _read_manifest():
+    global _manifest
+    if _manifest is None:
+        try:
+            _manifest = json.loads((SOURCE_CACHE_DIR / _MANIFEST).read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            _manifest = {}
+    return _manifest
+
+
+def _write_atomic(path, content):
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_bytes(content)
+    os.replace(tmp, path)
+
+
+def source_hash(path):
+    """SHA-1 of a source file; reused from the manifest while its size and mtime are unchanged."""
+    path = Path(path).resolve()
+    st = path.stat()
+    stamp = [st.st_size, st.st_mtime_ns]
+    with _manifest_lock:
+        manifest = _read_manifest()
+        known = manifest.get(str(path))
+        if known and known[:2] == stamp:
+            return known[2]
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    value = digest.hexdigest()
+    with _manifest_lock:
+        manifest = _read_manifest()
+        manifest[str(path)] = stamp + [value]
+        try:
+            SOURCE_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+            _write_atomic(SOURCE_CACHE_DIR / _MANIFEST, json.dumps(manifest).encode("utf-8"))
+        except OSError:
+            pass
+    return value
+
+
+def _cache_prefix(path, kind):
+    """Per-source prefix of its cache files (same-named files in different dirs do not collide)."""
+    path = Path(path).resolve()
+    return f"{path.stem}-{hashlib.sha1(str(path).encode('utf-8')).hexdigest()[:8]}-{kind}"
+
+
+def _cache_stem(path, kind):
+    return f"{_cache_prefix(path, kind)}-v{SOURCE_CACHE_FORMAT}-{source_hash(path)[:16]}"
+
+
+def _drop_older(path, kind, keep):
+    for old in SOURCE_CACHE_DIR.glob(f"{_cache_prefix(path, kind)}-v*"):
+        if old != keep and not old.name.endswith(".tmp"):
+            old.unlink(missing_ok=True)
+
+
+def _load(path, kind, parse):
+    """Cached parse(path), stored as pickle next to the manifest."""
+    try:
+        stem = _cache_stem(path, kind)
+    except OSError:
+        return parse(path)  # unreadable source: let the parser raise its usual error
+    pkl = SOURCE_CACHE_DIR / f"{stem}.pkl"
+    if pkl.exists():
+        try:
+            with open(pkl, "rb") as f:
+                return pickle.load(f)
+        except Exception:
+            pass
+
+    value = parse(path)
+    try:
+        SOURCE_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        _write_atomic(pkl, pickle.dumps(value, protocol=5))
+        _drop_older(path, kind, pkl)
+    except Exception:
+        pass  # Read-only install or unpicklable value: serve the parsed source without caching it
+    return value
+
+
+def _parse_json(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def load_json(path):
+    """json.load of a source file, served from the binary cache while the file is unchanged."""
+    return _load(path, "json", _parse_json)
+
+
+def read_csv_rows(path, delimiter=None, encoding="utf-8-sig", errors="replace"):
+    """Rows of a Wahapedia CSV as dicts: pipe or comma (detected from the first line), BOM stripped from keys."""
+    path = Path(path)
+    with open(path, "r", encoding=encoding, errors=errors) as f:
+        if delimiter is None:
+            delimiter = "|" if "|" in f.readline() else ","
+            f.seek(0)
+        reader = csv.DictReader(f, delimiter=delimiter)
+        return [{(k.lstrip("\ufeff") if isinstance(k, str) else k): v for k, v in row.items()} for row in reader]
+
+
+def load_csv_rows(path):
+    """read_csv_rows() of a source file, served from the binary cache while the file is unchanged."""
+    return _load(path, "csv", read_csv_rows)
@@ -0,0 +1,103 @@
+"""
+Roster unit images resolved for a whole roster at once (40K and OPR).
+
+Each card used to look its image up on its own: the entry's STL choice, then the unit's default
+STL link, then the datasheet image (with an id-format retry). resolve_unit_images() takes every
+(entry_id, unit_id) pair of a roster and answers all of them with two joined queries (STL choices
+for all entries, default links for all units); the Wahapedia image_url comes from the reference
+cache. load_stl_choices() is the shared choices query, also used by the roster STL section.
+"""
+from datasheet_ids import clean_id, entry_int
+from reference_cache import load_waha_datasheets
+
+
+def _placeholders(values):
+    return ", ".join(["%s"] * len(values))
+
+
+def load_stl_choices(conn, entry_ids):
+    """{entry_id: [choice rows (id, mmf_id, sort_order, name, preview_url)]} in sort_order, id order. Raises if the table is missing."""
+    eids = sorted({e for e in (entry_int(x) for x in entry_ids) if e is not None})
+    if not eids:
+        return {}
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute(f"""
+            SELECT c.entry_id, c.id, c.mmf_id, c.sort_order, l.name, l.preview_url
+            FROM play_armylist_stl_choices c
+            JOIN stl_library l ON c.mmf_id = l.mmf_id
+            WHERE c.entry_id IN ({_placeholders(eids)})
+            ORDER BY c.entry_id, c.sort_order, c.id
+        """, eids)
+        choices = {}
+        for r in cursor.fetchall():
+            choices.setdefault(int(r.pop("entry_id")), []).append(r)
+        return choices
+    finally:
+        cursor.close()
+
+
+def _default_links(conn, unit_ids, game_system):
+    """{unit_id: (preview_url, name)} of each unit's default STL link (first one with a preview)."""
+    if not unit_ids:
+        return {}
+    sql = f"""
+        SELECT ul.unit_id, l.preview_url, l.name
+        FROM stl_library l
+        JOIN stl_unit_links ul ON l.mmf_id = ul.mmf_id
+        WHERE ul.unit_id IN ({_placeholders(unit_ids)}) AND ul.is_default = 1
+    """
+    params = list(unit_ids)
+    if game_system:
+        sql += " AND ul.game_system = %s"
+        params.append(game_system)
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute(sql + " ORDER BY ul.unit_id, ul.id", params)
+        links = {}
+        for r in cursor.fetchall():
+            key = clean_id(r.get("unit_id"))
+            if key not in links and r.get("preview_url"):
+                links[key] = (r["preview_url"], r.get("name"))
+        return links
+    finally:
+        cursor.close()
+
+
+def resolve_unit_images(conn, pairs, game_system=None, datasheet_images=False):
+    """
+    {entry_id: (image_url, caption)} for (entry_id, unit_id) pairs: the entry's first STL choice,
+    else the unit's default STL link (filtered by game_system when given), else, with
+    datasheet_images=True (40K), waha_datasheets.image_url. Entries without any image are left out.
+    Missing optional tables only skip that source.
+    """
+    units_by_entry = {}
+    for eid, unit_id in pairs:
+        eid = entry_int(eid)
+        if eid is not None:
+            units_by_entry[eid] = clean_id(unit_id)
+    if not units_by_entry:
+        return {}
+    try:
+        choices = load_stl_choices(conn, units_by_entry)
+    except Exception:
+        choices = {}  # play_armylist_stl_choices not migrated yet
+    try:
+        defaults = _default_links(conn, sorted({u for u in units_by_entry.values() if u}), game_system)
+    except Exception:
+        defaults = {}
+    datasheets = load_waha_datasheets() if datasheet_images else {}
+
+    images = {}
+    for eid, unit_id in units_by_entry.items():
+        choice = next((c for c in choices.get(eid, ()) if c.get("preview_url")), None)
+        if choice:
+            images[eid] = (choice["preview_url"], (choice.get("name") or "").strip() or "Proxy")
+        elif unit_id in defaults:
+            url, name = defaults[unit_id]
+            images[eid] = (url, (name or "Proxy").strip() or "Proxy")
+        else:
+            img = ((datasheets.get(unit_id) or {}).get("image_url") or "").strip()
+            if img:
+                images[eid] = (img, "Datasheet")
+    return images
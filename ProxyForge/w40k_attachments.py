@@ -0,0 +1,111 @@
+"""
+40K leader/bodyguard attachments answered from memory.
+
+load_attachment_graph() scans waha_datasheets_leader once (via reference_cache, so it is rebuilt when
+the waha data version changes) into an AttachmentGraph: leader -> units it can lead and unit -> its
+possible leaders, keyed by datasheet_key() so zero-padded and bare ids meet, plus unit names.
+"Can this lead / who can lead this / which roster units are valid bodyguards" are then set and dict
+lookups. pair_roster() resolves a whole roster at once: saved attachments (attached_to_entry_id),
+the Game-Day pairing order and each leader entry's valid bodyguard entries.
+"""
+from dataclasses import dataclass
+
+from datasheet_ids import datasheet_key, entry_int
+from reference_cache import load_waha_datasheets, load_waha_leader_links, reference_data
+
+_EMPTY = frozenset()
+
+
+class AttachmentGraph:
+    """Bidirectional leader <-> bodyguard graph over datasheet keys (see datasheet_ids.datasheet_key)."""
+
+    __slots__ = ("_bodyguards", "_leaders", "_names")
+
+    def __init__(self, links, names):
+        bodyguards, leaders = {}, {}
+        for leader_id, attached_id in links:
+            lk, ak = datasheet_key(leader_id), datasheet_key(attached_id)
+            if lk and ak:
+                bodyguards.setdefault(lk, set()).add(ak)
+                leaders.setdefault(ak, set()).add(lk)
+        self._bodyguards = {k: frozenset(v) for k, v in bodyguards.items()}
+        self._leaders = {k: frozenset(v) for k, v in leaders.items()}
+        self._names = {datasheet_key(k): n for k, n in names.items() if n}
+
+    def is_leader(self, datasheet_id):
+        return datasheet_key(datasheet_id) in self._bodyguards
+
+    def bodyguard_keys(self, leader_id):
+        """Keys of the units this leader can attach to."""
+        return self._bodyguards.get(datasheet_key(leader_id), _EMPTY)
+
+    def leader_keys(self, datasheet_id):
+        """Keys of the units that can lead this one."""
+        return self._leaders.get(datasheet_key(datasheet_id), _EMPTY)
+
+    def can_lead(self, leader_id, attached_id):
+        return datasheet_key(attached_id) in self.bodyguard_keys(leader_id)
+
+    def _sorted_names(self, keys):
+        return tuple(sorted({self._names[k].strip() for k in keys if self._names.get(k, "").strip()}))
+
+    def leader_names(self, datasheet_id):
+        """Names of the units that can lead this one, sorted and deduped (the dialog's "Led by")."""
+        return self._sorted_names(self.leader_keys(datasheet_id))
+
+    def can_lead_names(self, datasheet_id):
+        """Names of the units this one can lead, sorted and deduped."""
+        return self._sorted_names(self.bodyguard_keys(datasheet_id))
+
+
+@reference_data("waha", maxsize=1)
+def load_attachment_graph():
+    """AttachmentGraph from one scan of waha_datasheets_leader (names from waha_datasheets)."""
+    names = {k: (r.get("name") or "") for k, r in load_waha_datasheets().items()}
+    return AttachmentGraph(load_waha_leader_links(), names)
+
+
+@dataclass(frozen=True)
+class RosterPairing:
+    """Attachments of one roster, by entry id."""
+    led_by: dict            # bodyguard entry -> leader entry attached to it (first leader in roster order)
+    leading: dict           # leader entry -> bodyguard entry it is attached to (only if that entry exists)
+    groups: tuple           # (leader entry or None, entry): saved pairs first, then the rest, in roster order
+    bodyguards: dict        # leader entry -> entries in this roster it may attach to (roster order)
+
+
+def pair_roster(rows, graph=None):
+    """
+    Resolve leader/bodyguard attachments for a whole roster (list of dicts or DataFrame records with
+    entry_id, datasheet_id/unit_id, attached_to_entry_id) in one pass plus dict lookups. bodyguards
+    is filled only when an AttachmentGraph is passed (usually load_attachment_graph()).
+    """
+    entries = []
+    for r in rows:
+        eid = entry_int(r.get("entry_id", r.get("Entry_ID")))
+        if eid is None:
+            continue
+        key = datasheet_key(r.get("datasheet_id") or r.get("unit_id") or r.get("Unit_ID"))
+        entries.append((eid, key, entry_int(r.get("attached_to_entry_id"))))
+    present = {eid for eid, _, _ in entries}
+
+    led_by, leading = {}, {}
+    for eid, _, att in entries:
+        if att is not None and att in present:
+            leading[eid] = att
+            led_by.setdefault(att, eid)
+
+    used, pairs = set(), []
+    for eid, _, att in entries:
+        if eid in used or att is None or att not in present:
+            continue
+        pairs.append((eid, att))
+        used.update((eid, att))
+    groups = tuple(pairs) + tuple((None, eid) for eid, _, _ in entries if eid not in used)
+
+    bodyguards = {}
+    for eid, key, _ in entries:
+        allowed = graph.bodyguard_keys(key) if graph is not None else _EMPTY
+        if allowed:
+            bodyguards[eid] = [o_eid for o_eid, o_key, _ in entries if o_eid != eid and o_key in allowed]
+    return RosterPairing(led_by, leading, groups, bodyguards)
@@ -4,7 +4,27 @@ import re
 from database_utils import get_db_connection
 from library_ui import render_inline_link_unit, render_roster_stl_section
 from text_utils import fix_apostrophe_mojibake
-from w40k_roster import get_roster_40k, add_unit_40k, get_datasheet_id_for_entry, get_debug_query_results
+from reference_cache import load_unit_sizes, load_waha_datasheets
+from w40k_points import apply_roster_points, fetch_enhancement_costs
+from w40k_roster import (
+    get_roster_40k, add_unit_40k, get_datasheet_id_for_entry, get_debug_query_results,
+    encode_wargear_selections, save_wargear_selections,
+)
+from datasheet_ids import clean_id, entry_int
+from roster_fingerprint import roster_fingerprint, roster_memo
+from gameday_sheet import (
+    SHEET_PDF_AVAILABLE, build_sheet_html, build_sheet_pdf, cached_sheet, fetch_selection_state, sheet_key, store_sheet,
+)
+from w40k_attachments import load_attachment_graph, pair_roster
+from w40k_validation import CHAPTER_CUSTOM, fetch_enhancement_ids, validate_roster
+from w40k_datasheets import (
+    prefetch_gameday_data, gameday_images, gameday_unit_image, load_datasheet_bundle, search_picker_units,
+    load_detachments, load_chapter_keywords, unit_chapters, fetch_stratagems,
+)
+from wargear_parser import (
+    _strip_html, _loadout_to_display, _strip_option_html,
+    _compute_base_weapon_counts, _weapon_name_matches, _apply_wargear_to_counts,
+)
 
 # --- 1. HELPER FUNCTIONS ---
 
@@ -30,205 +50,21 @@ def _dedupe_by_key(items, key_fn):
     return out
 
 
-def _strip_html(text):
-    """Remove HTML tags and normalize whitespace for plain-text display."""
-    if not text:
-        return ""
-    s = str(text)
-    # Remove HTML tags
-    s = re.sub(r"<[^>]+>", "", s)
-    # Decode common entities
-    s = s.replace("&nbsp;", " ").replace("&amp;", "&").replace("&lt;", "<").replace("&gt;", ">").replace("&quot;", '"')
-    return " ".join(s.split())
-
-
-def _loadout_to_display(html_text):
-    """Convert loadout HTML to display text, preserving line breaks from <br> so each model line is separate."""
-    if not html_text:
-        return ""
-    s = str(html_text).strip()
-    for br in ("<br>", "<br/>", "<br />", "</br>"):
-        s = s.replace(br, "\n")
-    s = re.sub(r"<[^>]+>", "", s)
-    s = s.replace("&nbsp;", " ").replace("&amp;", "&").replace("&lt;", "<").replace("&gt;", ">").replace("&quot;", '"')
-    # If no <br> in source, split on period+space before "Every"/"The" so each model line is separate
-    if "\n" not in s and re.search(r"\.\s+(Every|The)\s+", s):
-        s = re.sub(r"\.\s+(Every\s+)", r".\n\1", s)
-        s = re.sub(r"\.\s+(The\s+)", r".\n\1", s)
-    lines = [" ".join(ln.split()) for ln in s.split("\n")]
-    return "\n".join(ln for ln in lines if ln)
-
-
-def _parse_loadout_to_model_weapons(loadout_text):
-    """
-    Parse default loadout text into list of (model_label, weapons_list).
-    e.g. 'The Boss Nob is equipped with: slugga; big choppa. Every Boy is equipped with: slugga; choppa.'
-    -> [('Boss Nob', ['slugga', 'big choppa']), ('Boy', ['slugga', 'choppa'])]
-    """
-    if not loadout_text or not str(loadout_text).strip():
-        return []
-    s = _loadout_to_display(loadout_text)
-    out = []
-    # Split into sentences (each model line)
-    for line in re.split(r"\n|\.\s+(?=Every|The|Each)", s):
-        line = line.strip().strip(".")
-        if not line:
-            continue
-        # "The Boss Nob is equipped with: slugga; big choppa" or "Every Boy is equipped with: slugga; choppa"
-        m = re.search(r"(?:The\s+)?(.+?)\s+is\s+equipped\s+with\s*:\s*(.+)", line, re.IGNORECASE)
-        if m:
-            model_label = m.group(1).strip()
-            weapons_str = m.group(2).strip()
-            weapons = [w.strip() for w in re.split(r"[;,]", weapons_str) if w.strip()]
-            if model_label and weapons:
-                out.append((model_label, weapons))
-    return out
-
-
-def _strip_option_html(text):
-    """Strip HTML from wargear option / description text: lists to bullets, remove tags, decode entities."""
-    if not text:
-        return ""
-    s = str(text).strip()
-    # Convert list items to newline + bullet so structure is preserved
-    s = re.sub(r"</li>\s*", "\n", s, flags=re.IGNORECASE)
-    s = re.sub(r"<li[^>]*>", "• ", s, flags=re.IGNORECASE)
-    for br in ("<br>", "<br/>", "<br />", "</br>"):
-        s = s.replace(br, "\n")
-    s = re.sub(r"<[^>]+>", "", s)
-    s = s.replace("&nbsp;", " ").replace("&amp;", "&").replace("&lt;", "<").replace("&gt;", ">").replace("&quot;", '"').replace("&#39;", "'").replace("&apos;", "'")
-    try:
-        import html
-        s = html.unescape(s)
-    except Exception:
-        pass
-    lines = [" ".join(ln.split()) for ln in s.split("\n")]
-    return fix_apostrophe_mojibake("\n".join(ln for ln in lines if ln))
-
-
-def _show_led_by_can_lead_transport(cursor, unit_id):
-    """Render Led By, Can Lead, and Transport for a unit (Rules tab or Game-Day card)."""
-    if unit_id is None:
-        return
-    uid = unit_id
-    uid_str = str(unit_id).strip()
-    # LED BY
-    try:
-        cursor.execute("""
-            SELECT d.name FROM waha_datasheets_leader l
-            JOIN waha_datasheets d ON d.waha_datasheet_id = l.leader_id
-            WHERE l.attached_id = %s ORDER BY d.name
-        """, (uid,))
-        led_by = cursor.fetchall()
-        if not led_by:
-            cursor.execute("""
-                SELECT d.name FROM waha_datasheets_leader l
-                JOIN waha_datasheets d ON d.waha_datasheet_id = l.leader_id
-                WHERE CAST(l.attached_id AS CHAR) = %s ORDER BY d.name
-            """, (uid_str,))
-            led_by = cursor.fetchall()
-        if led_by:
-            # Dedupe by name (DB may have duplicate leader rows)
-            seen_led = set()
-            led_names = []
-            for r in led_by:
-                n = (r.get("name") or r.get("Name") or "").strip()
-                if n and n not in seen_led:
-                    seen_led.add(n)
-                    led_names.append(n)
-            if led_names:
-                st.markdown("**LED BY**")
-                st.caption("This unit can be led by the following units:")
-                for n in led_names:
-                    st.write(f"• {n}")
-    except Exception:
-        pass
-    # CAN LEAD
-    try:
-        cursor.execute("""
-            SELECT d.name FROM waha_datasheets_leader l
-            JOIN waha_datasheets d ON d.waha_datasheet_id = l.attached_id
-            WHERE l.leader_id = %s ORDER BY d.name
-        """, (uid,))
-        can_lead = cursor.fetchall()
-        if not can_lead:
-            cursor.execute("""
-                SELECT d.name FROM waha_datasheets_leader l
-                JOIN waha_datasheets d ON d.waha_datasheet_id = l.attached_id
-                WHERE CAST(l.leader_id AS CHAR) = %s ORDER BY d.name
-            """, (uid_str,))
-            can_lead = cursor.fetchall()
-        if can_lead:
-            # Dedupe by name (DB may have duplicate rows)
-            seen_lead = set()
-            lead_names = []
-            for r in can_lead:
-                n = (r.get("name") or r.get("Name") or "").strip()
-                if n and n not in seen_lead:
-                    seen_lead.add(n)
-                    lead_names.append(n)
-            if lead_names:
-                st.markdown("**CAN LEAD**")
-                st.caption("This unit can lead the following units:")
-                for n in lead_names:
-                    st.write(f"• {n}")
-    except Exception:
-        pass
-    # Transport
-    try:
-        cursor.execute("SELECT transport FROM waha_datasheets WHERE waha_datasheet_id = %s", (uid,))
-        row = cursor.fetchone()
-        if not row and uid_str:
-            cursor.execute("SELECT transport FROM waha_datasheets WHERE CAST(waha_datasheet_id AS CHAR) = %s", (uid_str,))
-            row = cursor.fetchone()
-        if row and row.get("transport") and str(row.get("transport")).strip():
-            st.markdown("**TRANSPORT**")
-            st.write(_strip_html(row.get("transport") or ""))
-    except Exception:
-        pass
-
-
-def _valid_bodyguard_datasheet_ids(cursor, leader_datasheet_id):
-    """Return set of datasheet_id (str) that this leader can attach to (from waha_datasheets_leader)."""
-    if not leader_datasheet_id or not str(leader_datasheet_id).strip():
-        return set()
-    try:
-        cursor.execute(
-            "SELECT attached_id FROM waha_datasheets_leader WHERE leader_id = %s",
-            (leader_datasheet_id,),
-        )
-        rows = cursor.fetchall()
-        if not rows:
-            cursor.execute(
-                "SELECT attached_id FROM waha_datasheets_leader WHERE CAST(leader_id AS CHAR) = %s",
-                (str(leader_datasheet_id).strip(),),
-            )
-            rows = cursor.fetchall()
-        out = set()
-        for r in rows:
-            aid = r.get("attached_id")
-            if aid is not None and str(aid).strip():
-                s = str(aid).strip()
-                if s.endswith(".0") and s[:-2].isdigit():
-                    s = s[:-2]
-                out.add(s)
-        return out
-    except Exception:
-        return set()
-
-
-def _is_leader(cursor, datasheet_id):
-    """True if this unit can lead others (exists in waha_datasheets_leader as leader_id)."""
-    if not datasheet_id or not str(datasheet_id).strip():
-        return False
-    try:
-        cursor.execute("SELECT 1 FROM waha_datasheets_leader WHERE leader_id = %s LIMIT 1", (datasheet_id,))
-        if cursor.fetchone():
-            return True
-        cursor.execute("SELECT 1 FROM waha_datasheets_leader WHERE CAST(leader_id AS CHAR) = %s LIMIT 1", (str(datasheet_id).strip(),))
-        return cursor.fetchone() is not None
-    except Exception:
-        return False
+def _render_led_by_can_lead_transport(led_names, lead_names, transport):
+    """Render Led By, Can Lead, and Transport sections from already-loaded names/text."""
+    if led_names:
+        st.markdown("**LED BY**")
+        st.caption("This unit can be led by the following units:")
+        for n in led_names:
+            st.write(f"• {n}")
+    if lead_names:
+        st.markdown("**CAN LEAD**")
+        st.caption("This unit can lead the following units:")
+        for n in lead_names:
+            st.write(f"• {n}")
+    if transport and str(transport).strip():
+        st.markdown("**TRANSPORT**")
+        st.write(_strip_html(transport or ""))
 
 
 def _format_stratagem_description(desc):
@@ -280,105 +116,75 @@ def _dedupe_stratagems(strats):
     return out
 
 
-# Sentinel for "Custom (mix chapters)" so validation allows mixed chapter units
-CHAPTER_CUSTOM = "CUSTOM"
-
-
-def show_40k_validation(list_id, proxy_mode=False):
-    """Queries Keyword-Strict SQL View and displays alerts. Adds enhancement cap (max 3, all different) and warlord (at least one Character). When chapter is CUSTOM, allows mixed chapters (no chapter mismatch errors)."""
+def _validate_40k_list(list_id, proxy_mode=False, roster=None, faction_primary=None):
+    """ValidationReport for a list: reads its chapter and enhancement ids, reuses the roster rows if given."""
     conn = get_db_connection()
     cursor = conn.cursor(dictionary=True)
-    allow_custom_chapter = False
+    chapter = None
+    enhancement_ids = []
     try:
-        cursor.execute("SELECT chapter_subfaction FROM play_armylists WHERE list_id = %s", (list_id,))
-        row = cursor.fetchone()
-        if row and (row.get("chapter_subfaction") or "").strip() == CHAPTER_CUSTOM:
-            allow_custom_chapter = True
-    except Exception:
-        pass
-    allow_mixed_chapters = proxy_mode or allow_custom_chapter
+        try:
+            cursor.execute("SELECT faction_primary, chapter_subfaction FROM play_armylists WHERE list_id = %s", (list_id,))
+            row = cursor.fetchone()
+            if row:
+                chapter = row.get("chapter_subfaction")
+                faction_primary = row.get("faction_primary") or faction_primary
+        except Exception:
+            pass
+        try:
+            enhancement_ids = fetch_enhancement_ids(cursor, list_id)
+        except Exception:
+            pass
+        if roster is None:
+            roster = get_roster_40k(conn, list_id)
+        return validate_roster(roster, faction_primary, chapter, enhancement_ids, proxy_mode=proxy_mode, list_id=list_id)
+    finally:
+        cursor.close()
+        conn.close()
 
-    query = "SELECT unit_name, times_taken, max_allowed, faction_status FROM view_list_validation_40k WHERE list_id = %s"
-    df_val = pd.read_sql(query, conn, params=(list_id,))
 
-    # Enhancement cap: max 3 in list, all different
-    enh_over = False
-    enh_dupe = False
+def show_40k_validation(list_id, proxy_mode=False, roster=None, faction_primary=None, fingerprint=None):
+    """Runs the list validation engine (w40k_validation) and displays alerts: Rule of 3 / Epic Hero, chapter legality, enhancement cap (max 3, all different) and warlord (at least one Character). When chapter is CUSTOM, allows mixed chapters (no chapter mismatch errors). Pass the roster rows already loaded this rerun to avoid reloading them, and the roster fingerprint to reuse the last report while the list is unchanged."""
     try:
-        cursor.execute("""
-            SELECT COUNT(*) AS cnt, COUNT(DISTINCT e.enhancement_id) AS distinct_cnt
-            FROM play_armylist_enhancements e
-            JOIN play_armylist_entries ent ON e.entry_id = ent.entry_id
-            WHERE ent.list_id = %s
-        """, (list_id,))
-        row = cursor.fetchone()
-        if row:
-            cnt = int(row.get("cnt") or 0)
-            distinct_cnt = int(row.get("distinct_cnt") or 0)
-            if cnt > 3:
-                enh_over = True
-            if distinct_cnt < cnt:
-                enh_dupe = True
-    except Exception:
-        pass
+        report = roster_memo(
+            "validation_40k", list_id, fingerprint,
+            lambda: _validate_40k_list(list_id, proxy_mode, roster, faction_primary),
+            bool(proxy_mode), faction_primary,
+        )
+    except Exception as e:
+        st.sidebar.error(f"Could not validate list: {e}")
+        return
 
-    # Warlord: at least one Character in the list
-    has_character = False
-    try:
-        cursor.execute("""
-            SELECT 1 FROM play_armylist_entries e
-            JOIN waha_datasheets d ON e.unit_id = d.waha_datasheet_id
-            JOIN waha_datasheets_keywords k ON d.waha_datasheet_id = k.datasheet_id
-            WHERE e.list_id = %s AND LOWER(TRIM(COALESCE(k.keyword,''))) = 'character'
-            LIMIT 1
-        """, (list_id,))
-        if cursor.fetchone():
-            has_character = True
-    except Exception:
-        pass
+    if report.units.empty and not report.findings:
+        return
 
-    cursor.close()
-    conn.close()
+    st.sidebar.divider()
+    st.sidebar.subheader("⚖️ List Validation")
 
-    if not df_val.empty or enh_over or enh_dupe or not has_character:
-        violations = df_val[df_val['times_taken'] > df_val['max_allowed']] if not df_val.empty else pd.DataFrame()
-        mismatches = df_val[df_val['faction_status'] == 'INVALID'] if not df_val.empty else pd.DataFrame()
+    for f in report.by_rule("faction_bypass"):
+        st.sidebar.info(f"✨ {f.message}")
+    mismatches = report.by_rule("faction")
+    if mismatches:
+        st.sidebar.error("☢️ **Chapter Mismatch Found**")
+        for f in mismatches:
+            st.sidebar.warning(f.message)
 
-        st.sidebar.divider()
-        st.sidebar.subheader("⚖️ List Validation")
+    violations = report.by_rule("epic_hero", "rule_of_three")
+    if violations:
+        st.sidebar.error("🚨 **Rule Violations**")
+        for f in violations:
+            st.sidebar.warning(f"**{f.unit_name}**: {f.times_taken}/{f.max_allowed}")
 
-        if not mismatches.empty:
-            if allow_mixed_chapters:
-                if allow_custom_chapter and not proxy_mode:
-                    st.sidebar.info("✨ **Custom Chapter**: Mixed chapters allowed.")
-                else:
-                    st.sidebar.info("✨ **Proxy Mode Active**: Chapter/Legion restrictions bypassed.")
-            else:
-                st.sidebar.error("☢️ **Chapter Mismatch Found**")
-                for _, row in mismatches.iterrows():
-                    st.sidebar.warning(f"{row['unit_name']} (Native Chapter Mismatch)")
+    for f in report.by_rule("enhancement_count", "enhancement_unique"):
+        st.sidebar.error(f"🚨 **Enhancements**: {f.message}")
 
-        if not violations.empty:
-            st.sidebar.error("🚨 **Rule Violations**")
-            for _, row in violations.iterrows():
-                st.sidebar.warning(f"**{row['unit_name']}**: {int(row['times_taken'])}/{int(row['max_allowed'])}")
+    for f in report.by_rule("warlord"):
+        st.sidebar.warning(f"⚠️ **Warlord**: {f.message}")
 
-        if enh_over:
-            st.sidebar.error("🚨 **Enhancements**: Max 3 enhancements per army.")
-        if enh_dupe:
-            st.sidebar.error("🚨 **Enhancements**: Each enhancement can only be taken once.")
+    st.sidebar.caption("Wargear: slot/count limits are not validated.")
 
-        if not has_character:
-            st.sidebar.warning("⚠️ **Warlord**: List must include at least one Character.")
-
-        st.sidebar.caption("Wargear: slot/count limits are not validated.")
-
-        is_battle_ready = (
-            violations.empty and (mismatches.empty or allow_mixed_chapters)
-            and not enh_over and not enh_dupe and has_character
-        )
-        if is_battle_ready:
-            st.sidebar.success("🛡️ Army is Battle-Ready")
+    if report.is_battle_ready:
+        st.sidebar.success("🛡️ Army is Battle-Ready")
 
 
 def _build_40k_list_export_text(active_list, total_pts, roster_df):
@@ -438,319 +244,57 @@ def _build_40k_list_export_ros_xml(active_list, total_pts, roster_df):
     return '<?xml version="1.0" encoding="UTF-8"?>\n' + ET.tostring(roster, encoding="unicode", method="xml")
 
 
-def show_points_summary(active_list, current_points):
+def show_points_summary(active_list, current_points, target=None):
+    """Points progress in the sidebar, or in `target` (e.g. an st.empty() slot's container) so a fragment can redraw it."""
+    target = target if target is not None else st.sidebar
     limit = active_list['point_limit']
     percent = min(current_points / limit, 1.0) if limit > 0 else 0
-    st.sidebar.divider()
-    st.sidebar.subheader("📊 Points Summary")
-    st.sidebar.progress(percent, text=f"{current_points} / {limit} pts")
+    target.divider()
+    target.subheader("📊 Points Summary")
+    target.progress(percent, text=f"{current_points} / {limit} pts")
     if current_points > limit:
-        st.sidebar.error(f"⚠️ Over limit by {current_points - limit} pts!")
+        target.error(f"⚠️ Over limit by {current_points - limit} pts!")
     elif current_points == limit:
-        st.sidebar.balloons()
-        st.sidebar.success("🎯 Exactly on target!")
+        target.balloons()
+        target.success("🎯 Exactly on target!")
 
-def _split_and_list(s):
-    """Split '1 big shoota and 1 close combat weapon' or 'slugga and choppa' into list of items (strip leading 1/one)."""
-    if not s or not s.strip():
-        return []
-    s = s.strip().strip('.').strip(',')
-    # Split on ' and ' but not inside parentheticals
-    parts = re.split(r"\s+and\s+", s, flags=re.IGNORECASE)
-    out = []
-    for p in parts:
-        p = p.strip()
-        # Drop leading "1 " or "one " so we get weapon name only
-        p = re.sub(r"^(?:1|one)\s+", "", p, flags=re.IGNORECASE).strip()
-        if p and len(p) > 1:
-            out.append(p)
-    return out
 
+def _roster_state_key(list_id):
+    return f"w40k_roster_rows_{list_id}"
 
-def parse_wargear_option(text):
-    """
-    Parse wargear option text into structured rule for UI and weapon counts.
-    Returns: type in swap_1_1 | swap_multi | any_number | per_N_models | equipped_with | nested | simple,
-    plus who (model type), removed, added; for per_N_models: every_N, slots_per_N, options;
-    for equipped_with: added (list of one item), max (0..N).
-    """
-    if not text:
-        return {"type": "none"}
-    t = text.strip()
-    # Normalize curly/smart apostrophes so "Boss Nob's" matches regex
-    t = t.replace("\u2019", "'").replace("\u2018", "'")
-    t_lower = t.lower()
-
-    # --- "For every N models in this unit, 1 model equipped with X can be equipped with Y" (single or "one of the following")
-    per_equipped = re.search(
-        r"for\s+every\s+(\d+)\s+models\s+in\s+this\s+unit,?\s+1\s+model\s+equipped\s+with\s+(.+?)\s+can\s+be\s+equipped\s+with\s+(.+)",
-        t_lower,
-        re.IGNORECASE | re.DOTALL,
-    )
-    if per_equipped:
-        every_N = int(per_equipped.group(1))
-        removed_str = re.sub(r"^(?:a|an)\s+", "", per_equipped.group(2).strip().strip("."), flags=re.IGNORECASE).strip()
-        rest = per_equipped.group(3).strip().strip(".")
-        removed = _split_and_list(removed_str)
-        if "one of the following" in rest:
-            # Parse "one of the following: • 1 X • 1 Y"
-            rest = re.split(r"one of the following\s*:\s*", rest, flags=re.IGNORECASE)[-1].strip()
-            options_raw = re.split(r"\s+1\s+|\s+one\s+|\s*[•]\s*", rest)
-            option_displays = []
-            for o in options_raw:
-                o = o.strip().strip(',').strip('.').strip()
-                if len(o) > 2:
-                    option_displays.append(o)
-        else:
-            # Single option: "1 Astartes grenade launcher"
-            added_list = _split_and_list(rest)
-            option_displays = [rest.strip()] if rest else []
-            if added_list and not option_displays:
-                option_displays = [" ".join(added_list)]
-        if removed and option_displays:
-            return {
-                "type": "per_N_models",
-                "who": "model",
-                "every_N": every_N,
-                "slots_per_N": 1,
-                "removed": removed,
-                "options": option_displays,
-                "raw_options": option_displays,
-            }
 
-    # --- "For every N models in this unit, M ... can be replaced with one of the following: ..."
-    per_match = re.search(
-        r"for\s+every\s+(\d+)\s+models\s+in\s+this\s+unit,?\s+(?:1\s+)?(\w+)'s\s+(.+?)\s+can\s+be\s+replaced\s+with\s+one\s+of\s+the\s+following\s*:\s*(.+)",
-        t_lower,
-        re.IGNORECASE | re.DOTALL,
-    )
-    if per_match:
-        every_N = int(per_match.group(1))
-        who = per_match.group(2).strip()
-        removed_str = per_match.group(3).strip()
-        rest = per_match.group(4).strip()
-        removed = _split_and_list(removed_str)
-        # Parse options: "1 big shoota and 1 close combat weapon" / "1 rokkit launcha and 1 close combat weapon"
-        options_raw = re.split(r"\s+1\s+|\s+one\s+", rest)
-        fragments = []
-        for o in options_raw:
-            o = o.strip().strip(',').strip('.').replace("\n•", "").replace("•", "").strip()
-            if len(o) > 2:
-                fragments.append(o)
-        # Pair consecutive fragments: "big shoota and" + "close combat weapon" -> "big shoota and close combat weapon"
-        option_displays = []
-        if len(fragments) >= 2:
-            for i in range(0, len(fragments) - 1, 2):
-                option_displays.append(fragments[i] + " " + fragments[i + 1])
-        else:
-            option_displays = [re.sub(r"^(?:1|one)\s+", "", o, flags=re.IGNORECASE).strip() for o in fragments if o]
-        options_list = list(option_displays)
-        return {
-            "type": "per_N_models",
-            "who": who,
-            "every_N": every_N,
-            "slots_per_N": 1,
-            "removed": removed,
-            "options": option_displays,
-            "raw_options": options_list,
-        }
+def _session_roster(list_id):
+    """Roster rows (get_roster_40k dicts) stored by the last full run; fragments read and update these."""
+    return st.session_state.get(_roster_state_key(list_id)) or []
 
-    # --- "Any number of X can each have their Y and Z replaced with A and B"
-    any_match = re.search(
-        r"any\s+number\s+of\s+(.+?)\s+can\s+each\s+have\s+(?:their\s+)?(.+?)\s+replaced\s+with\s+(.+)",
-        t_lower,
-        re.IGNORECASE | re.DOTALL,
-    )
-    if any_match:
-        who = any_match.group(1).strip()
-        removed_str = any_match.group(2).strip()
-        added_str = any_match.group(3).strip()
-        removed = _split_and_list(removed_str)
-        added = _split_and_list(added_str)
-        return {"type": "any_number", "who": who, "removed": removed, "added": added}
-
-    # --- "The X's A and B can be replaced with 1 C and 1 D" (multi swap); accept straight or curly apostrophe
-    multi_swap = re.search(
-        r"(?:the\s+)?(.+?)['\u2019]s\s+(.+?)\s+can\s+be\s+replaced\s+with\s+(.+)",
-        t_lower,
-        re.IGNORECASE | re.DOTALL,
-    )
-    if multi_swap:
-        who = multi_swap.group(1).strip()
-        left = multi_swap.group(2).strip()
-        right = multi_swap.group(3).strip().strip('.')
-        # --- "The X's A can be replaced with one of the following: • 1 B • 1 C" → nested (radio to pick which)
-        if "one of the following" in right.lower():
-            removed = _split_and_list(left)
-            parts = re.split(r"one of the following\s*:\s*", right, flags=re.IGNORECASE)
-            rest = (parts[-1].strip() if len(parts) > 1 else "").replace("\n", " ")
-            options_list = []
-            for frag in re.split(r"\s*[•]\s*", rest):
-                frag = frag.strip().strip(',').strip('.').strip()
-                if len(frag) > 2:
-                    options_list.append(frag)
-            if removed and options_list:
-                return {"type": "nested", "target": removed[0] if len(removed) == 1 else left, "options": options_list}
-        if " and " in left and (" and " in right or re.search(r"1\s+\w+", right)):
-            removed = _split_and_list(left)
-            added = _split_and_list(right)
-            if len(removed) >= 1 and len(added) >= 1:
-                return {"type": "swap_multi", "who": who, "removed": removed, "added": added}
-        # --- "The X's A can be replaced with 1 B" (1:1 swap)
-        removed = _split_and_list(left)
-        added = _split_and_list(right)
-        if len(removed) == 1 and len(added) == 1:
-            return {"type": "swap_1_1", "who": who, "removed": removed[0], "added": added[0]}
-        if len(removed) >= 1 and len(added) >= 1:
-            return {"type": "swap_multi", "who": who, "removed": removed, "added": added}
-
-    # --- Fallback: "model's X can be replaced with Y" (1:1)
-    swap_match = re.search(
-        r"(?:model's|unit's|this\s+model's?)\s+(.*?)\s+can\s+be\s+replaced\s+with\s+(?:1\s+)?(.*)",
-        t,
-        re.IGNORECASE,
-    )
-    if swap_match:
-        target = swap_match.group(1).strip()
-        replacement = swap_match.group(2).strip().strip(".")
-        removed = _split_and_list(target)
-        added = _split_and_list(replacement)
-        if len(removed) == 1 and len(added) == 1:
-            return {"type": "swap_1_1", "who": "Model", "removed": removed[0], "added": added[0]}
-        if removed and added:
-            return {"type": "swap_multi", "who": "Model", "removed": removed, "added": added}
-
-    # --- "This model can be equipped with 1 X" / "with one X" / "with up to N X" (add optional wargear, no swap)
-    equipped = re.search(
-        r"this\s+model\s+can\s+be\s+equipped\s+with\s+(?:up\s+to\s+)?(?:1|one)\s+(.+?)(?:\.|$)",
-        t_lower,
-        re.IGNORECASE | re.DOTALL,
-    )
-    if equipped:
-        item = equipped.group(1).strip().strip(".").strip()
-        if len(item) > 1:
-            return {"type": "equipped_with", "added": [item], "max": 1}
-    equipped_n = re.search(
-        r"this\s+model\s+can\s+be\s+equipped\s+with\s+up\s+to\s+(\d+)\s+(.+?)(?:\.|$)",
-        t_lower,
-        re.IGNORECASE | re.DOTALL,
-    )
-    if equipped_n:
-        n = int(equipped_n.group(1))
-        item = equipped_n.group(2).strip().strip(".").strip()
-        if n >= 1 and len(item) > 1:
-            return {"type": "equipped_with", "added": [item], "max": min(n, 10)}
-
-    # Legacy: nested "one of the following" without "for every N models"
-    if "one of the following:" in t_lower:
-        parts = re.split(r"one of the following:", t, flags=re.IGNORECASE)
-        header = parts[0]
-        options_raw = re.split(r"\s1\s|\sone\s", parts[1])
-        options_list = []
-        for o in options_raw:
-            cleaned = o.strip().strip(',').strip('.').replace("\n•", "").replace("•", "").strip()
-            if len(cleaned) > 2:
-                options_list.append(cleaned)
-        target_match = re.search(r"(?:model's|unit's)\s+(.*?)\s+can be", header, re.IGNORECASE)
-        target = target_match.group(1).strip() if target_match else "Equipment"
-        return {"type": "nested", "target": target, "options": options_list}
-
-    return {"type": "simple", "text": text}
-
-
-def _compute_base_weapon_counts(loadout_text, quantity):
-    """
-    From default loadout text and unit quantity, return dict weapon_name -> count.
-    First model line = 1 model (e.g. Boss Nob), rest = quantity - 1 (e.g. Boyz).
-    If the only line (or a line) is "Every model" / "Each model" equipped with X, that line counts as quantity.
-    """
-    model_weapons = _parse_loadout_to_model_weapons(loadout_text)
-    if not model_weapons:
-        return {}
-    counts = {}
-    for i, (model_label, weapons) in enumerate(model_weapons):
-        label_lower = (model_label or "").strip().lower()
-        if label_lower.startswith("every model") or label_lower.startswith("each model") or label_lower == "every model" or label_lower == "each model":
-            n = max(0, quantity)
-        else:
-            n = 1 if i == 0 else max(0, quantity - 1)
-        if i == 0 and quantity == 0 and not (label_lower.startswith("every model") or label_lower.startswith("each model")):
-            n = 0
-        for w in weapons:
-            w = w.strip()
-            if w:
-                counts[w] = counts.get(w, 0) + n
-    return counts
-
-
-def _weapon_name_matches(a, b):
-    """True if weapon names match for count updates (normalize and compare)."""
-    def norm(x):
-        if not x:
-            return ""
-        return re.sub(r"\s+", " ", str(x).strip().lower())
-    return norm(a) == norm(b) or norm(b) in norm(a) or norm(a) in norm(b)
-
-
-def _apply_wargear_to_counts(base_counts, options_with_parsed, selections, quantity):
-    """
-    Apply wargear selections to base weapon counts. selections: list of same length as options_with_parsed;
-    each element is either an int (count for swap/any_number) or a list of choice strings (per slot for per_N_models).
-    Returns new dict weapon_name -> count (copy, not mutate base_counts).
-    """
-    counts = dict(base_counts)
-    for idx, (desc, parsed) in enumerate(options_with_parsed):
-        if idx >= len(selections):
-            continue
-        sel = selections[idx]
-        ptype = parsed.get("type")
-
-        def subtract(weapons, n):
-            for w in (weapons if isinstance(weapons, list) else [weapons]):
-                for k in list(counts.keys()):
-                    if _weapon_name_matches(k, w):
-                        counts[k] = max(0, (counts.get(k, 0) - n))
-                        break
-
-        def add(weapons, n):
-            for w in (weapons if isinstance(weapons, list) else [weapons]):
-                key = w.strip()
-                if key:
-                    # Try to match existing key for consistency
-                    for k in list(counts.keys()):
-                        if _weapon_name_matches(k, w):
-                            counts[k] = counts.get(k, 0) + n
-                            break
-                    else:
-                        counts[key] = counts.get(key, 0) + n
-
-        if ptype == "swap_1_1" and isinstance(sel, int) and sel > 0:
-            subtract([parsed["removed"]], sel)
-            add([parsed["added"]], sel)
-        elif ptype == "swap_multi" and isinstance(sel, int) and sel > 0:
-            subtract(parsed["removed"], sel)
-            add(parsed["added"], sel)
-        elif ptype == "any_number" and isinstance(sel, int) and sel > 0:
-            subtract(parsed["removed"], sel)
-            add(parsed["added"], sel)
-        elif ptype == "per_N_models" and isinstance(sel, list):
-            every_N = parsed.get("every_N") or 10
-            slots = (quantity // every_N) * (parsed.get("slots_per_N") or 1)
-            for choice in sel[:slots]:
-                if not choice:
-                    continue
-                # choice is full option string e.g. "big shoota and close combat weapon"
-                added_list = _split_and_list(choice)
-                subtract(parsed["removed"], 1)
-                add(added_list, 1)
-        elif ptype == "nested" and isinstance(sel, str) and sel and sel != "Default":
-            # Legacy nested: one choice for all slots
-            added_list = _split_and_list(sel)
-            subtract([parsed.get("target", "")], 1)
-            add(added_list, 1)
-        elif ptype == "equipped_with" and isinstance(sel, int) and sel > 0:
-            add(parsed.get("added", []), sel)
-    return counts
+
+def _roster_total(rows):
+    return int(pd.to_numeric(pd.Series([r.get("Total_Pts") for r in rows], dtype=object), errors="coerce").fillna(0).sum())
+
+
+def _draw_points(active_list, rows, slots):
+    """Redraw the sidebar points summary and the roster's Total Points metric in their st.empty() slots."""
+    total = _roster_total(rows)
+    show_points_summary(active_list, total, slots["summary"].container())
+    if slots.get("metric") is not None:
+        slots["metric"].metric("Total Points", f"{total} / {active_list['point_limit']}")
+
+
+def _set_entry_quantity(list_id, entry_id, quantity):
+    """Save one entry's model count and reprice only that row in the session roster (one UPDATE, one cost query)."""
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute("UPDATE play_armylist_entries SET quantity = %s WHERE entry_id = %s", (quantity, entry_id))
+        conn.commit()
+        enhancement_costs = fetch_enhancement_costs(cursor, list_id)
+        cursor.close()
+    finally:
+        conn.close()
+    for row in _session_roster(list_id):
+        if entry_int(row.get("entry_id")) == entry_int(entry_id):
+            row["Qty"] = quantity
+            apply_roster_points([row], enhancement_costs)
 
 
 @st.dialog("40K Unit Details", width="large")
@@ -764,47 +308,6 @@ def show_40k_details(unit_id, entry_id=None, detachment_id=None, faction=None, g
             st.code(traceback.format_exc())
 
 
-def _unit_role_from_keywords(keywords_str):
-    """Derive a role label and sort order from keywords (Character, Epic Hero, Battleline, etc.). Returns (order_int, label)."""
-    if not keywords_str:
-        return (99, "Other")
-    kw = (keywords_str if isinstance(keywords_str, str) else "").upper()
-    if "EPIC HERO" in kw:
-        return (0, "Epic Hero")
-    if "CHARACTER" in kw:
-        return (1, "Character")
-    if "BATTLELINE" in kw:
-        return (2, "Battleline")
-    if "MONSTER" in kw:
-        return (3, "Monster")
-    if "VEHICLE" in kw:
-        return (4, "Vehicle")
-    if "TRANSPORT" in kw:
-        return (5, "Transport")
-    if "INFANTRY" in kw:
-        return (6, "Infantry")
-    if "BEAST" in kw:
-        return (7, "Beast")
-    return (99, "Other")
-
-
-def _normalize_unit_id(unit_id):
-    """Return a string ID that matches DB (strip 12345.0 -> 12345 so wargear/models queries find rows)."""
-    if unit_id is None or (hasattr(unit_id, '__float__') and pd.isna(unit_id)):
-        return None
-    try:
-        if isinstance(unit_id, float) and unit_id == int(unit_id):
-            return str(int(unit_id))
-        if isinstance(unit_id, (int, float)):
-            return str(int(unit_id)) if unit_id == int(unit_id) else str(unit_id)
-    except (ValueError, TypeError):
-        pass
-    s = str(unit_id).strip()
-    if s.endswith('.0') and s[:-2].isdigit():
-        return s[:-2]
-    return s if s else None
-
-
 def _show_40k_details_impl(unit_id, entry_id=None, detachment_id=None, faction=None, game_system="40K_10E"):
     """
     Use passed unit_id for template data; entry_id for instance data (enhancements, wargear choices).
@@ -821,83 +324,26 @@ def _show_40k_details_impl(unit_id, entry_id=None, detachment_id=None, faction=N
                 unit_id = resolved
         except (TypeError, ValueError):
             pass
-    unit_id = _normalize_unit_id(unit_id)
-    if unit_id is None:
+    unit_id = clean_id(unit_id)
+    if not unit_id:
         st.warning("No unit selected.")
         conn.close()
         return
-    unit_id = str(unit_id).strip()
-    if unit_id.endswith(".0") and unit_id[:-2].isdigit():
-        unit_id = unit_id[:-2]
-    details = None
+    # Template data (stats, wargear, options, abilities, ...) comes from the memoized bundle; only
+    # per-entry state (quantity, wargear picks, enhancements, STL choice) is queried below.
     try:
-        cursor.execute("SELECT * FROM view_40k_datasheet_complete WHERE ID = %s", (unit_id,))
-        details = cursor.fetchone()
+        bundle = load_datasheet_bundle(unit_id)
     except Exception as e:
         st.error(f"Could not load unit: {e}")
-        try:
-            cursor.execute("SELECT name FROM waha_datasheets WHERE waha_datasheet_id = %s", (unit_id,))
-            row = cursor.fetchone()
-            if row:
-                st.write(f"Unit: **{row.get('name', unit_id)}**")
-        except Exception:
-            st.caption(f"Unit ID: {unit_id}")
+        st.caption(f"Unit ID: {unit_id}")
         conn.close()
         return
-    if not details:
-        # Fallback: build from waha_datasheets (no model row required so Boyz etc. still show)
-        try:
-            cursor.execute("""
-                SELECT d.waha_datasheet_id AS ID, d.name AS Unit_Name, d.points_cost AS Points, d.image_url AS Image,
-                       f.name AS Faction
-                FROM waha_datasheets d
-                LEFT JOIN waha_factions f ON d.faction_id = f.id
-                WHERE d.waha_datasheet_id = %s
-                LIMIT 1
-            """, (unit_id,))
-            row = cursor.fetchone()
-            if row:
-                cursor.execute("SELECT movement AS M, toughness AS T, save_value AS Sv, wounds AS W, leadership AS Ld, oc AS OC, base_size AS Base FROM waha_datasheets_models WHERE datasheet_id = %s ORDER BY line_id ASC LIMIT 1", (unit_id,))
-                m = cursor.fetchone()
-                if m:
-                    row.update(m)
-                else:
-                    for k in ('M', 'T', 'Sv', 'W', 'Ld', 'OC', 'Base'):
-                        row.setdefault(k, None)
-                cursor.execute("SELECT GROUP_CONCAT(keyword SEPARATOR ', ') AS kw FROM waha_datasheets_keywords WHERE datasheet_id = %s", (unit_id,))
-                kw = cursor.fetchone()
-                row['Keywords'] = (kw.get('kw') or '') if kw else ''
-                # Normalize keys so dialog finds them (MySQL may return lowercase)
-                details = {
-                    'ID': row.get('ID') or row.get('id'),
-                    'Unit_Name': row.get('Unit_Name') or row.get('unit_name') or row.get('name'),
-                    'Faction': row.get('Faction') or row.get('faction'),
-                    'Points': row.get('Points') if row.get('Points') is not None else row.get('points_cost'),
-                    'Image': row.get('Image') or row.get('image'),
-                    'Keywords': row.get('Keywords') or row.get('keywords') or '',
-                    'M': row.get('M') or row.get('movement'),
-                    'T': row.get('T') or row.get('toughness'),
-                    'Sv': row.get('Sv') or row.get('save_value'),
-                    'W': row.get('W') or row.get('wounds'),
-                    'Ld': row.get('Ld') or row.get('leadership'),
-                    'OC': row.get('OC') or row.get('oc'),
-                    'Base': row.get('Base') or row.get('base_size'),
-                }
-        except Exception:
-            pass
-    if not details:
+    if bundle is None:
         st.warning("Unit not found in database.")
-        try:
-            cursor.execute("SELECT name FROM waha_datasheets WHERE waha_datasheet_id = %s", (unit_id,))
-            row = cursor.fetchone()
-            if row:
-                st.write("**" + str(row.get('name', unit_id)) + "** not found. Check that the unit exists in `waha_datasheets` and that the ID matches.")
-            else:
-                st.caption(f"Unit ID: {unit_id}")
-        except Exception:
-            st.caption(f"Unit ID: {unit_id}")
+        st.write(f"Unit ID `{unit_id}` not found. Check that the unit exists in `waha_datasheets` and that the ID matches.")
         conn.close()
         return
+    details = bundle.details
     if details:
         # --- DYNAMIC VISUAL FETCH (V1.1 STABLE) ---
         # We only pull ONE image where is_default = 1 for this specific unit_id
@@ -924,17 +370,7 @@ def _show_40k_details_impl(unit_id, entry_id=None, detachment_id=None, faction=N
                     proxy_name = str(proxy_name)[2:].strip()
                 st.image(default_stl['preview_url'], width="stretch", caption=f"Proxy: {proxy_name}" if proxy_name else "Proxy")
             else:
-                img_url = details.get('Image') or details.get('image')
-                if not img_url:
-                    cursor.execute("SELECT image_url FROM waha_datasheets WHERE waha_datasheet_id = %s", (unit_id,))
-                    row = cursor.fetchone()
-                    if row and row.get('image_url'):
-                        img_url = row['image_url']
-                    if not img_url and str(unit_id).strip():
-                        cursor.execute("SELECT image_url FROM waha_datasheets WHERE CAST(waha_datasheet_id AS CHAR) = %s", (str(unit_id).strip(),))
-                        row = cursor.fetchone()
-                        if row and row.get('image_url'):
-                            img_url = row['image_url']
+                img_url = bundle.image_url
                 if img_url:
                     st.image(img_url, width="stretch", caption="Datasheet image")
                 else:
@@ -968,24 +404,12 @@ def _show_40k_details_impl(unit_id, entry_id=None, detachment_id=None, faction=N
             if kw_val and str(kw_val).strip():
                 st.caption(f"*Keywords:* {kw_val}")
             # Show chapter/subfaction if unit has a chapter-specific faction keyword (Space Marines)
-            cursor.execute("""
-                SELECT keyword FROM waha_datasheets_keywords
-                WHERE datasheet_id = %s AND is_faction_keyword = 1
-                AND keyword NOT IN ('Space Marines','Adeptus Astartes','Imperium','Chaos','Character','Infantry','Vehicle','Epic Hero','Battleline','Agents of the Imperium')
-            """, (unit_id,))
-            chapter_kw = [r["keyword"] for r in cursor.fetchall()]
+            chapter_kw = list(bundle.chapter_keywords)
             if chapter_kw:
                 st.caption(f"**Chapter:** {', '.join(chapter_kw)}")
             
-            # 1. Fetch stats using clean keys for Python logic
-            cursor.execute("""
-                SELECT name as Model, movement as M, toughness as T, 
-                       save_value as Sv, inv_sv, inv_sv_descr, wounds as W, 
-                       leadership as Ld, oc as OC 
-                FROM waha_datasheets_models 
-                WHERE datasheet_id = %s
-            """, (unit_id,))
-            models_raw = cursor.fetchall()
+            # 1. Stats (Model, M, T, Sv, inv_sv, inv_sv_descr, W, Ld, OC per model line)
+            models_raw = [dict(m) for m in bundle.models]
             # Dedupe: DB may have duplicate model rows (same stat line twice); use lowercase keys so casing doesn't split
             models = _dedupe_by_key(
                 models_raw,
@@ -1061,48 +485,22 @@ def _show_40k_details_impl(unit_id, entry_id=None, detachment_id=None, faction=N
                             unit_quantity = int(qrow["quantity"])
                     except Exception:
                         unit_quantity = 10
-                else:
-                    try:
-                        cursor.execute("SELECT min_size FROM view_40k_unit_composition WHERE datasheet_id = %s", (str(unit_id),))
-                        srow = cursor.fetchone()
-                        if srow and srow.get("min_size") is not None:
-                            unit_quantity = int(srow["min_size"])
-                    except Exception:
-                        pass
+                elif bundle.min_size is not None:
+                    unit_quantity = bundle.min_size
 
                 # 1. Default loadout and base weapon counts
-                loadout_text = None
-                try:
-                    cursor.execute("SELECT loadout FROM waha_datasheets WHERE waha_datasheet_id = %s", (unit_id,))
-                    row = cursor.fetchone()
-                    if not row and str(unit_id).strip():
-                        cursor.execute("SELECT loadout FROM waha_datasheets WHERE CAST(waha_datasheet_id AS CHAR) = %s", (str(unit_id).strip(),))
-                        row = cursor.fetchone()
-                    if row and row.get("loadout") and str(row.get("loadout")).strip():
-                        loadout_text = str(row.get("loadout")).strip()
-                        st.markdown("**Default loadout**")
-                        st.caption(_loadout_to_display(loadout_text))
-                        st.divider()
-                except Exception:
-                    pass
+                loadout_text = bundle.loadout or None
+                if loadout_text:
+                    st.markdown("**Default loadout**")
+                    st.caption(_loadout_to_display(loadout_text))
+                    st.divider()
 
                 base_counts = _compute_base_weapon_counts(loadout_text or "", unit_quantity)
 
                 # 2. Load options and parse; load structured state (w2| or legacy)
-                cursor.execute("SELECT description FROM waha_datasheets_options WHERE datasheet_id = %s", (str(unit_id),))
-                options = cursor.fetchall()
-                if not options and str(unit_id).strip():
-                    cursor.execute("SELECT description FROM waha_datasheets_options WHERE CAST(datasheet_id AS CHAR) = %s", (str(unit_id).strip(),))
-                    options = cursor.fetchall()
-
-                options_descs = []
-                options_parsed = []
-                for opt in options:
-                    desc = _strip_option_html(opt.get("description") or "")
-                    if not desc:
-                        continue
-                    options_descs.append(desc)
-                    options_parsed.append(parse_wargear_option(desc))
+                option_pairs = bundle.options_with_parsed()
+                options_descs = [d for d, _ in option_pairs]
+                options_parsed = [p for _, p in option_pairs]
 
                 selections = [0] * len(options_descs)
                 for i in range(len(options_descs)):
@@ -1172,48 +570,11 @@ def _show_40k_details_impl(unit_id, entry_id=None, detachment_id=None, faction=N
                     except Exception:
                         pass
 
-                def save_wargear_state(ent_id, new_selections, summary_str):
-                    conn_cb = get_db_connection()
-                    cur_cb = conn_cb.cursor()
-                    try:
-                        cur_cb.execute("DELETE FROM play_armylist_wargear_selections WHERE entry_id = %s", (ent_id,))
-                        for idx, sel in enumerate(new_selections):
-                            if isinstance(sel, list):
-                                for slot, choice in enumerate(sel):
-                                    cur_cb.execute(
-                                        "INSERT INTO play_armylist_wargear_selections (entry_id, option_text, is_active) VALUES (%s, %s, 1)",
-                                        (ent_id, f"w2|{idx}|{slot}|{choice}"),
-                                    )
-                            else:
-                                cur_cb.execute(
-                                    "INSERT INTO play_armylist_wargear_selections (entry_id, option_text, is_active) VALUES (%s, %s, 1)",
-                                    (ent_id, f"w2|{idx}|{sel}"),
-                                )
-                        if summary_str:
-                            cur_cb.execute(
-                                "INSERT INTO play_armylist_wargear_selections (entry_id, option_text, is_active) VALUES (%s, %s, 1)",
-                                (ent_id, summary_str[:500], 1),
-                            )
-                        conn_cb.commit()
-                    finally:
-                        cur_cb.close()
-                        conn_cb.close()
-
                 # Weapons chart and final count (always show, before wargear options)
                 st.divider()
                 final_counts = _apply_wargear_to_counts(base_counts, list(zip(options_descs, options_parsed)), selections, unit_quantity)
                 st.markdown("**Weapons** (strikethrough = 0 models with this weapon at current loadout)")
-                cursor.execute(
-                    "SELECT name, range_val, attacks, bs_ws, ap, damage, description FROM waha_datasheets_wargear WHERE datasheet_id = %s ORDER BY name",
-                    (str(unit_id),),
-                )
-                wargear_raw = cursor.fetchall()
-                if not wargear_raw and str(unit_id).strip():
-                    cursor.execute(
-                        "SELECT name, range_val, attacks, bs_ws, ap, damage, description FROM waha_datasheets_wargear WHERE CAST(datasheet_id AS CHAR) = %s ORDER BY name",
-                        (str(unit_id).strip(),),
-                    )
-                    wargear_raw = cursor.fetchall()
+                wargear_raw = [dict(w) for w in bundle.wargear]
                 # Dedupe: DB may have duplicate wargear rows (same weapon twice); use lowercase keys
                 wargear_rows = _dedupe_by_key(
                     wargear_raw,
@@ -1245,8 +606,7 @@ def _show_40k_details_impl(unit_id, entry_id=None, detachment_id=None, faction=N
                         continue
                     if any(_weapon_name_matches(wname, w.get("name") or "") for w in wargear_rows):
                         continue
-                    cursor.execute("SELECT name, range_val, attacks_val, ap_val, damage_val FROM waha_weapons WHERE LOWER(TRIM(name)) = LOWER(TRIM(%s))", (wname,))
-                    nw = cursor.fetchone()
+                    nw = bundle.weapon_profile(wname)
                     if nw:
                         display_data.append({
                             "Weapon": f"{nw.get('name', wname)} (**{c}×**)",
@@ -1267,121 +627,103 @@ def _show_40k_details_impl(unit_id, entry_id=None, detachment_id=None, faction=N
                 st.divider()
                 if options_descs:
                     with st.expander("🔄 Wargear Options", expanded=True):
-                        st.caption(f"Unit size: **{unit_quantity}** models. Set counts below.")
-                        new_selections = list(selections)
-                        for idx, (desc, parsed) in enumerate(zip(options_descs, options_parsed)):
-                            ptype = parsed.get("type")
-                            st.caption(desc)
-
-                            if ptype == "swap_1_1":
-                                current = new_selections[idx] if isinstance(new_selections[idx], int) else 0
-                                n = st.number_input("How many have this swap?", min_value=0, max_value=1, value=current, key=f"wopt_{entry_id or unit_id}_{idx}")
-                                if n != current and entry_id is not None:
-                                    new_selections[idx] = n
-                                    final = _apply_wargear_to_counts(base_counts, list(zip(options_descs, options_parsed)), new_selections, unit_quantity)
-                                    summary = ", ".join(f"{c}× {w}" for w, c in sorted(final.items(), key=lambda x: (-x[1], x[0])) if c) or "Default"
-                                    save_wargear_state(entry_id, new_selections, summary)
-                                    st.rerun()
-
-                            elif ptype == "swap_multi":
-                                current = new_selections[idx] if isinstance(new_selections[idx], int) else 0
-                                n = st.number_input("How many have this swap?", min_value=0, max_value=1, value=current, key=f"wopt_{entry_id or unit_id}_{idx}_m")
-                                if n != current and entry_id is not None:
-                                    new_selections[idx] = n
-                                    final = _apply_wargear_to_counts(base_counts, list(zip(options_descs, options_parsed)), new_selections, unit_quantity)
-                                    summary = ", ".join(f"{c}× {w}" for w, c in sorted(final.items(), key=lambda x: (-x[1], x[0])) if c) or "Default"
-                                    save_wargear_state(entry_id, new_selections, summary)
-                                    st.rerun()
-
-                            elif ptype == "any_number":
-                                current = new_selections[idx] if isinstance(new_selections[idx], int) else 0
-                                n = st.number_input("How many have this swap?", min_value=0, max_value=unit_quantity, value=min(current, unit_quantity), key=f"wopt_{entry_id or unit_id}_{idx}_a")
-                                if n != current and entry_id is not None:
-                                    new_selections[idx] = n
-                                    final = _apply_wargear_to_counts(base_counts, list(zip(options_descs, options_parsed)), new_selections, unit_quantity)
-                                    summary = ", ".join(f"{c}× {w}" for w, c in sorted(final.items(), key=lambda x: (-x[1], x[0])) if c) or "Default"
-                                    save_wargear_state(entry_id, new_selections, summary)
-                                    st.rerun()
-
-                            elif ptype == "per_N_models":
-                                every_N = parsed.get("every_N") or 10
-                                slots = (unit_quantity // every_N) * (parsed.get("slots_per_N") or 1)
-                                opts = parsed.get("options") or []
-                                opts_with_default = ["Default"] + opts
-                                current_list = list(new_selections[idx]) if isinstance(new_selections[idx], list) else []
-                                while len(current_list) < slots:
-                                    current_list.append("")
-                                current_list = current_list[:slots]
-                                st.caption(f"Slots: **{slots}** (1 per {every_N} models). Choose for each slot (Default = no swap):")
-                                for slot in range(slots):
-                                    val = current_list[slot] or ""
-                                    choice_idx = opts_with_default.index(val) if val in opts_with_default else 0
-                                    sel = st.selectbox(f"Slot {slot + 1}", opts_with_default, index=min(choice_idx, len(opts_with_default) - 1), key=f"wopt_{entry_id or unit_id}_{idx}_{slot}")
-                                    current_list[slot] = "" if sel == "Default" else sel
-                                if entry_id is not None:
-                                    prev_list = new_selections[idx] if isinstance(new_selections[idx], list) else []
-                                    if current_list != prev_list:
-                                        new_selections[idx] = current_list
-                                        final = _apply_wargear_to_counts(base_counts, list(zip(options_descs, options_parsed)), new_selections, unit_quantity)
-                                        summary = ", ".join(f"{c}× {w}" for w, c in sorted(final.items(), key=lambda x: (-x[1], x[0])) if c) or "Default"
-                                        save_wargear_state(entry_id, new_selections, summary)
-                                        st.rerun()
-
-                            elif ptype == "nested":
-                                opts = parsed.get("options") or []
-                                target = parsed.get("target", "Equipment")
-                                default_label = f"{target} (Default)"
-                                radio_options = [default_label] + opts
-                                current = new_selections[idx] if isinstance(new_selections[idx], str) else "Default"
-                                current_display = default_label if current == "Default" else (current if current in radio_options else default_label)
-                                choice_idx = radio_options.index(current_display) if current_display in radio_options else 0
-                                choice = st.radio(f"Replace {target} with", radio_options, index=min(choice_idx, len(radio_options) - 1), key=f"wopt_{entry_id or unit_id}_{idx}_n")
-                                new_val = "Default" if choice == default_label else choice
-                                if new_val != current and entry_id is not None:
-                                    new_selections[idx] = new_val
-                                    final = _apply_wargear_to_counts(base_counts, list(zip(options_descs, options_parsed)), new_selections, unit_quantity)
-                                    summary = ", ".join(f"{c}× {w}" for w, c in sorted(final.items(), key=lambda x: (-x[1], x[0])) if c) or "Default"
-                                    save_wargear_state(entry_id, new_selections, summary)
-                                    st.rerun()
-
-                            elif ptype == "equipped_with":
-                                max_val = parsed.get("max") or 1
-                                current = new_selections[idx] if isinstance(new_selections[idx], int) else 0
-                                n = st.number_input("How many equipped?", min_value=0, max_value=max_val, value=min(current, max_val), key=f"wopt_{entry_id or unit_id}_{idx}_eq")
-                                if n != current and entry_id is not None:
-                                    new_selections[idx] = n
-                                    final = _apply_wargear_to_counts(base_counts, list(zip(options_descs, options_parsed)), new_selections, unit_quantity)
-                                    summary = ", ".join(f"{c}× {w}" for w, c in sorted(final.items(), key=lambda x: (-x[1], x[0])) if c) or "Default"
-                                    save_wargear_state(entry_id, new_selections, summary)
-                                    st.rerun()
-
+                        st.caption(f"Unit size: **{unit_quantity}** models. Set counts below, then **Save wargear**.")
+                        # Inside a form, option widgets do not rerun the app: edits to any number of options are
+                        # held until Save and written together (one diff, one transaction, one rerun).
+                        with st.form(key=f"wargear_form_{entry_id or unit_id}", border=False):
+                            new_selections = list(selections)
+                            changed = False
+                            for idx, (desc, parsed) in enumerate(zip(options_descs, options_parsed)):
+                                ptype = parsed.get("type")
+                                st.caption(desc)
+
+                                if ptype == "swap_1_1":
+                                    current = new_selections[idx] if isinstance(new_selections[idx], int) else 0
+                                    n = st.number_input("How many have this swap?", min_value=0, max_value=1, value=current, key=f"wopt_{entry_id or unit_id}_{idx}")
+                                    if n != current and entry_id is not None:
+                                        new_selections[idx] = n
+                                        changed = True
+
+                                elif ptype == "swap_multi":
+                                    current = new_selections[idx] if isinstance(new_selections[idx], int) else 0
+                                    n = st.number_input("How many have this swap?", min_value=0, max_value=1, value=current, key=f"wopt_{entry_id or unit_id}_{idx}_m")
+                                    if n != current and entry_id is not None:
+                                        new_selections[idx] = n
+                                        changed = True
+
+                                elif ptype == "any_number":
+                                    current = new_selections[idx] if isinstance(new_selections[idx], int) else 0
+                                    n = st.number_input("How many have this swap?", min_value=0, max_value=unit_quantity, value=min(current, unit_quantity), key=f"wopt_{entry_id or unit_id}_{idx}_a")
+                                    if n != current and entry_id is not None:
+                                        new_selections[idx] = n
+                                        changed = True
+
+                                elif ptype == "per_N_models":
+                                    every_N = parsed.get("every_N") or 10
+                                    slots = (unit_quantity // every_N) * (parsed.get("slots_per_N") or 1)
+                                    opts = parsed.get("options") or []
+                                    opts_with_default = ["Default"] + opts
+                                    current_list = list(new_selections[idx]) if isinstance(new_selections[idx], list) else []
+                                    while len(current_list) < slots:
+                                        current_list.append("")
+                                    current_list = current_list[:slots]
+                                    st.caption(f"Slots: **{slots}** (1 per {every_N} models). Choose for each slot (Default = no swap):")
+                                    for slot in range(slots):
+                                        val = current_list[slot] or ""
+                                        choice_idx = opts_with_default.index(val) if val in opts_with_default else 0
+                                        sel = st.selectbox(f"Slot {slot + 1}", opts_with_default, index=min(choice_idx, len(opts_with_default) - 1), key=f"wopt_{entry_id or unit_id}_{idx}_{slot}")
+                                        current_list[slot] = "" if sel == "Default" else sel
+                                    if entry_id is not None:
+                                        prev_list = new_selections[idx] if isinstance(new_selections[idx], list) else []
+                                        if current_list != prev_list:
+                                            new_selections[idx] = current_list
+                                            changed = True
+
+                                elif ptype == "nested":
+                                    opts = parsed.get("options") or []
+                                    target = parsed.get("target", "Equipment")
+                                    default_label = f"{target} (Default)"
+                                    radio_options = [default_label] + opts
+                                    current = new_selections[idx] if isinstance(new_selections[idx], str) else "Default"
+                                    current_display = default_label if current == "Default" else (current if current in radio_options else default_label)
+                                    choice_idx = radio_options.index(current_display) if current_display in radio_options else 0
+                                    choice = st.radio(f"Replace {target} with", radio_options, index=min(choice_idx, len(radio_options) - 1), key=f"wopt_{entry_id or unit_id}_{idx}_n")
+                                    new_val = "Default" if choice == default_label else choice
+                                    if new_val != current and entry_id is not None:
+                                        new_selections[idx] = new_val
+                                        changed = True
+
+                                elif ptype == "equipped_with":
+                                    max_val = parsed.get("max") or 1
+                                    current = new_selections[idx] if isinstance(new_selections[idx], int) else 0
+                                    n = st.number_input("How many equipped?", min_value=0, max_value=max_val, value=min(current, max_val), key=f"wopt_{entry_id or unit_id}_{idx}_eq")
+                                    if n != current and entry_id is not None:
+                                        new_selections[idx] = n
+                                        changed = True
+
+                                else:
+                                    st.caption("(Unsupported option type)")
+
+                            submitted = st.form_submit_button("💾 Save wargear", disabled=entry_id is None)
+
+                        if submitted and changed:
+                            final = _apply_wargear_to_counts(base_counts, list(zip(options_descs, options_parsed)), new_selections, unit_quantity)
+                            summary = ", ".join(f"{c}× {w}" for w, c in sorted(final.items(), key=lambda x: (-x[1], x[0])) if c) or "Default"
+                            conn_ws = get_db_connection()
+                            try:
+                                save_wargear_selections(conn_ws, entry_id, encode_wargear_selections(new_selections, summary))
+                            except Exception as e:
+                                st.error(f"Could not save wargear: {e}")
                             else:
-                                st.caption("(Unsupported option type)")
+                                st.rerun()
+                            finally:
+                                conn_ws.close()
 
             # --- TAB 2: RULES (ABILITIES) ---
             with t2:
                 st.markdown("**ABILITIES**")
                 # Show all ability types (Faction, Datasheet, Wargear, Special, etc.); ORDER by type then name. TRIM type so "Special " matches.
-                cursor.execute("""
-                    SELECT 
-                        COALESCE(a.name, da.name) as ab_name, 
-                        COALESCE(a.description, da.description) as ab_desc, 
-                        da.type 
-                    FROM waha_datasheets_abilities da 
-                    LEFT JOIN waha_abilities a ON da.ability_id = a.id 
-                    WHERE da.datasheet_id = %s 
-                    ORDER BY CASE WHEN LOWER(TRIM(COALESCE(da.type,''))) = 'faction' THEN 0 WHEN LOWER(TRIM(COALESCE(da.type,''))) = 'datasheet' THEN 1 WHEN LOWER(TRIM(COALESCE(da.type,''))) = 'wargear' THEN 2 WHEN LOWER(TRIM(COALESCE(da.type,''))) LIKE 'special%' THEN 3 ELSE 4 END, ab_name ASC
-                """, (unit_id,))
-                unit_abilities = cursor.fetchall()
-                if not unit_abilities:
-                    cursor.execute("""
-                        SELECT COALESCE(a.name, da.name) as ab_name, COALESCE(a.description, da.description) as ab_desc, da.type
-                        FROM waha_datasheets_abilities da
-                        LEFT JOIN waha_abilities a ON da.ability_id = a.id
-                        WHERE CAST(da.datasheet_id AS CHAR) = %s
-                        ORDER BY CASE WHEN LOWER(TRIM(COALESCE(da.type,''))) = 'faction' THEN 0 WHEN LOWER(TRIM(COALESCE(da.type,''))) = 'datasheet' THEN 1 WHEN LOWER(TRIM(COALESCE(da.type,''))) = 'wargear' THEN 2 WHEN LOWER(TRIM(COALESCE(da.type,''))) LIKE 'special%' THEN 3 ELSE 4 END, ab_name ASC
-                    """, (str(unit_id).strip(),))
-                    unit_abilities = cursor.fetchall()
+                unit_abilities = [dict(a) for a in bundle.abilities]
                 unit_abilities = _dedupe_by_key(unit_abilities or [], lambda d: (d.get("ab_name"), d.get("ab_desc"), d.get("type")))
                 if unit_abilities:
                     for ab in unit_abilities:
@@ -1402,7 +744,7 @@ def _show_40k_details_impl(unit_id, entry_id=None, detachment_id=None, faction=N
                     st.caption("No abilities found for this unit.")
                     st.caption("Load Wahapedia **Datasheets_abilities** for this faction to see abilities here.")
 
-                _show_led_by_can_lead_transport(cursor, unit_id)
+                _render_led_by_can_lead_transport(bundle.leader_names, bundle.can_lead_names, bundle.transport)
 
             with t3:
                 keywords_str = (details.get("Keywords") or details.get("keywords") or "") if isinstance(details.get("Keywords") or details.get("keywords"), str) else ""
@@ -1450,21 +792,7 @@ def _show_40k_details_impl(unit_id, entry_id=None, detachment_id=None, faction=N
                     st.info("💡 Only non-Epic Hero Characters can take Enhancements.")
 
             with t4:
-                cursor.execute("""
-                    SELECT c.description, m.base_size, m.base_size_descr
-                    FROM waha_datasheet_unit_composition c
-                    LEFT JOIN waha_datasheets_models m ON c.datasheet_id = m.datasheet_id AND c.line_id = m.line_id
-                    WHERE c.datasheet_id = %s ORDER BY c.line_id ASC
-                """, (unit_id,))
-                comp_list = cursor.fetchall()
-                if not comp_list and str(unit_id).strip():
-                    cursor.execute("""
-                        SELECT c.description, m.base_size, m.base_size_descr
-                        FROM waha_datasheet_unit_composition c
-                        LEFT JOIN waha_datasheets_models m ON c.datasheet_id = m.datasheet_id AND c.line_id = m.line_id
-                        WHERE CAST(c.datasheet_id AS CHAR) = %s ORDER BY c.line_id ASC
-                    """, (str(unit_id).strip(),))
-                    comp_list = cursor.fetchall()
+                comp_list = [dict(c) for c in bundle.composition]
                 comp_list = _dedupe_by_key(comp_list or [], lambda d: (d.get("description"), d.get("base_size"), d.get("base_size_descr")))
                 if comp_list:
                     for comp in comp_list:
@@ -1477,8 +805,7 @@ def _show_40k_details_impl(unit_id, entry_id=None, detachment_id=None, faction=N
                     st.info("No composition data in database. Load Wahapedia **Datasheets_unit_composition** for this unit.")
 
             with t5:
-                cursor.execute("SELECT keyword FROM waha_datasheets_keywords WHERE datasheet_id = %s", (unit_id,))
-                unit_keywords = [(row.get('keyword') or '').upper() for row in cursor.fetchall()]
+                unit_keywords = list(bundle.keywords)
                 st.write(f"🏷️ Keywords: `{'`, `'.join(unit_keywords)}`")
                 phase_filter = st.selectbox("Filter by Phase", 
                                             ["All Phases", "Command phase", "Movement phase", "Shooting phase", "Fight phase", "Any phase"],
@@ -1486,20 +813,8 @@ def _show_40k_details_impl(unit_id, entry_id=None, detachment_id=None, faction=N
                 # Load detachment stratagems + Core stratagems (empty detachment_id or type containing 'Core' in export)
                 all_strats = []
                 try:
-                    if detachment_id is not None:
-                        cursor.execute("""
-                            SELECT name, cp_cost, type, phase, description 
-                            FROM waha_stratagems 
-                            WHERE detachment_id = %s OR CAST(detachment_id AS UNSIGNED) = %s
-                        """, (detachment_id, detachment_id))
-                        all_strats = list(cursor.fetchall())
-                    # Add Core stratagems (available to all; in export they have empty faction_id/detachment_id or type like 'Core – ...')
-                    cursor.execute("""
-                        SELECT name, cp_cost, type, phase, description 
-                        FROM waha_stratagems 
-                        WHERE (detachment_id IS NULL OR TRIM(COALESCE(detachment_id,'')) = '' OR type LIKE %s)
-                    """, ("%Core%",))
-                    core_rows = cursor.fetchall()
+                    # Core stratagems are available to all (empty detachment_id or type like 'Core – ...' in the export)
+                    all_strats, core_rows = fetch_stratagems(cursor, detachment_id)
                     seen_keys = {(_normalize_stratagem_name_for_key(s.get("name") or ""), s.get("cp_cost")) for s in all_strats}
                     for s in core_rows:
                         k = (_normalize_stratagem_name_for_key(s.get("name") or ""), s.get("cp_cost"))
@@ -1578,155 +893,39 @@ def _gameday_build_groups(roster_df):
     """Build list of (leader_row or None, bodyguard_row). Pairs (leader+bodyguard) first by bodyguard entry_id, then solos by entry_id."""
     if roster_df is None or roster_df.empty:
         return []
-    col_eid = "entry_id" if "entry_id" in roster_df.columns else "Entry_ID"
-    col_att = "attached_to_entry_id"
-    if col_att not in roster_df.columns:
+    if "attached_to_entry_id" not in roster_df.columns:
         return [(None, r) for _, r in roster_df.iterrows()]
-
-    def _eid(r):
-        v = r.get(col_eid)
-        if v is None or (hasattr(v, "__float__") and pd.isna(v)):
-            return None
-        try:
-            return int(v)
-        except (TypeError, ValueError):
-            return None
-
-    used = set()
-    pairs = []
+    rows_by_eid = {}
     for _, r in roster_df.iterrows():
-        eid = _eid(r)
-        if eid is None or eid in used:
-            continue
-        att = r.get(col_att)
-        if att is None or (hasattr(att, "__float__") and pd.isna(att)):
-            continue
-        try:
-            att_int = int(att)
-        except (TypeError, ValueError):
-            continue
-        bodyguard_row = None
-        for _, r2 in roster_df.iterrows():
-            if _eid(r2) == att_int:
-                bodyguard_row = r2
-                break
-        if bodyguard_row is not None:
-            pairs.append((r, bodyguard_row))
-            used.add(eid)
-            used.add(att_int)
-    solos = [(None, r) for _, r in roster_df.iterrows() if _eid(r) not in used]
-    return pairs + solos
-
-
-def _get_gameday_unit_image(cursor, entry_id, datasheet_id):
-    """Return (image_url, caption) for gameday. Priority: 1) Roster unit STL, 2) Unit default STL, 3) Wahapedia. So different roster entries of the same unit can show different STL photos. Returns (None, None) if no image."""
-    # 1) Roster unit STL (play_armylist_stl_choices): per-entry choice, so same unit type can show different STLs
-    if entry_id is not None:
-        try:
-            eid = int(entry_id) if not (hasattr(entry_id, "__float__") and pd.isna(entry_id)) else None
-            if eid is not None:
-                cursor.execute("""
-                    SELECT l.preview_url, l.name
-                    FROM play_armylist_stl_choices c
-                    JOIN stl_library l ON l.mmf_id = c.mmf_id
-                    WHERE c.entry_id = %s
-                    ORDER BY c.sort_order ASC, c.id ASC
-                    LIMIT 1
-                """, (eid,))
-                row = cursor.fetchone()
-                if row and row.get("preview_url"):
-                    name = (row.get("name") or "").strip() or "Proxy"
-                    return (row["preview_url"], name)
-        except (TypeError, ValueError):
-            pass
-    # 2) Unit default STL (stl_unit_links): fallback when this roster entry has no STL chosen
-    if datasheet_id and str(datasheet_id).strip():
-        sid = str(datasheet_id).strip()
-        if sid.endswith(".0") and sid[:-2].isdigit():
-            sid = sid[:-2]
-        try:
-            cursor.execute("""
-                SELECT l.preview_url, l.name
-                FROM stl_library l
-                JOIN stl_unit_links ul ON l.mmf_id = ul.mmf_id
-                WHERE ul.unit_id = %s AND ul.game_system = '40K_10E' AND ul.is_default = 1
-                LIMIT 1
-            """, (sid,))
-            row = cursor.fetchone()
-            if not row:
-                cursor.execute("""
-                    SELECT l.preview_url, l.name
-                    FROM stl_library l
-                    JOIN stl_unit_links ul ON l.mmf_id = ul.mmf_id
-                    WHERE CAST(ul.unit_id AS CHAR) = %s AND ul.game_system = '40K_10E' AND ul.is_default = 1
-                    LIMIT 1
-                """, (sid,))
-                row = cursor.fetchone()
-            if row and row.get("preview_url"):
-                return (row["preview_url"], (row.get("name") or "Proxy").strip() or "Proxy")
-        except Exception:
-            pass
-    # 3) Wahapedia datasheet image
-    if datasheet_id and str(datasheet_id).strip():
-        sid = str(datasheet_id).strip()
-        if sid.endswith(".0") and sid[:-2].isdigit():
-            sid = sid[:-2]
-        try:
-            cursor.execute("SELECT image_url FROM waha_datasheets WHERE waha_datasheet_id = %s", (sid,))
-            row = cursor.fetchone()
-            if not row or not row.get("image_url"):
-                cursor.execute("SELECT image_url FROM waha_datasheets WHERE CAST(waha_datasheet_id AS CHAR) = %s", (sid,))
-                row = cursor.fetchone()
-            if row and row.get("image_url") and str(row.get("image_url")).strip():
-                return (str(row["image_url"]).strip(), "Datasheet")
-        except Exception:
-            pass
-    return (None, None)
-
-
-def _render_gameday_unit_card(conn, cursor, row, active_list, roster_df=None, unit_label=None):
-    """Render one unit's data card. Uses canonical datasheet_id for all lookups (from row or resolved from entry_id). roster_df used for leader/bodyguard labels. unit_label e.g. 'Boyz A' for numbering."""
-    entry_id = row.get("entry_id") or row.get("Entry_ID")
+        eid = entry_int(r.get("entry_id", r.get("Entry_ID")))
+        if eid is not None:
+            rows_by_eid.setdefault(eid, r)
+    pairing = pair_roster(r for _, r in roster_df.iterrows())
+    return [(rows_by_eid[lead] if lead is not None else None, rows_by_eid[eid]) for lead, eid in pairing.groups]
+
+
+def _gameday_stratagems(data):
+    """Detachment + Core stratagems from prefetched rows, merged and deduped once per Game-Day render."""
+    strats, core_rows = data.get("stratagems") or ([], [])
+    strats = list(strats)
+    seen_keys = {(_normalize_stratagem_name_for_key(s.get("name") or ""), s.get("cp_cost")) for s in strats}
+    for s in core_rows:
+        k = (_normalize_stratagem_name_for_key(s.get("name") or ""), s.get("cp_cost"))
+        if k not in seen_keys:
+            seen_keys.add(k)
+            strats.append(s)
+    return _dedupe_stratagems(strats)
+
+
+def _render_gameday_unit_card(row, active_list, data, unit_label=None):
+    """Render one unit's data card from the roster-level prefetch (see w40k_datasheets.prefetch_gameday_data). unit_label e.g. 'Boyz A' for numbering."""
     qty = row.get("Qty", 1)
     unit_name = row.get("Unit", "Unit")
     if unit_label:
         unit_name = unit_label
     total_pts = row.get("Total_Pts", 0)
-    datasheet_id = row.get("datasheet_id")
-    if datasheet_id is None or (hasattr(datasheet_id, "__float__") and pd.isna(datasheet_id)):
-        datasheet_id = row.get("unit_id") or row.get("Unit_ID")
-    # Resolve canonical id from DB when we have entry_id (same as unit details dialog)
-    if entry_id is not None:
-        try:
-            resolved = get_datasheet_id_for_entry(conn, int(entry_id))
-            if resolved is not None:
-                datasheet_id = resolved
-        except (TypeError, ValueError):
-            pass
-    if datasheet_id is not None:
-        datasheet_id = str(datasheet_id).strip()
-        if datasheet_id.endswith(".0") and datasheet_id[:-2].isdigit():
-            datasheet_id = datasheet_id[:-2]
-    sid = (datasheet_id or "").strip()
-    leading_unit_name = None
-    led_by_leader_name = None
-    if roster_df is not None and not roster_df.empty and entry_id is not None:
-        try:
-            eid_val = int(entry_id) if not (hasattr(entry_id, "__float__") and pd.isna(entry_id)) else None
-        except (TypeError, ValueError):
-            eid_val = None
-        if eid_val is not None:
-            attached_to = row.get("attached_to_entry_id")
-            if attached_to is not None and not (hasattr(attached_to, "__float__") and pd.isna(attached_to)):
-                for _, r in roster_df.iterrows():
-                    if (r.get("entry_id") or r.get("Entry_ID")) == attached_to:
-                        leading_unit_name = r.get("Unit", "Unit")
-                        break
-            for _, r in roster_df.iterrows():
-                if (r.get("attached_to_entry_id") or None) == eid_val:
-                    led_by_leader_name = r.get("Unit", "Leader")
-                    break
-    img_url, img_caption = _get_gameday_unit_image(cursor, entry_id, sid)
+    sid, entry_id, led_by_leader_name, leading_unit_name = _resolve_row_datasheet_and_attachment(row, data)
+    img_url, img_caption = gameday_unit_image(data, entry_id, sid)
     col_img, col_main = st.columns([0.22, 0.78])
     with col_img:
         if img_url:
@@ -1735,11 +934,11 @@ def _render_gameday_unit_card(conn, cursor, row, active_list, roster_df=None, un
             st.caption("No image")
     with col_main:
         with st.expander(f"**{qty}x {unit_name}** ({total_pts} pts)", expanded=False):
-            _render_gameday_unit_content(conn, cursor, row, active_list, roster_df, sid, entry_id, led_by_leader_name, leading_unit_name)
+            _render_gameday_unit_content(row, active_list, data, sid, entry_id, led_by_leader_name, leading_unit_name)
 
 
-def _render_gameday_unit_content(conn, cursor, row, active_list, roster_df, sid, entry_id, led_by_leader_name=None, leading_unit_name=None):
-    """Render the inner content of one unit card (stats, loadout, enhancement, weapons, abilities, stratagems). Used for single cards and for each half of a group card."""
+def _render_gameday_unit_content(row, active_list, data, sid, entry_id, led_by_leader_name=None, leading_unit_name=None):
+    """Render the inner content of one unit card (stats, loadout, enhancement, weapons, abilities, stratagems) from prefetched data. Used for single cards and for each half of a group card."""
     if not sid:
         st.caption("Unit not linked to datasheet. Remove and re-add this unit from the library.")
         return
@@ -1758,49 +957,18 @@ def _render_gameday_unit_content(conn, cursor, row, active_list, roster_df, sid,
         except Exception:
             if isinstance(wg_list, str) and wg_list.strip():
                 st.caption(f"🔧 **Chosen loadout:** {wg_list}")
-    # Enhancement (from DB for this entry)
-    if entry_id is not None:
-        try:
-            eid = int(entry_id) if not (hasattr(entry_id, "__float__") and pd.isna(entry_id)) else None
-            if eid is not None:
-                cursor.execute("""
-                    SELECT e.name, e.description, ple.cost
-                    FROM play_armylist_enhancements ple
-                    JOIN waha_enhancements e ON ple.enhancement_id = e.id
-                    WHERE ple.entry_id = %s
-                """, (eid,))
-                equipped_enh = cursor.fetchone()
-                if equipped_enh:
-                    st.caption(f"✨ **Enhancement:** {equipped_enh.get('name', '')} (+{equipped_enh.get('cost', 0)} pts)")
-        except (TypeError, ValueError):
-            pass
-    def _query_id(q, param):
-        cursor.execute(q, (param,))
-        out = cursor.fetchall()
-        if not out and param and "CAST(" not in q:
-            fallback = q.replace(" datasheet_id = %s", " CAST(datasheet_id AS CHAR) = %s").replace("da.datasheet_id = %s", "CAST(da.datasheet_id AS CHAR) = %s")
-            if fallback != q:
-                cursor.execute(fallback, (str(param).strip(),))
-                out = cursor.fetchall()
-        return out
+    # Enhancement (prefetched for this entry)
+    equipped_enh = data["enhancement"].get(entry_id) if entry_id is not None else None
+    if equipped_enh:
+        st.caption(f"✨ **Enhancement:** {equipped_enh.get('name', '')} (+{equipped_enh.get('cost', 0)} pts)")
+    ds = data["datasheet"].get(sid) or {}
     # A. Stats Table (dedupe: DB may have duplicate model rows)
-    cursor.execute("SELECT name as Model, movement as M, toughness as T, save_value as Sv, wounds as W, leadership as Ld, oc as OC FROM waha_datasheets_models WHERE datasheet_id = %s", (sid,))
-    models_raw = cursor.fetchall()
-    if not models_raw:
-        cursor.execute("SELECT name as Model, movement as M, toughness as T, save_value as Sv, wounds as W, leadership as Ld, oc as OC FROM waha_datasheets_models WHERE CAST(datasheet_id AS CHAR) = %s", (sid,))
-        models_raw = cursor.fetchall()
-    models = _dedupe_by_key(models_raw, lambda d: (d.get("model"), d.get("m"), d.get("t"), d.get("sv"), d.get("w"), d.get("ld"), d.get("oc")))
+    models = _dedupe_by_key(data["models"].get(sid, []), lambda d: (d.get("model"), d.get("m"), d.get("t"), d.get("sv"), d.get("w"), d.get("ld"), d.get("oc")))
     if models:
         st.table(pd.DataFrame(models))  # st.table = plain HTML table, fits print column width with CSS
     # B. Unit Composition (with base size per line)
     with st.expander("👥 Unit Composition", expanded=False):
-        comp_raw = _query_id("""
-            SELECT c.description, m.base_size, m.base_size_descr
-            FROM waha_datasheet_unit_composition c
-            LEFT JOIN waha_datasheets_models m ON c.datasheet_id = m.datasheet_id AND c.line_id = m.line_id
-            WHERE c.datasheet_id = %s ORDER BY c.line_id ASC
-        """, sid)
-        comp_list = _dedupe_by_key(comp_raw or [], lambda d: (d.get("description"), d.get("base_size"), d.get("base_size_descr")))
+        comp_list = _dedupe_by_key(data["composition"].get(sid, []), lambda d: (d.get("description"), d.get("base_size"), d.get("base_size_descr")))
         if comp_list:
             for c in comp_list:
                 desc = (c.get('description') or '').strip()
@@ -1812,11 +980,10 @@ def _render_gameday_unit_content(conn, cursor, row, active_list, roster_df, sid,
             st.caption("No composition data for this unit.")
     # Full-width vertical stack for print: tables and text don't bleed (no 45/55 columns)
     with st.expander("⚔️ Weapons", expanded=True):
-        loadout = _query_id("SELECT loadout FROM waha_datasheets WHERE waha_datasheet_id = %s", sid)
-        if loadout and loadout[0].get("loadout") and str(loadout[0].get("loadout")).strip():
-            st.caption("**Default loadout:**\n\n" + _loadout_to_display(str(loadout[0].get("loadout")).strip()))
-        wargear_raw = _query_id("SELECT name, range_val, attacks, bs_ws, ap, damage, description FROM waha_datasheets_wargear WHERE datasheet_id = %s ORDER BY name", sid)
-        wargear = _dedupe_by_key(wargear_raw or [], lambda d: (d.get("name"), d.get("range_val"), d.get("attacks"), d.get("bs_ws"), d.get("ap"), d.get("damage")))
+        loadout = ds.get("loadout")
+        if loadout and str(loadout).strip():
+            st.caption("**Default loadout:**\n\n" + _loadout_to_display(str(loadout).strip()))
+        wargear = _dedupe_by_key(data["wargear"].get(sid, []), lambda d: (d.get("name"), d.get("range_val"), d.get("attacks"), d.get("bs_ws"), d.get("ap"), d.get("damage")))
         if wargear:
             rows = []
             for w in wargear:
@@ -1832,27 +999,11 @@ def _render_gameday_unit_content(conn, cursor, row, active_list, roster_df, sid,
             st.table(pd.DataFrame(rows))  # st.table = plain HTML table, fits print column width with CSS
         else:
             st.caption("No weapons/wargear data for this unit.")
-    if entry_id is not None:
-        try:
-            eid = int(entry_id)
-            cursor.execute("""
-                SELECT e.name, e.description, ple.cost 
-                FROM play_armylist_enhancements ple
-                JOIN waha_enhancements e ON ple.enhancement_id = e.id
-                WHERE ple.entry_id = %s
-            """, (eid,))
-            equipped_enh = cursor.fetchone()
-        except (TypeError, ValueError):
-            equipped_enh = None
-        if equipped_enh:
-            with st.expander(f"✨ Enhancement: {equipped_enh.get('name', '')} (+{equipped_enh.get('cost', 0)} pts)", expanded=True):
-                st.write(equipped_enh.get('description') or '')
+    if equipped_enh:
+        with st.expander(f"✨ Enhancement: {equipped_enh.get('name', '')} (+{equipped_enh.get('cost', 0)} pts)", expanded=True):
+            st.write(equipped_enh.get('description') or '')
     with st.expander("📜 Abilities", expanded=False):
-        ab_raw = _query_id(
-            "SELECT COALESCE(a.name, da.name) as ab_name, COALESCE(a.description, da.description) as ab_desc, da.type FROM waha_datasheets_abilities da LEFT JOIN waha_abilities a ON da.ability_id = a.id WHERE da.datasheet_id = %s ORDER BY CASE WHEN LOWER(TRIM(COALESCE(da.type,''))) = 'faction' THEN 0 WHEN LOWER(TRIM(COALESCE(da.type,''))) = 'datasheet' THEN 1 WHEN LOWER(TRIM(COALESCE(da.type,''))) = 'wargear' THEN 2 WHEN LOWER(TRIM(COALESCE(da.type,''))) LIKE 'special%' THEN 3 ELSE 4 END, ab_name",
-            sid,
-        )
-        ab_list = _dedupe_by_key(ab_raw or [], lambda d: (d.get("ab_name"), d.get("ab_desc"), d.get("type")))
+        ab_list = _dedupe_by_key(data["abilities"].get(sid, []), lambda d: (d.get("ab_name"), d.get("ab_desc"), d.get("type")))
         if ab_list:
             for ab in ab_list:
                 ab_type = (ab.get('type') or '').strip()
@@ -1867,31 +1018,13 @@ def _render_gameday_unit_content(conn, cursor, row, active_list, roster_df, sid,
         else:
             st.caption("No abilities data for this unit.")
     with st.expander("👥 Led By / Can Lead / Transport", expanded=False):
-        _show_led_by_can_lead_transport(cursor, sid)
+        _render_led_by_can_lead_transport(data["leader_names"].get(sid, []), data["can_lead_names"].get(sid, []), ds.get("transport"))
     with st.expander("🎯 Relevant Stratagems", expanded=False):
         try:
-            kw_rows = _query_id("SELECT keyword FROM waha_datasheets_keywords WHERE datasheet_id = %s", sid)
-            unit_keywords = [str(k.get('keyword', '')).upper() for k in (kw_rows or [])]
-            det_id = active_list.get('waha_detachment_id')
-            strats = []
-            if det_id is not None:
-                cursor.execute("""
-                    SELECT name, cp_cost, type, phase, description FROM waha_stratagems
-                    WHERE detachment_id = %s OR CAST(detachment_id AS UNSIGNED) = %s
-                """, (det_id, det_id))
-                strats = list(cursor.fetchall())
-            cursor.execute("""
-                SELECT name, cp_cost, type, phase, description FROM waha_stratagems
-                WHERE (detachment_id IS NULL OR TRIM(COALESCE(detachment_id,'')) = '' OR type LIKE %s)
-            """, ("%Core%",))
-            core_rows = cursor.fetchall()
-            seen_keys = {(_normalize_stratagem_name_for_key(s.get("name") or ""), s.get("cp_cost")) for s in strats}
-            for s in core_rows:
-                k = (_normalize_stratagem_name_for_key(s.get("name") or ""), s.get("cp_cost"))
-                if k not in seen_keys:
-                    seen_keys.add(k)
-                    strats.append(s)
-            strats = _dedupe_stratagems(strats)
+            unit_keywords = data["keywords"].get(sid, [])
+            strats = data.get("stratagem_list")
+            if strats is None:
+                strats = data["stratagem_list"] = _gameday_stratagems(data)
             found_any = False
             faction_upper = (active_list.get('faction_primary') or '').upper()
             for s in strats:
@@ -1919,46 +1052,23 @@ def _render_gameday_unit_content(conn, cursor, row, active_list, roster_df, sid,
             st.caption("Could not load stratagems.")
 
 
-def _resolve_row_datasheet_and_attachment(conn, row, roster_df):
-    """Return (sid, entry_id, led_by_name, leading_name) for a roster row."""
+def _resolve_row_datasheet_and_attachment(row, data):
+    """Return (sid, entry_id, led_by_name, leading_name) for a roster row from the Game-Day prefetch."""
     entry_id = row.get("entry_id") or row.get("Entry_ID")
-    datasheet_id = row.get("datasheet_id")
-    if datasheet_id is None or (hasattr(datasheet_id, "__float__") and pd.isna(datasheet_id)):
-        datasheet_id = row.get("unit_id") or row.get("Unit_ID")
-    if entry_id is not None:
-        try:
-            resolved = get_datasheet_id_for_entry(conn, int(entry_id))
-            if resolved is not None:
-                datasheet_id = resolved
-        except (TypeError, ValueError):
-            pass
-    if datasheet_id is not None:
-        datasheet_id = str(datasheet_id).strip()
-        if datasheet_id.endswith(".0") and datasheet_id[:-2].isdigit():
-            datasheet_id = datasheet_id[:-2]
-    sid = (datasheet_id or "").strip()
-    led_by_leader_name = None
-    leading_unit_name = None
-    if roster_df is not None and not roster_df.empty and entry_id is not None:
-        try:
-            eid_val = int(entry_id) if not (hasattr(entry_id, "__float__") and pd.isna(entry_id)) else None
-        except (TypeError, ValueError):
-            eid_val = None
-        if eid_val is not None:
-            attached_to = row.get("attached_to_entry_id")
-            if attached_to is not None and not (hasattr(attached_to, "__float__") and pd.isna(attached_to)):
-                for _, r in roster_df.iterrows():
-                    if (r.get("entry_id") or r.get("Entry_ID")) == attached_to:
-                        leading_unit_name = r.get("Unit", "Unit")
-                        break
-            for _, r in roster_df.iterrows():
-                if (r.get("attached_to_entry_id") or None) == eid_val:
-                    led_by_leader_name = r.get("Unit", "Leader")
-                    break
-    return sid, entry_id, led_by_leader_name, leading_unit_name
-
-
-def _render_gameday_group_card(conn, cursor, leader_row, bodyguard_row, active_list, roster_df, labels_map):
+    try:
+        eid = int(entry_id) if entry_id is not None and not (hasattr(entry_id, "__float__") and pd.isna(entry_id)) else None
+    except (TypeError, ValueError):
+        eid = None
+    sid = data["sid_by_entry"].get(eid) if eid is not None else None
+    if not sid:
+        datasheet_id = row.get("datasheet_id")
+        if datasheet_id is None or (hasattr(datasheet_id, "__float__") and pd.isna(datasheet_id)):
+            datasheet_id = row.get("unit_id") or row.get("Unit_ID")
+        sid = clean_id(datasheet_id) or ""
+    return sid, eid, data["led_by"].get(eid), data["leading"].get(eid)
+
+
+def _render_gameday_group_card(leader_row, bodyguard_row, active_list, labels_map, data):
     """Render one expander for a leader+bodyguard pair with both units' content."""
     col_eid = "entry_id" if "entry_id" in leader_row else "Entry_ID"
     leader_eid = leader_row.get(col_eid)
@@ -1974,10 +1084,10 @@ def _render_gameday_group_card(conn, cursor, leader_row, bodyguard_row, active_l
     except (TypeError, ValueError):
         total_pts = pts_l + pts_b
     title = f"**{qty_l}x {leader_label}** → **{qty_b}x {body_label}** ({total_pts} pts)"
-    sid_l, eid_l, led_by_l, leading_l = _resolve_row_datasheet_and_attachment(conn, leader_row, roster_df)
-    sid_b, eid_b, led_by_b, leading_b = _resolve_row_datasheet_and_attachment(conn, bodyguard_row, roster_df)
-    leader_img, leader_cap = _get_gameday_unit_image(cursor, eid_l, sid_l)
-    body_img, body_cap = _get_gameday_unit_image(cursor, eid_b, sid_b)
+    sid_l, eid_l, led_by_l, leading_l = _resolve_row_datasheet_and_attachment(leader_row, data)
+    sid_b, eid_b, led_by_b, leading_b = _resolve_row_datasheet_and_attachment(bodyguard_row, data)
+    leader_img, leader_cap = gameday_unit_image(data, eid_l, sid_l)
+    body_img, body_cap = gameday_unit_image(data, eid_b, sid_b)
     with st.expander(title, expanded=False):
         if leader_img or body_img:
             ic1, ic2 = st.columns(2)
@@ -1993,14 +1103,38 @@ def _render_gameday_group_card(conn, cursor, leader_row, bodyguard_row, active_l
                     st.caption(f"{body_label}: no image")
             st.divider()
         st.markdown(f"— **Leader:** {leader_label} —")
-        _render_gameday_unit_content(conn, cursor, leader_row, active_list, roster_df, sid_l, eid_l, led_by_l, leading_l)
+        _render_gameday_unit_content(leader_row, active_list, data, sid_l, eid_l, led_by_l, leading_l)
         st.divider()
         st.markdown(f"— **Unit:** {body_label} —")
-        _render_gameday_unit_content(conn, cursor, bodyguard_row, active_list, roster_df, sid_b, eid_b, led_by_b, leading_b)
+        _render_gameday_unit_content(bodyguard_row, active_list, data, sid_b, eid_b, led_by_b, leading_b)
+
+
+def _gameday_sheet_downloads(active_list, roster_df, total_pts, groups, labels_map, data, rules, cursor):
+    """Download buttons for the printable sheet (gameday_sheet): served from the disk cache while sheet_key is unchanged."""
+    list_id = active_list["list_id"]
+    list_name_safe = re.sub(r"[^\w\-]", "_", (active_list.get("list_name") or "40k_list")[:60])
+    try:
+        key = sheet_key(active_list, roster_df.to_dict("records"), fetch_selection_state(cursor, list_id), data["images"])
+        sheet = cached_sheet(list_id, key, "html")
+        if sheet is None:
+            sheet = store_sheet(list_id, key, "html", build_sheet_html(
+                active_list, total_pts, groups, labels_map, data, rules, _gameday_stratagems(data)))
+        d1, d2 = st.columns(2)
+        d1.download_button("🖨️ Printable sheet (HTML)", data=sheet, file_name=f"{list_name_safe}_gameday.html",
+                           mime="text/html", width="stretch", key=f"gameday_html_{list_id}")
+        if SHEET_PDF_AVAILABLE:
+            pdf = cached_sheet(list_id, key, "pdf")
+            if pdf is None:
+                pdf = store_sheet(list_id, key, "pdf", build_sheet_pdf(
+                    active_list, total_pts, groups, labels_map, data, rules, _gameday_stratagems(data)))
+            d2.download_button("🖨️ Printable sheet (PDF)", data=pdf, file_name=f"{list_name_safe}_gameday.pdf",
+                               mime="application/pdf", width="stretch", key=f"gameday_pdf_{list_id}")
+    except Exception as e:
+        st.caption(f"Printable sheet unavailable: {e}")
 
 
-def show_gameday_view(active_list, roster_df, total_pts):
-    """A fully collapsible tactical sheet with a surgical stacked column layout."""
+def show_gameday_view(active_list, roster_df, total_pts, fingerprint=None):
+    """A fully collapsible tactical sheet with a surgical stacked column layout. With the roster fingerprint, labels, groups and the card prefetch are reused while the list is unchanged."""
     # Print-friendly CSS: stack columns, constrain tables, avoid breaking unit cards across pages
     st.markdown("""
     <style>
@@ -2080,24 +1214,33 @@ def show_gameday_view(active_list, roster_df, total_pts):
                 st.markdown(f"### 🚩 Detachment Rule: {rules.get('detachment_rule_name', '')}")
                 st.write(rules.get('detachment_rule_desc') or '')
 
+    if not roster_df.empty:
+        list_id = active_list["list_id"]
+        labels_map = roster_memo("gameday_labels", list_id, fingerprint, lambda: _gameday_unit_labels(roster_df))
+        groups = roster_memo("gameday_groups", list_id, fingerprint, lambda: _gameday_build_groups(roster_df))
+        # One fixed set of IN (...) queries for every card below (no per-unit round-trips); images are
+        # resolved live since default STL links change from the Digital Library, not the roster
+        data = roster_memo("gameday_data", list_id, fingerprint,
+                           lambda: prefetch_gameday_data(conn, roster_df.to_dict("records"), active_list))
+        data = {**data, "images": gameday_images(conn, data["sid_by_entry"])}
+        _gameday_sheet_downloads(active_list, roster_df, total_pts, groups, labels_map, data, rules, cursor)
+
     st.divider()
 
     # 3. Unit Entries (grouped: leader+bodyguard pairs, then solos; with unit labels A/B/C)
     if roster_df.empty:
         st.info("No units in list. Add units in the editor, then open Game-Day view again.")
     else:
-        labels_map = _gameday_unit_labels(roster_df)
-        groups = _gameday_build_groups(roster_df)
         for leader_row, bodyguard_row in groups:
             try:
                 if leader_row is not None and bodyguard_row is not None:
-                    _render_gameday_group_card(conn, cursor, leader_row, bodyguard_row, active_list, roster_df, labels_map)
+                    _render_gameday_group_card(leader_row, bodyguard_row, active_list, labels_map, data)
                 else:
                     row = bodyguard_row
                     col_eid = "entry_id" if "entry_id" in row else "Entry_ID"
                     eid = row.get(col_eid)
                     unit_label = labels_map.get(int(eid) if eid is not None else None) if eid is not None else None
-                    _render_gameday_unit_card(conn, cursor, row, active_list, roster_df, unit_label=unit_label)
+                    _render_gameday_unit_card(row, active_list, data, unit_label=unit_label)
             except Exception as err:
                 st.warning(f"Could not render unit card: {err}")
                 row = bodyguard_row or leader_row
@@ -2111,8 +1254,25 @@ def show_gameday_view(active_list, roster_df, total_pts):
 
 #part 6/7
 
-def _render_roster_row(row, list_id, active_list, active_det_id, cursor, conn, unit_chapter, is_space_marine, subfactions, roster_df=None, labels_map=None):
-    """Render one roster row. Uses datasheet_id (from roster JOIN) for all lookups. roster_df for leader/bodyguard; labels_map for unit A/B/C labels."""
+def _write_entry(sql, params):
+    """Run one UPDATE/DELETE on play_armylist_entries on its own connection (fragments outlive the run's conn)."""
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(sql, params)
+        conn.commit()
+        cursor.close()
+    finally:
+        conn.close()
+
+
+def _render_roster_row(row, list_id, active_list, active_det_id, unit_chapter, rows_by_eid=None, labels_map=None, pairing=None, points_slots=None):
+    """
+    Render one roster row. Uses datasheet_id (from roster JOIN) for all lookups. rows_by_eid (the
+    roster's dicts by entry id, built once per run) + pairing (w40k_attachments.pair_roster) for leader/bodyguard; labels_map for unit A/B/C
+    labels. The size toggle reprices only this row and redraws points_slots (see _draw_points), then
+    reruns just the calling fragment; attach and delete change other rows and rerun the app.
+    """
     entry_id = row.get("entry_id") or row.get("Entry_ID")
     unit_id = row.get("unit_id") or row.get("Unit_ID")
     datasheet_id = row.get("datasheet_id")  # canonical id from get_roster_40k JOIN
@@ -2129,38 +1289,22 @@ def _render_roster_row(row, list_id, active_list, active_det_id, cursor, conn, u
     # Leader/bodyguard: who is leading this unit? (bodyguard -> leader row); for leaders, which unit they're attached to
     led_by_leader_row = None
     leading_unit_row = None  # for leader rows: the bodyguard unit they're attached to
-    if roster_df is not None and not roster_df.empty and eid_int is not None and "attached_to_entry_id" in roster_df.columns:
-        for _, r in roster_df.iterrows():
-            aid = r.get("attached_to_entry_id")
-            if aid is not None and not (hasattr(aid, "__float__") and pd.isna(aid)):
-                try:
-                    if int(aid) == eid_int:
-                        led_by_leader_row = r  # this row (bodyguard) is led by leader row r
-                except (TypeError, ValueError):
-                    pass
-        # This row is a leader with attached_to_entry_id set — find that bodyguard row for display
-        cur_attached = row.get("attached_to_entry_id")
-        if cur_attached is not None and not (hasattr(cur_attached, "__float__") and pd.isna(cur_attached)):
-            try:
-                want_eid = int(cur_attached)
-                for _, r in roster_df.iterrows():
-                    reid = r.get("entry_id") or r.get("Entry_ID")
-                    if reid is not None and not (hasattr(reid, "__float__") and pd.isna(reid)) and int(reid) == want_eid:
-                        leading_unit_row = r
-                        break
-            except (TypeError, ValueError):
-                pass
+    rows_by_eid = rows_by_eid or {}
+    if pairing is not None and eid_int is not None:
+        if eid_int in pairing.led_by:
+            led_by_leader_row = rows_by_eid.get(pairing.led_by[eid_int])
+        if eid_int in pairing.leading:
+            leading_unit_row = rows_by_eid.get(pairing.leading[eid_int])
 
     r_qty, r_main, r_view, r_del = st.columns([0.15, 0.65, 0.1, 0.1])
     with r_qty:
         min_sz, max_sz = 1, None
         if lookup_id is not None:
             try:
-                cursor.execute("SELECT min_size, max_size FROM view_40k_unit_composition WHERE datasheet_id = %s", (str(lookup_id),))
-                sizes = cursor.fetchone()
+                sizes = load_unit_sizes().get(clean_id(lookup_id))
                 if sizes:
-                    min_sz = int(sizes['min_size']) if sizes.get('min_size') is not None else 1
-                    raw_max = sizes.get('max_size')
+                    min_sz = int(sizes[0]) if sizes[0] is not None else 1
+                    raw_max = sizes[1]
                     max_sz = int(raw_max) if raw_max is not None and raw_max != '' else None
                     if max_sz is not None and max_sz == 0:
                         max_sz = min_sz
@@ -2183,9 +1327,10 @@ def _render_roster_row(row, list_id, active_list, active_det_id, cursor, conn, u
             is_max = (qty == max_sz)
             new_qty = max_sz if not is_max else min_sz
             if st.button(f"{qty} ({'Max' if is_max else 'Min'})", key=f"sz_{entry_id}_{list_id}"):
-                cursor.execute("UPDATE play_armylist_entries SET quantity = %s WHERE entry_id = %s", (new_qty, entry_id))
-                conn.commit()
-                st.rerun()
+                _set_entry_quantity(list_id, entry_id, new_qty)
+                if points_slots:
+                    _draw_points(active_list, _session_roster(list_id), points_slots)
+                st.rerun(scope="fragment")
         else:
             st.write(f"👤 {qty}")
     with r_main:
@@ -2208,40 +1353,19 @@ def _render_roster_row(row, list_id, active_list, active_det_id, cursor, conn, u
             unit_name_leading = leading_unit_row.get("Unit", "Unit")
             st.caption(f"👤 **Attached to:** {unit_name_leading}")
         # Leader attach dropdown: valid bodyguard units in this list
-        if lookup_id is not None and _is_leader(cursor, lookup_id) and roster_df is not None and not roster_df.empty and eid_int is not None:
-            valid_ids = _valid_bodyguard_datasheet_ids(cursor, lookup_id)
-            def _norm_dsid(v):
-                if v is None or (hasattr(v, "__float__") and pd.isna(v)):
-                    return ""
-                s = str(v).strip()
-                if s.endswith(".0") and s[:-2].isdigit():
-                    s = s[:-2]
-                return s
+        if pairing is not None and eid_int in pairing.bodyguards:
             options_entry_ids = [None]
             options_labels = ["— None —"]
-            for _, r in roster_df.iterrows():
+            for o_eid_int in pairing.bodyguards[eid_int]:
+                r = rows_by_eid[o_eid_int]
+                o_qty = r.get("Qty", 1)
+                o_unit = r.get("Unit", "Unit")
                 try:
-                    o_eid_raw = r.get("entry_id") or r.get("Entry_ID")
-                    if o_eid_raw is not None and not (hasattr(o_eid_raw, "__float__") and pd.isna(o_eid_raw)) and int(o_eid_raw) == eid_int:
-                        continue
+                    o_qty = int(float(o_qty)) if o_qty is not None else 1
                 except (TypeError, ValueError):
-                    pass
-                other_dsid = _norm_dsid(r.get("datasheet_id") or r.get("unit_id"))
-                if other_dsid and other_dsid in valid_ids:
-                    o_eid = r.get("entry_id") or r.get("Entry_ID")
-                    try:
-                        o_eid_int = int(o_eid) if o_eid is not None and not (hasattr(o_eid, "__float__") and pd.isna(o_eid)) else None
-                    except (TypeError, ValueError):
-                        o_eid_int = None
-                    if o_eid_int is not None:
-                        o_qty = r.get("Qty", 1)
-                        o_unit = r.get("Unit", "Unit")
-                        try:
-                            o_qty = int(float(o_qty)) if o_qty is not None else 1
-                        except (TypeError, ValueError):
-                            o_qty = 1
-                        options_entry_ids.append(o_eid_int)
-                        options_labels.append(f"{o_qty}x {o_unit}")
+                    o_qty = 1
+                options_entry_ids.append(o_eid_int)
+                options_labels.append(f"{o_qty}x {o_unit}")
             current_attached = row.get("attached_to_entry_id")
             if current_attached is None or (hasattr(current_attached, "__float__") and pd.isna(current_attached)):
                 current_attached = None
@@ -2264,18 +1388,18 @@ def _render_roster_row(row, list_id, active_list, active_det_id, cursor, conn, u
             new_attached = options_entry_ids[sel]
             if new_attached != current_attached:
                 try:
-                    cursor.execute(
+                    _write_entry(
                         "UPDATE play_armylist_entries SET attached_to_entry_id = %s WHERE entry_id = %s",
                         (new_attached, eid_int),
                     )
-                    conn.commit()
-                    st.rerun()
                 except Exception:
                     pass
+                else:
+                    st.rerun()
     with r_view:
         # Same pattern as OPR: pass (unit_id from row, entry_id from row). Row's datasheet_id = same id as library picker.
         if (lookup_id or unit_id) is not None and st.button("👁️", key=f"v_roster_{entry_id}_{list_id}"):
-            uid = _normalize_unit_id(lookup_id or unit_id) or str(lookup_id or unit_id)
+            uid = clean_id(lookup_id or unit_id) or str(lookup_id or unit_id)
             try:
                 eid = int(entry_id) if entry_id is not None and not (hasattr(entry_id, "__float__") and pd.isna(entry_id)) else None
             except (TypeError, ValueError):
@@ -2283,155 +1407,75 @@ def _render_roster_row(row, list_id, active_list, active_det_id, cursor, conn, u
             show_40k_details(uid, entry_id=eid, detachment_id=active_det_id, faction=active_list.get("faction_primary"), game_system="40K_10E")
     with r_del:
         if entry_id is not None and st.button("❌", key=f"d_{entry_id}"):
-            cursor.execute("DELETE FROM play_armylist_entries WHERE entry_id = %s", (entry_id,))
-            conn.commit()
+            _write_entry("DELETE FROM play_armylist_entries WHERE entry_id = %s", (entry_id,))
             st.rerun()
 
 
-# --- 2. MAIN BUILDER ---
-
-def run_40k_builder(active_list):
-    list_id = active_list['list_id']
-    primary_army = active_list['faction_primary']
-    active_det_id = active_list.get('waha_detachment_id')
-    conn = get_db_connection()
-    cursor = conn.cursor(dictionary=True)
-
-    # A. Roster fetch via JOIN so every row has canonical datasheet_id for lookups
-    total_pts = 0
-    cached_roster_df = pd.DataFrame()
+@st.fragment
+def _roster_row_fragment(list_id, entry_id, view):
+    """
+    One roster row as its own fragment: its buttons rerun only this row (plus the points slots).
+    A fragment rerun gets the args of the full run that created it; view holds active_list,
+    active_det_id, unit_chapter, labels_map, pairing, points_slots and rows_by_eid from that run.
+    rows_by_eid points at the session roster's dicts, which fragment reruns update in place, so the
+    row read here is current.
+    """
+    row = view["rows_by_eid"].get(entry_id)
+    if row is None:
+        return
     try:
-        roster_rows = get_roster_40k(conn, list_id)
-        if roster_rows:
-            cached_roster_df = pd.DataFrame(roster_rows)
-            total_pts = int(pd.to_numeric(cached_roster_df.get("Total_Pts", 0), errors="coerce").fillna(0).sum())
-    except Exception as e:
-        st.error(f"Could not load roster: {e}")
-        cached_roster_df = pd.DataFrame()
+        _render_roster_row(row, list_id, view["active_list"], view["active_det_id"], view["unit_chapter"],
+                           view["rows_by_eid"], view["labels_map"], view["pairing"], view["points_slots"])
+    except Exception as err:
+        st.warning(f"Could not render one row: {err}")
+        st.write(f"**{row.get('Unit', 'Unit')}** — {row.get('Total_Pts', 0)} pts")
 
-    # B. Master Sidebar UI
-    show_points_summary(active_list, total_pts)
-    
-    st.sidebar.divider()
-    proxy_mode = st.sidebar.toggle("🔓 Proxy Mode (bypass all restrictions)", value=False,
-                                   help="Bypass chapter and validation restrictions (e.g. narrative/proxy lists). For mixed chapters only, use 'Custom (mix chapters)' in Chapter instead.",
-                                   key=f"proxy_master_{list_id}")
 
-    show_40k_validation(list_id, proxy_mode=proxy_mode)
-    
-    st.sidebar.divider()
-    
-    # C. Detachment Selector
-    cursor.execute("SELECT id FROM waha_factions WHERE name = %s", (primary_army,))
-    f_res = cursor.fetchone()
-    if f_res:
-        cursor.execute("SELECT id, name FROM waha_detachments WHERE faction_id = %s", (f_res['id'],))
-        dets = cursor.fetchall(); det_map = {d['name']: d['id'] for d in dets}
-        if det_map:
-            current_idx = 0
-            if active_det_id:
-                for i, name in enumerate(det_map.keys()):
-                    if det_map[name] == active_det_id: current_idx = i
-            sel_det = st.sidebar.selectbox("Select Detachment", list(det_map.keys()), index=current_idx, key=f"det_sel_{list_id}")
-            if det_map[sel_det] != active_det_id:
-                cursor.execute("UPDATE play_armylists SET waha_detachment_id = %s WHERE list_id = %s", (det_map[sel_det], list_id))
-                conn.commit(); st.rerun()
-            active_det_id = det_map[sel_det]
+def _resolve_library_datasheet_id(unit):
+    """waha_datasheet_id to store for a picker unit: its id if known, else the first datasheet with its name."""
+    candidate_id = clean_id(unit.get("id")) or str(unit.get("id", ""))
+    try:
+        datasheets = load_waha_datasheets()
+        if candidate_id in datasheets:
+            return candidate_id
+        if unit.get("name"):
+            for sid, d in datasheets.items():
+                if d.get("name") == unit["name"]:
+                    return sid
+    except Exception:
+        pass
+    return candidate_id
 
-    # D. Subfaction Logic (Space Marine chapters: persist so validation and rules are chapter-aware)
-    is_space_marine = (primary_army in ["Space Marines", "Adeptus Astartes"])
-    library_subfaction = None
-    subfactions = []
-    saved_chapter = active_list.get("chapter_subfaction")  # from DB after migration
-    if is_space_marine:
-        exclude_list = [primary_army, 'Adeptus Astartes', 'Agents of the Imperium', 'Character', 'Infantry', 'Vehicle', 'Epic Hero', 'Battleline', 'Imperium']
-        exclude_placeholders = ', '.join(['%s'] * len(exclude_list))
-        cursor.execute(f"SELECT DISTINCT keyword FROM waha_datasheets_keywords dk JOIN waha_datasheets d ON dk.datasheet_id = d.waha_datasheet_id JOIN waha_factions f ON d.faction_id = f.id WHERE (f.name = %s OR f.id = 'SM') AND dk.keyword NOT IN ({exclude_placeholders}) AND dk.is_faction_keyword = 1", [primary_army] + exclude_list)
-        subfactions = [f['keyword'] for f in cursor.fetchall()]
-        if subfactions:
-            options = ["Generic / All"] + sorted(subfactions) + ["Custom (mix chapters)"]
-            try:
-                if saved_chapter == CHAPTER_CUSTOM:
-                    default_idx = options.index("Custom (mix chapters)")
-                elif saved_chapter and saved_chapter in options:
-                    default_idx = options.index(saved_chapter)
-                else:
-                    default_idx = 0
-            except (ValueError, TypeError):
-                default_idx = 0
-            selected_sub = st.sidebar.selectbox("Select Chapter", options, index=min(default_idx, len(options) - 1), key=f"subfac_{list_id}", help="Generic = all faction units. Pick a chapter to filter. Custom = mix units from any chapter (e.g. successor/homebrew).")
-            if selected_sub not in ("Generic / All", "Custom (mix chapters)"):
-                library_subfaction = selected_sub
-            # Persist so view_list_validation_40k and reloads use it; CUSTOM = allow mixed chapters
-            new_chapter = CHAPTER_CUSTOM if selected_sub == "Custom (mix chapters)" else (selected_sub if selected_sub != "Generic / All" else None)
-            if new_chapter != saved_chapter:
-                try:
-                    cursor.execute("UPDATE play_armylists SET chapter_subfaction = %s WHERE list_id = %s", (new_chapter, list_id))
-                    conn.commit()
-                    st.rerun()
-                except Exception:
-                    pass  # column may not exist until migration is run
 
-    # E. Library Picker (deduped, grouped by role, paginated)
-    st.sidebar.divider()
-    st.sidebar.subheader("📚 Add from Library")
-    allies = ['Imperial Agents', 'Imperial Knights'] if is_space_marine else []
-    allow_allies = st.sidebar.toggle("Include Allied Units", value=False, key=f"ally_{list_id}") if allies else False
-    search = st.sidebar.text_input("Search Units", key=f"search_{list_id}", placeholder="Search by unit name...")
+@st.fragment
+def _library_picker(list_id, primary_army, allies, library_subfaction, subfactions, proxy_mode, active_det_id):
+    """
+    Sidebar "Add from Library" as its own fragment (call inside `with st.sidebar:`): search, sort,
+    grouping and paging rerun only the picker, not the roster, validation or rules. Add changes the
+    roster and reruns the app. In-list counts come from the session roster of the last full run.
+    """
+    st.divider()
+    st.subheader("📚 Add from Library")
+    allow_allies = st.toggle("Include Allied Units", value=False, key=f"ally_{list_id}") if allies else False
+    search = st.text_input("Search Units", key=f"search_{list_id}", placeholder="Search by unit name...")
     lib_limit = 500
-    # view_master_picker: some DBs have game_system, others have system; try game_system first
-    if proxy_mode:
-        lib_query = f"SELECT * FROM view_master_picker WHERE game_system = '40K' AND (faction = %s {'OR faction IN (%s, %s)' if allow_allies else ''}) AND name LIKE %s ORDER BY name LIMIT {lib_limit}"
-        params = [primary_army] + (allies if allow_allies else []) + [f"%{search}%"]
-    elif library_subfaction:
-        sub_placeholders = ', '.join(['%s'] * len(subfactions))
-        lib_query = f"SELECT DISTINCT m.* FROM view_master_picker m WHERE m.game_system = '40K' AND m.name LIKE %s AND ((m.faction = %s AND (EXISTS (SELECT 1 FROM waha_datasheets_keywords dk WHERE dk.datasheet_id = m.id AND dk.keyword = %s) OR NOT EXISTS (SELECT 1 FROM waha_datasheets_keywords dk WHERE dk.datasheet_id = m.id AND dk.keyword IN ({sub_placeholders})))) {'OR m.faction IN (%s, %s)' if allow_allies else ''}) ORDER BY m.name LIMIT {lib_limit}"
-        params = [f"%{search}%", primary_army, library_subfaction] + subfactions + (allies if allow_allies else [])
-    else:
-        lib_query = f"SELECT * FROM view_master_picker WHERE game_system = '40K' AND (faction = %s {'OR faction IN (%s, %s)' if allow_allies else ''}) AND name LIKE %s ORDER BY name LIMIT {lib_limit}"
-        params = [primary_army] + (allies if allow_allies else []) + [f"%{search}%"]
-    cursor.execute(lib_query, params)
-    raw_units = cursor.fetchall()
-    # Strict dedupe by normalized id (avoids duplicate entries from view/joins)
-    unique_units = []
-    seen_nid = set()
-    for u in raw_units:
-        nid = _normalize_unit_id(u.get("id")) or str(u.get("id") or "")
-        if nid and nid in seen_nid:
-            continue
-        seen_nid.add(nid)
-        unique_units.append(u)
-    # Batch-fetch keywords for all unique unit ids (for role/type grouping)
-    unit_keywords = {}
-    if unique_units:
-        ids = [_normalize_unit_id(u.get("id")) or str(u.get("id") or "") for u in unique_units]
-        ids = [i for i in ids if i]
-        if ids:
-            placeholders = ", ".join(["%s"] * len(ids))
-            try:
-                cursor.execute(
-                    f"SELECT datasheet_id, GROUP_CONCAT(keyword SEPARATOR ', ') AS kw FROM waha_datasheets_keywords WHERE datasheet_id IN ({placeholders}) GROUP BY datasheet_id",
-                    ids,
-                )
-                for row in cursor.fetchall():
-                    did = row.get("datasheet_id")
-                    if did is not None:
-                        did = str(did).strip()
-                        if did.endswith(".0") and did[:-2].isdigit():
-                            did = did[:-2]
-                        unit_keywords[did] = row.get("kw") or ""
-            except Exception:
-                pass
-    # Attach role for grouping and sort options
-    for u in unique_units:
-        nid = _normalize_unit_id(u.get("id")) or str(u.get("id") or "")
-        kw = unit_keywords.get(nid, "")
-        order, label = _unit_role_from_keywords(kw)
-        u["_role_order"] = order
-        u["_role_label"] = label
+    # Search, chapter filter, allies and role grouping run on the cached per-faction picker index
+    # (rebuilt only when the waha data version changes), not a LIKE query per keystroke.
+    try:
+        unique_units = search_picker_units(
+            primary_army,
+            allies if allow_allies else [],
+            search,
+            subfaction=None if proxy_mode else library_subfaction,
+            subfactions=subfactions,
+            limit=lib_limit,
+        )
+    except Exception as e:
+        st.error(f"Could not load library: {e}")
+        unique_units = []
     sort_options_40k = ["By role (default)", "Name A–Z", "Name Z–A", "Points ↑", "Points ↓"]
-    sort_choice_40k = st.sidebar.selectbox("Sort by", sort_options_40k, key=f"40k_sort_{list_id}")
-    group_by_role_40k = st.sidebar.toggle("Group by role", value=True, key=f"40k_group_{list_id}")
+    sort_choice_40k = st.selectbox("Sort by", sort_options_40k, key=f"40k_sort_{list_id}")
+    group_by_role_40k = st.toggle("Group by role", value=True, key=f"40k_group_{list_id}")
 
     def _w40k_sort_key(u):
         name = (u.get("name") or u.get("id") or "").lower()
@@ -2453,16 +1497,10 @@ def run_40k_builder(active_list):
         unique_units.reverse()
     # Roster counts for "in list" hint
     roster_unit_counts = {}
-    if not cached_roster_df.empty:
-        col = "datasheet_id" if "datasheet_id" in cached_roster_df.columns else "unit_id"
-        if col in cached_roster_df.columns:
-            for _, r in cached_roster_df.iterrows():
-                vid = r.get(col)
-                if vid is not None and not (hasattr(vid, "__float__") and pd.isna(vid)):
-                    vid = str(vid).strip()
-                    if vid.endswith(".0") and vid[:-2].isdigit():
-                        vid = vid[:-2]
-                    roster_unit_counts[vid] = roster_unit_counts.get(vid, 0) + 1
+    for r in _session_roster(list_id):
+        vid = clean_id(r.get("datasheet_id") or r.get("unit_id"))
+        if vid:
+            roster_unit_counts[vid] = roster_unit_counts.get(vid, 0) + 1
     # Pagination
     lib_page_key = f"lib_page_{list_id}"
     if lib_page_key not in st.session_state:
@@ -2474,21 +1512,21 @@ def run_40k_builder(active_list):
     start_idx = current_page * page_size
     page_units = unique_units[start_idx : start_idx + page_size]
     if not unique_units:
-        st.sidebar.info("No units match. Try a different search or check faction/detachment.")
+        st.info("No units match. Try a different search or check faction/detachment.")
     else:
-        st.sidebar.caption(f"{len(unique_units)} units · Page {current_page + 1} of {total_pages}")
+        st.caption(f"{len(unique_units)} units · Page {current_page + 1} of {total_pages}")
         if total_pages > 1:
             prev_disabled = current_page <= 0
             next_disabled = current_page >= total_pages - 1
-            p1, p2, p3 = st.sidebar.columns([1, 1, 1])
+            p1, p2, p3 = st.columns([1, 1, 1])
             with p1:
                 if st.button("◀ Prev", key=f"lib_prev_{list_id}", disabled=prev_disabled):
                     st.session_state[lib_page_key] = current_page - 1
-                    st.rerun()
+                    st.rerun(scope="fragment")
             with p3:
                 if st.button("Next ▶", key=f"lib_next_{list_id}", disabled=next_disabled):
                     st.session_state[lib_page_key] = current_page + 1
-                    st.rerun()
+                    st.rerun(scope="fragment")
     # Group by role (optional) and render current page
     current_role = None
     for unit in page_units:
@@ -2496,11 +1534,11 @@ def run_40k_builder(active_list):
             role_label = unit.get("_role_label") or "Other"
             if role_label != current_role:
                 current_role = role_label
-                st.sidebar.markdown(f"**{role_label}**")
+                st.markdown(f"**{role_label}**")
         uid = unit.get("id")
-        nid = _normalize_unit_id(uid) or str(uid or "")
+        nid = clean_id(uid) or str(uid or "")
         in_list_count = roster_unit_counts.get(nid, 0) if nid else 0
-        c1, c2, c3 = st.sidebar.columns([0.6, 0.2, 0.2])
+        c1, c2, c3 = st.columns([0.6, 0.2, 0.2])
         display_name = f"⭐ {unit.get('name')}" if unit.get('faction') in allies else (unit.get('name') or unit.get('id') or "—")
         pts = unit.get('points') or unit.get('Points') or 0
         line2 = f"{pts} pts"
@@ -2508,45 +1546,125 @@ def run_40k_builder(active_list):
             line2 += f" · In list: {in_list_count}"
         c1.write(f"**{display_name}**\n{line2}")
         if c2.button("Add", key=f"add_{unit.get('id')}_{list_id}"):
-            candidate_id = _normalize_unit_id(unit.get("id")) or str(unit.get("id", ""))
-            resolved_id = None
-            try:
-                cursor.execute("SELECT waha_datasheet_id FROM waha_datasheets WHERE waha_datasheet_id = %s LIMIT 1", (candidate_id,))
-                row = cursor.fetchone()
-                if row and row.get("waha_datasheet_id") is not None:
-                    resolved_id = str(row["waha_datasheet_id"]).strip()
-                    if resolved_id.endswith(".0") and resolved_id[:-2].isdigit():
-                        resolved_id = resolved_id[:-2]
-                if not resolved_id and unit.get("name"):
-                    cursor.execute("SELECT waha_datasheet_id FROM waha_datasheets WHERE name = %s LIMIT 1", (unit["name"],))
-                    row = cursor.fetchone()
-                    if row and row.get("waha_datasheet_id") is not None:
-                        resolved_id = str(row["waha_datasheet_id"]).strip()
-            except Exception:
-                pass
-            unit_id_to_store = resolved_id if resolved_id else candidate_id
+            unit_id_to_store = _resolve_library_datasheet_id(unit)
             start_qty = 1
             try:
-                cursor.execute("SELECT min_size FROM view_40k_unit_composition WHERE datasheet_id = %s", (unit_id_to_store,))
-                sz = cursor.fetchone()
-                if sz and sz.get("min_size") is not None:
-                    start_qty = int(sz["min_size"])
+                min_size = load_unit_sizes().get(unit_id_to_store, (None, None))[0]
+                if min_size is not None:
+                    start_qty = int(min_size)
             except Exception:
                 pass
+            conn = get_db_connection()
             try:
                 add_unit_40k(conn, list_id, unit_id_to_store, start_qty)
-                st.rerun()
             except Exception as ex:
                 st.error(str(ex))
+            else:
+                st.rerun()
+            finally:
+                conn.close()
         if c3.button("👁️", key=f"lib_det_{unit.get('id')}_{list_id}", help="Preview unit"):
-            uid = _normalize_unit_id(unit.get('id')) or str(unit.get('id', ''))
+            uid = clean_id(unit.get('id')) or str(unit.get('id', ''))
             show_40k_details(uid, detachment_id=active_det_id)
 
-    # --- DB query results (debug) ---
+
+# --- 2. MAIN BUILDER ---
+
+def run_40k_builder(active_list):
+    list_id = active_list['list_id']
+    primary_army = active_list['faction_primary']
+    active_det_id = active_list.get('waha_detachment_id')
+    conn = get_db_connection()
+    cursor = conn.cursor(dictionary=True)
+
+    # A. Roster fetch via JOIN so every row has canonical datasheet_id for lookups.
+    # Reused while the roster fingerprint is unchanged (one small query instead of the roster load).
+    # The rows are kept in session state so the row and picker fragments can read (and reprice) them.
+    total_pts = 0
+    roster_rows = []
+    cached_roster_df = pd.DataFrame()
+    fingerprint = None
+    try:
+        fingerprint = roster_fingerprint(cursor, list_id)
+    except Exception:
+        pass
+    try:
+        roster_rows = [dict(r) for r in roster_memo("roster_40k", list_id, fingerprint, lambda: get_roster_40k(conn, list_id))]
+        if roster_rows:
+            cached_roster_df = pd.DataFrame(roster_rows)
+            total_pts = _roster_total(roster_rows)
+    except Exception as e:
+        st.error(f"Could not load roster: {e}")
+        cached_roster_df = pd.DataFrame()
+    st.session_state[_roster_state_key(list_id)] = roster_rows
+
+    # B. Master Sidebar UI (points in a slot a roster row fragment can redraw)
+    points_slots = {"summary": st.sidebar.empty(), "metric": None}
+    show_points_summary(active_list, total_pts, points_slots["summary"].container())
+    
+    st.sidebar.divider()
+    proxy_mode = st.sidebar.toggle("🔓 Proxy Mode (bypass all restrictions)", value=False,
+                                   help="Bypass chapter and validation restrictions (e.g. narrative/proxy lists). For mixed chapters only, use 'Custom (mix chapters)' in Chapter instead.",
+                                   key=f"proxy_master_{list_id}")
+
+    show_40k_validation(list_id, proxy_mode=proxy_mode, roster=cached_roster_df, faction_primary=primary_army, fingerprint=fingerprint)
+    
+    st.sidebar.divider()
+    
+    # C. Detachment Selector
+    det_map = {name: det_id for det_id, name in load_detachments(primary_army)}
+    if det_map:
+        current_idx = 0
+        if active_det_id:
+            for i, name in enumerate(det_map.keys()):
+                if det_map[name] == active_det_id: current_idx = i
+        sel_det = st.sidebar.selectbox("Select Detachment", list(det_map.keys()), index=current_idx, key=f"det_sel_{list_id}")
+        if det_map[sel_det] != active_det_id:
+            cursor.execute("UPDATE play_armylists SET waha_detachment_id = %s WHERE list_id = %s", (det_map[sel_det], list_id))
+            conn.commit(); st.rerun()
+        active_det_id = det_map[sel_det]
+
+    # D. Subfaction Logic (Space Marine chapters: persist so validation and rules are chapter-aware)
+    is_space_marine = (primary_army in ["Space Marines", "Adeptus Astartes"])
+    library_subfaction = None
+    subfactions = []
+    saved_chapter = active_list.get("chapter_subfaction")  # from DB after migration
+    if is_space_marine:
+        subfactions = list(load_chapter_keywords(primary_army))
+        if subfactions:
+            options = ["Generic / All"] + sorted(subfactions) + ["Custom (mix chapters)"]
+            try:
+                if saved_chapter == CHAPTER_CUSTOM:
+                    default_idx = options.index("Custom (mix chapters)")
+                elif saved_chapter and saved_chapter in options:
+                    default_idx = options.index(saved_chapter)
+                else:
+                    default_idx = 0
+            except (ValueError, TypeError):
+                default_idx = 0
+            selected_sub = st.sidebar.selectbox("Select Chapter", options, index=min(default_idx, len(options) - 1), key=f"subfac_{list_id}", help="Generic = all faction units. Pick a chapter to filter. Custom = mix units from any chapter (e.g. successor/homebrew).")
+            if selected_sub not in ("Generic / All", "Custom (mix chapters)"):
+                library_subfaction = selected_sub
+            # Persist so view_list_validation_40k and reloads use it; CUSTOM = allow mixed chapters
+            new_chapter = CHAPTER_CUSTOM if selected_sub == "Custom (mix chapters)" else (selected_sub if selected_sub != "Generic / All" else None)
+            if new_chapter != saved_chapter:
+                try:
+                    cursor.execute("UPDATE play_armylists SET chapter_subfaction = %s WHERE list_id = %s", (new_chapter, list_id))
+                    conn.commit()
+                    st.rerun()
+                except Exception:
+                    pass  # column may not exist until migration is run
+
+    # E. Library Picker (its own fragment: typing a search reruns only the picker)
+    allies = ['Imperial Agents', 'Imperial Knights'] if is_space_marine else []
+    with st.sidebar:
+        _library_picker(list_id, primary_army, allies, library_subfaction, subfactions, proxy_mode, active_det_id)
+
+    # --- DB query results (debug; only run when asked, not on every rerun) ---
     with st.sidebar.expander("🔧 DB query results", expanded=False):
         st.caption("Queries that drive roster, unit details, and validation. Use to verify joins.")
         try:
-            debug_sections = get_debug_query_results(conn, list_id)
+            debug_sections = get_debug_query_results(conn, list_id) if st.checkbox("Run debug queries", key=f"dbg_q_{list_id}") else []
             for sec in debug_sections:
                 st.caption(sec["name"])
                 if sec["error"]:
@@ -2596,7 +1714,7 @@ def run_40k_builder(active_list):
 
     # 2. Logic Branch: Game-Day vs. Editor
     if st.session_state.gameday_mode:
-        show_gameday_view(active_list, cached_roster_df, total_pts)
+        show_gameday_view(active_list, cached_roster_df, total_pts, fingerprint)
     else:
         try:
             # --- 1. DYNAMIC ARMY & DETACHMENT RULES ---
@@ -2660,20 +1778,16 @@ def run_40k_builder(active_list):
                     st.divider()
         # --- 3. ROSTER LISTING (Interactive Editor) ---
         if not cached_roster_df.empty:
-            st.metric("Total Points", f"{total_pts} / {active_list['point_limit']}")
+            points_slots["metric"] = st.empty()
+            points_slots["metric"].metric("Total Points", f"{total_pts} / {active_list['point_limit']}")
             unit_chapter = {}
             try:
                 if is_space_marine and subfactions:
-                    col = "datasheet_id" if "datasheet_id" in cached_roster_df.columns else "unit_id"
-                    if col in cached_roster_df.columns:
-                        uids = cached_roster_df[col].dropna().unique().tolist()
-                        uids = [str(u).strip() for u in uids if u is not None and not (hasattr(u, "__float__") and pd.isna(u))]
-                        if uids:
-                            ph = ",".join(["%s"] * len(uids))
-                            sub_ph = ",".join(["%s"] * len(subfactions))
-                            cursor.execute(f"SELECT datasheet_id, keyword FROM waha_datasheets_keywords WHERE datasheet_id IN ({ph}) AND is_faction_keyword = 1 AND keyword IN ({sub_ph})", uids + subfactions)
-                            for r in cursor.fetchall():
-                                unit_chapter[str(r["datasheet_id"]).strip()] = r["keyword"]
+                    unit_chapter = roster_memo(
+                        "unit_chapters", list_id, fingerprint,
+                        lambda: unit_chapters([r.get("datasheet_id") or r.get("unit_id") for r in roster_rows], subfactions),
+                        tuple(subfactions),
+                    )
             except Exception:
                 pass
             # Re-open unit details after STL add/remove so the dialog stays in context (library_ui sets reopen_unit_details before st.rerun())
@@ -2686,19 +1800,32 @@ def run_40k_builder(active_list):
                         match = cached_roster_df[cached_roster_df[ecol] == eid]
                         if not match.empty:
                             r = match.iloc[0]
-                            uid = _normalize_unit_id(r.get("datasheet_id") or r.get("unit_id")) or str(r.get("datasheet_id") or r.get("unit_id") or "")
+                            uid = clean_id(r.get("datasheet_id") or r.get("unit_id")) or str(r.get("datasheet_id") or r.get("unit_id") or "")
                             try:
                                 eid_int = int(eid) if eid is not None and not (hasattr(eid, "__float__") and pd.isna(eid)) else None
                             except (TypeError, ValueError):
                                 eid_int = None
                             show_40k_details(uid, entry_id=eid_int, detachment_id=active_det_id, faction=active_list.get("faction_primary"), game_system="40K_10E")
-            labels_map = _gameday_unit_labels(cached_roster_df)
-            for i, row in cached_roster_df.iterrows():
-                try:
-                    _render_roster_row(row, list_id, active_list, active_det_id, cursor, conn, unit_chapter, is_space_marine, subfactions, cached_roster_df, labels_map)
-                except Exception as err:
-                    st.warning(f"Could not render one row: {err}")
-                    st.write(f"**{row.get('Unit', 'Unit')}** — {row.get('Total_Pts', 0)} pts")
+            labels_map = roster_memo("gameday_labels", list_id, fingerprint, lambda: _gameday_unit_labels(cached_roster_df))
+            try:
+                pairing = roster_memo("pairing", list_id, fingerprint,
+                                      lambda: pair_roster(cached_roster_df.to_dict("records"), load_attachment_graph()))
+            except Exception:
+                pairing = pair_roster(cached_roster_df.to_dict("records"))
+            # Entry id -> row once per run (the session roster's dicts), shared by every row below
+            rows_by_eid = {}
+            for row in roster_rows:
+                eid = entry_int(row.get("entry_id"))
+                if eid is not None:
+                    rows_by_eid.setdefault(eid, row)
+            # Each row is a fragment: a size toggle reruns only that row and the points slots
+            view = {
+                "active_list": active_list, "active_det_id": active_det_id, "unit_chapter": unit_chapter,
+                "labels_map": labels_map, "pairing": pairing, "points_slots": points_slots,
+                "rows_by_eid": rows_by_eid,
+            }
+            for eid in rows_by_eid:
+                _roster_row_fragment(list_id, eid, view)
         else:
             st.info("Roster is empty. Add units from the sidebar library.")
 
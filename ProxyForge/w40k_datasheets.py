@@ -0,0 +1,675 @@
+"""
+40K datasheet data layer: set-based loaders for waha_* template data.
+
+prefetch_gameday_data() loads everything the Game-Day view needs for a whole roster (models,
+composition, loadout, wargear, abilities, keywords, leader links, transport, enhancements,
+stratagems) with a fixed number of IN (...) queries, so a render costs the same number of DB
+round-trips whether the list has 3 units or 30. Leader links come from the cached attachment graph
+(w40k_attachments). Card images (gameday_images) are resolved separately on every render: default
+STL links change from the Digital Library without touching the roster.
+
+load_datasheet_bundle() compiles one datasheet's template data into an immutable DatasheetBundle for
+the unit details dialog. Bundles are memoized process-wide (LRU-bounded, invalidated by the waha data
+version), so reopening a unit only queries per-entry state (quantity, wargear picks, enhancements).
+
+search_picker_units() serves the library picker from per-faction PickerIndex objects (name index,
+role, keyword sets), also cached per waha data version, so typing in the search box never hits MySQL.
+"""
+
+import re
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Optional
+
+from database_utils import get_db_connection
+from datasheet_ids import clean_id, entry_int, rows_by_datasheet
+from name_index import NameIndex
+from w40k_attachments import load_attachment_graph, pair_roster
+from reference_cache import fetch_all, keywords_by_datasheet, load_unit_sizes, load_waha_rows, reference_data
+from unit_images import resolve_unit_images
+from wargear_parser import _compute_base_weapon_counts, _split_and_list, _strip_option_html, normalize_weapon_name, parsed_option
+
+
+def _placeholders(values):
+    return ", ".join(["%s"] * len(values))
+
+
+def _group(rows, key, strip_key=True):
+    """Group rows by rows[key] (cleaned id) preserving query order; the key column is dropped."""
+    out = {}
+    for r in rows:
+        r = dict(r)
+        k = r.pop(key) if strip_key else r.get(key)
+        out.setdefault(clean_id(k), []).append(r)
+    return out
+
+
+def fetch_stratagems(cursor, detachment_id):
+    """Detachment stratagems plus Core/generic ones (raw rows; caller dedupes)."""
+    strats = []
+    if detachment_id is not None:
+        cursor.execute("""
+            SELECT name, cp_cost, type, phase, description FROM waha_stratagems
+            WHERE detachment_id = %s OR CAST(detachment_id AS UNSIGNED) = %s
+        """, (detachment_id, detachment_id))
+        strats = list(cursor.fetchall())
+    cursor.execute("""
+        SELECT name, cp_cost, type, phase, description FROM waha_stratagems
+        WHERE (detachment_id IS NULL OR TRIM(COALESCE(detachment_id,'')) = '' OR type LIKE %s)
+    """, ("%Core%",))
+    return strats, list(cursor.fetchall())
+
+
+def prefetch_gameday_data(conn, roster_rows, active_list):
+    """
+    Load Game-Day card data for every unit in the roster. roster_rows: iterable of roster dicts
+    (get_roster_40k rows or DataFrame records). Returns a dict:
+      sid_by_entry    {entry_id: datasheet_id}
+      name_by_entry   {entry_id: unit name}
+      leading         {entry_id: name of the unit this entry is attached to (it leads)}
+      led_by          {entry_id: name of the leader attached to this entry}
+      datasheet       {sid: {name, loadout, transport, image_url}}
+      models, composition, wargear, abilities   {sid: [rows]}
+      keywords        {sid: [KEYWORD upper]}
+      leader_names    {sid: [names that can lead it]}
+      can_lead_names  {sid: [names it can lead]}
+      enhancement     {entry_id: {name, description, cost}}
+      images          {} (filled per render from gameday_images(), not part of the roster memo)
+      stratagems      (detachment_rows, core_rows)
+    Every table is one query regardless of roster size. Missing tables/columns leave that key empty.
+    """
+    rows = [dict(r) for r in (roster_rows or [])]
+    data = {
+        "sid_by_entry": {}, "name_by_entry": {}, "leading": {}, "led_by": {},
+        "datasheet": {}, "models": {}, "composition": {}, "wargear": {}, "abilities": {},
+        "keywords": {}, "leader_names": {}, "can_lead_names": {}, "enhancement": {},
+        "images": {}, "stratagems": ([], []),
+    }
+    for r in rows:
+        eid = entry_int(r.get("entry_id", r.get("Entry_ID")))
+        if eid is None:
+            continue
+        sid = clean_id(r.get("datasheet_id")) or clean_id(r.get("unit_id", r.get("Unit_ID")))
+        data["sid_by_entry"][eid] = sid
+        data["name_by_entry"][eid] = r.get("Unit") or "Unit"
+    pairing = pair_roster(rows)
+    names = data["name_by_entry"]
+    data["leading"] = {eid: names[att] for eid, att in pairing.leading.items()}
+    data["led_by"] = {att: names[eid] for att, eid in pairing.led_by.items()}
+
+    sids = sorted({s for s in data["sid_by_entry"].values() if s})
+    eids = sorted(data["sid_by_entry"])
+    cursor = conn.cursor(dictionary=True)
+
+    def _run(fn):
+        try:
+            fn()
+        except Exception:
+            pass  # Optional table/column missing on this DB: leave that part of the bundle empty
+
+    if sids:
+        ph = _placeholders(sids)
+
+        def _datasheets():
+            cursor.execute(
+                f"SELECT waha_datasheet_id, name, loadout, transport, image_url FROM waha_datasheets WHERE waha_datasheet_id IN ({ph})",
+                sids,
+            )
+            for r in cursor.fetchall():
+                data["datasheet"][clean_id(r.pop("waha_datasheet_id"))] = r
+
+        def _datasheets_basic():
+            # Older schemas without loadout/transport (hydrate_waha_datasheets_extra not run)
+            if data["datasheet"]:
+                return
+            cursor.execute(f"SELECT waha_datasheet_id, name, image_url FROM waha_datasheets WHERE waha_datasheet_id IN ({ph})", sids)
+            for r in cursor.fetchall():
+                data["datasheet"][clean_id(r.pop("waha_datasheet_id"))] = r
+
+        def _models():
+            cursor.execute(
+                f"SELECT datasheet_id, name as Model, movement as M, toughness as T, save_value as Sv, wounds as W, leadership as Ld, oc as OC "
+                f"FROM waha_datasheets_models WHERE datasheet_id IN ({ph}) ORDER BY datasheet_id, line_id",
+                sids,
+            )
+            data["models"] = _group(cursor.fetchall(), "datasheet_id")
+
+        def _composition():
+            cursor.execute(f"""
+                SELECT c.datasheet_id, c.description, m.base_size, m.base_size_descr
+                FROM waha_datasheet_unit_composition c
+                LEFT JOIN waha_datasheets_models m ON c.datasheet_id = m.datasheet_id AND c.line_id = m.line_id
+                WHERE c.datasheet_id IN ({ph}) ORDER BY c.datasheet_id, c.line_id ASC
+            """, sids)
+            data["composition"] = _group(cursor.fetchall(), "datasheet_id")
+
+        def _wargear():
+            cursor.execute(
+                f"SELECT datasheet_id, name, range_val, attacks, bs_ws, ap, damage, description FROM waha_datasheets_wargear "
+                f"WHERE datasheet_id IN ({ph}) ORDER BY datasheet_id, name",
+                sids,
+            )
+            data["wargear"] = _group(cursor.fetchall(), "datasheet_id")
+
+        def _abilities():
+            cursor.execute(
+                "SELECT da.datasheet_id, COALESCE(a.name, da.name) as ab_name, COALESCE(a.description, da.description) as ab_desc, da.type "
+                "FROM waha_datasheets_abilities da LEFT JOIN waha_abilities a ON da.ability_id = a.id "
+                f"WHERE da.datasheet_id IN ({ph}) "
+                "ORDER BY da.datasheet_id, CASE WHEN LOWER(TRIM(COALESCE(da.type,''))) = 'faction' THEN 0 WHEN LOWER(TRIM(COALESCE(da.type,''))) = 'datasheet' THEN 1 "
+                "WHEN LOWER(TRIM(COALESCE(da.type,''))) = 'wargear' THEN 2 WHEN LOWER(TRIM(COALESCE(da.type,''))) LIKE 'special%' THEN 3 ELSE 4 END, ab_name",
+                sids,
+            )
+            data["abilities"] = _group(cursor.fetchall(), "datasheet_id")
+
+        def _keywords():
+            cursor.execute(f"SELECT datasheet_id, keyword FROM waha_datasheets_keywords WHERE datasheet_id IN ({ph})", sids)
+            for sid, kws in _group(cursor.fetchall(), "datasheet_id").items():
+                data["keywords"][sid] = [str(k.get("keyword", "")).upper() for k in kws]
+
+        def _leaders():
+            graph = load_attachment_graph()
+            for sid in sids:
+                data["leader_names"][sid] = list(graph.leader_names(sid))
+                data["can_lead_names"][sid] = list(graph.can_lead_names(sid))
+
+        for fn in (_datasheets, _datasheets_basic, _models, _composition, _wargear, _abilities,
+                   _keywords, _leaders):
+            _run(fn)
+
+    if eids:
+        ph_e = _placeholders(eids)
+
+        def _enhancements():
+            cursor.execute(f"""
+                SELECT ple.entry_id, e.name, e.description, ple.cost
+                FROM play_armylist_enhancements ple
+                JOIN waha_enhancements e ON ple.enhancement_id = e.id
+                WHERE ple.entry_id IN ({ph_e})
+            """, eids)
+            for r in cursor.fetchall():
+                data["enhancement"].setdefault(int(r.pop("entry_id")), r)
+
+        _run(_enhancements)
+
+    def _stratagems():
+        data["stratagems"] = fetch_stratagems(cursor, (active_list or {}).get("waha_detachment_id"))
+
+    _run(_stratagems)
+    cursor.close()
+    return data
+
+
+def gameday_images(conn, sid_by_entry):
+    """{entry_id: (image_url, caption)} for the cards (STL choice, default STL link, datasheet image), queried live."""
+    try:
+        return resolve_unit_images(conn, sid_by_entry.items(), "40K_10E", datasheet_images=True)
+    except Exception:
+        return {}
+
+
+def gameday_unit_image(data, entry_id, sid):
+    """(image_url, caption) for a card from prefetched data: roster STL choice, unit default STL, Wahapedia image."""
+    eid = entry_int(entry_id)
+    if eid is not None and eid in data["images"]:
+        return data["images"][eid]
+    img = ((data["datasheet"].get(sid) or {}).get("image_url") or "").strip() if sid else ""
+    if img:
+        return (img, "Datasheet")
+    return (None, None)
+
+
+# --- Per-datasheet bundles (unit details dialog) ---
+
+# Faction keywords that are not a chapter/sub-faction (shown as "Chapter:" in the dialog otherwise).
+_NON_CHAPTER_KEYWORDS = frozenset(k.lower() for k in (
+    "Space Marines", "Adeptus Astartes", "Imperium", "Chaos", "Character", "Infantry", "Vehicle",
+    "Epic Hero", "Battleline", "Agents of the Imperium",
+))
+
+_ABILITY_ORDER = (
+    "CASE WHEN LOWER(TRIM(COALESCE(da.type,''))) = 'faction' THEN 0 WHEN LOWER(TRIM(COALESCE(da.type,''))) = 'datasheet' THEN 1 "
+    "WHEN LOWER(TRIM(COALESCE(da.type,''))) = 'wargear' THEN 2 WHEN LOWER(TRIM(COALESCE(da.type,''))) LIKE 'special%' THEN 3 ELSE 4 END"
+)
+
+
+def _freeze(value):
+    """Read-only copy: dicts become mappingproxies, lists/tuples become tuples (recursively)."""
+    if isinstance(value, dict):
+        return MappingProxyType({k: _freeze(v) for k, v in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+def _thaw(value):
+    """Mutable copy of a _freeze()d value (parsed options are consumed as plain dicts/lists)."""
+    if isinstance(value, MappingProxyType):
+        return {k: _thaw(v) for k, v in value.items()}
+    if isinstance(value, tuple):
+        return [_thaw(v) for v in value]
+    return value
+
+
+# Profile separator: a dash, or the double space Wahapedia leaves where it dropped the dash
+# ('Plasma pistol  standard'). Matched on the raw name, before whitespace is collapsed.
+_WEAPON_PROFILE_SPLIT = re.compile(r"\s+[-–—]\s+|\s{2,}")
+
+
+class WeaponIndex:
+    """
+    waha_weapons rows by normalize_weapon_name(), with the fuzzy fallbacks precomputed: aliases for
+    the profile head ('plasma pistol' for 'plasma pistol – supercharge') and singular/plural, plus a
+    name index for whole-word containment, which is only used when exactly one distinct weapon name
+    contains the wanted one. Resolved lookups are memoized, so a name is only matched fuzzily once.
+    """
+
+    __slots__ = ("rows", "_exact", "_alias", "_names", "_memo")
+
+    def __init__(self, rows):
+        self.rows = tuple(_freeze(dict(r)) for r in rows)
+        self._exact, self._alias = {}, {}
+        for pos, r in enumerate(self.rows):
+            n = normalize_weapon_name(r.get("name"))
+            if not n:
+                continue
+            self._exact.setdefault(n, pos)
+            head = normalize_weapon_name(_WEAPON_PROFILE_SPLIT.split(str(r.get("name")).strip(), 1)[0].lstrip("➤ "))
+            for alias in {head, n[:-1] if n.endswith("s") else n + "s", head + "s"}:
+                if alias:
+                    self._alias.setdefault(alias, pos)
+        self._names = NameIndex([r.get("name") or "" for r in self.rows])
+        self._memo = {}
+
+    def _resolve(self, n):
+        pos = self._exact.get(n, self._alias.get(n))
+        if pos is not None:
+            return pos
+        # Unambiguous containment only: a name found as whole words inside exactly one distinct weapon name.
+        # Two different names containing it ('bolt rifle' in 'brutalis bolt rifles' and 'blood fist
+        # bolt rifles') resolve to nothing rather than to the wrong profile.
+        word = re.compile(r"(?<!\w)" + re.escape(n) + r"(?!\w)")
+        hits = {}
+        for p in self._names.search(n):
+            name = normalize_weapon_name(self.rows[p].get("name"))
+            if word.search(name):
+                hits.setdefault(name, p)
+        return next(iter(hits.values())) if len(hits) == 1 else None
+
+    def lookup(self, name):
+        """waha_weapons row (read-only mapping) for a weapon name, or None."""
+        n = normalize_weapon_name(name)
+        if not n:
+            return None
+        if n not in self._memo:
+            self._memo[n] = self._resolve(n)
+        pos = self._memo[n]
+        return self.rows[pos] if pos is not None else None
+
+    def lookup_many(self, names):
+        """{normalized name: row} for every name that resolves."""
+        out = {}
+        for name in names:
+            row = self.lookup(name)
+            if row is not None:
+                out[normalize_weapon_name(name)] = row
+        return out
+
+
+@reference_data("waha", maxsize=1)
+def load_weapon_index():
+    """WeaponIndex over all of waha_weapons (one scan per waha data version)."""
+    return WeaponIndex(fetch_all("SELECT name, range_val, attacks_val, ap_val, damage_val FROM waha_weapons ORDER BY weapon_id"))
+
+
+@dataclass(frozen=True)
+class DatasheetBundle:
+    """Everything the details dialog shows for one datasheet that does not depend on a roster entry."""
+    datasheet_id: str
+    details: MappingProxyType       # header row: ID, Unit_Name, Faction, Points, Image, Keywords, M..Base
+    image_url: str
+    loadout: str
+    transport: str
+    min_size: Optional[int]         # None when view_40k_unit_composition has no row
+    keywords: tuple                 # upper-cased, for stratagem relevance
+    chapter_keywords: tuple
+    models: tuple
+    wargear: tuple
+    weapons: MappingProxyType       # normalize_weapon_name(name) -> waha_weapons row, for option weapons missing from wargear
+    options: tuple                  # option descriptions (HTML stripped)
+    parsed_options: tuple           # frozen parse_wargear_option() result per option
+    abilities: tuple
+    composition: tuple
+    leader_names: tuple             # units that can lead this one
+    can_lead_names: tuple           # units this one can lead
+
+    def options_with_parsed(self):
+        """[(description, parsed dict)] as fresh mutable copies, the shape _apply_wargear_to_counts expects."""
+        return [(d, _thaw(p)) for d, p in zip(self.options, self.parsed_options)]
+
+    def weapon_profile(self, name):
+        return self.weapons.get(normalize_weapon_name(name))
+
+
+def _option_weapon_names(loadout, parsed_options):
+    """Weapon names a unit can end up with: default loadout plus everything its options can add."""
+    names = set(_compute_base_weapon_counts(loadout or "", 1))
+    for p in parsed_options:
+        added = p.get("added")
+        for w in (added if isinstance(added, list) else [added]):
+            if w:
+                names.add(w)
+        for choice in p.get("options") or []:
+            names.update(_split_and_list(choice))
+    return sorted({normalize_weapon_name(n) for n in names} - {""})
+
+
+def _bundle_details(cursor, datasheet_id):
+    """Header row from view_40k_datasheet_complete, else built from waha_datasheets (+ first model line)."""
+    details = None
+    try:
+        cursor.execute("SELECT * FROM view_40k_datasheet_complete WHERE ID = %s", (datasheet_id,))
+        details = cursor.fetchone()
+    except Exception:
+        details = None
+    if details:
+        return dict(details)
+    row = (rows_by_datasheet(cursor, """
+        SELECT d.waha_datasheet_id AS ID, d.name AS Unit_Name, d.points_cost AS Points, d.image_url AS Image,
+               f.name AS Faction
+        FROM waha_datasheets d
+        LEFT JOIN waha_factions f ON d.faction_id = f.id
+        WHERE {where}
+        LIMIT 1
+    """, "d.waha_datasheet_id", datasheet_id) or [None])[0]
+    if not row:
+        return None
+    m = (rows_by_datasheet(
+        cursor,
+        "SELECT movement AS M, toughness AS T, save_value AS Sv, wounds AS W, leadership AS Ld, oc AS OC, base_size AS Base "
+        "FROM waha_datasheets_models WHERE {where} ORDER BY line_id ASC LIMIT 1",
+        "datasheet_id", datasheet_id,
+    ) or [None])[0]
+    row.update(m or {k: None for k in ("M", "T", "Sv", "W", "Ld", "OC", "Base")})
+    # Normalize keys so the dialog finds them (MySQL may return lowercase)
+    return {
+        "ID": row.get("ID") or row.get("id"),
+        "Unit_Name": row.get("Unit_Name") or row.get("unit_name") or row.get("name"),
+        "Faction": row.get("Faction") or row.get("faction"),
+        "Points": row.get("Points") if row.get("Points") is not None else row.get("points_cost"),
+        "Image": row.get("Image") or row.get("image"),
+        "Keywords": "",
+        "M": row.get("M") or row.get("movement"),
+        "T": row.get("T") or row.get("toughness"),
+        "Sv": row.get("Sv") or row.get("save_value"),
+        "W": row.get("W") or row.get("wounds"),
+        "Ld": row.get("Ld") or row.get("leadership"),
+        "OC": row.get("OC") or row.get("oc"),
+        "Base": row.get("Base") or row.get("base_size"),
+    }
+
+
+@reference_data("waha", maxsize=128)
+def load_datasheet_bundle(datasheet_id):
+    """
+    Compile the DatasheetBundle for one datasheet id (normalized string). Returns None when the unit is
+    not in waha_datasheets. Memoized per id (128 most recent) until the waha data version changes;
+    DB errors propagate and are not cached.
+    """
+    datasheet_id = clean_id(datasheet_id)
+    if not datasheet_id:
+        return None
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor(dictionary=True)
+        details = _bundle_details(cursor, datasheet_id)
+        if not details:
+            cursor.close()
+            return None
+        sheet = {}
+        try:
+            sheet = (rows_by_datasheet(cursor, "SELECT image_url, loadout, transport FROM waha_datasheets WHERE {where}",
+                               "waha_datasheet_id", datasheet_id) or [{}])[0]
+        except Exception:
+            # Older schemas without loadout/transport (hydrate_waha_datasheets_extra not run)
+            sheet = (rows_by_datasheet(cursor, "SELECT image_url FROM waha_datasheets WHERE {where}",
+                               "waha_datasheet_id", datasheet_id) or [{}])[0]
+
+        keyword_rows = rows_by_datasheet(cursor, "SELECT keyword, is_faction_keyword FROM waha_datasheets_keywords WHERE {where}",
+                                 "datasheet_id", datasheet_id)
+        if not details.get("Keywords") and not details.get("keywords"):
+            details["Keywords"] = ", ".join(str(r["keyword"]) for r in keyword_rows if r.get("keyword"))
+        chapter = [
+            r["keyword"] for r in keyword_rows
+            if r.get("keyword") and str(r.get("is_faction_keyword")) == "1"
+            and str(r["keyword"]).strip().lower() not in _NON_CHAPTER_KEYWORDS
+        ]
+
+        models = rows_by_datasheet(cursor, """
+            SELECT name as Model, movement as M, toughness as T,
+                   save_value as Sv, inv_sv, inv_sv_descr, wounds as W,
+                   leadership as Ld, oc as OC
+            FROM waha_datasheets_models
+            WHERE {where}
+        """, "datasheet_id", datasheet_id)
+        wargear = rows_by_datasheet(
+            cursor,
+            "SELECT name, range_val, attacks, bs_ws, ap, damage, description FROM waha_datasheets_wargear WHERE {where} ORDER BY name",
+            "datasheet_id", datasheet_id,
+        )
+        try:
+            option_rows = rows_by_datasheet(
+                cursor, "SELECT description, parsed_json, parser_version FROM waha_datasheets_options WHERE {where}",
+                "datasheet_id", datasheet_id,
+            )
+        except Exception:
+            # migrations/add_waha_options_parsed.sql not run: parse everything live
+            option_rows = rows_by_datasheet(cursor, "SELECT description FROM waha_datasheets_options WHERE {where}",
+                                    "datasheet_id", datasheet_id)
+        options, parsed = [], []
+        for r in option_rows:
+            desc = _strip_option_html(r.get("description") or "")
+            if desc:
+                options.append(desc)
+                parsed.append(parsed_option(desc, r.get("parsed_json"), r.get("parser_version")))
+        abilities = rows_by_datasheet(cursor, f"""
+            SELECT COALESCE(a.name, da.name) as ab_name, COALESCE(a.description, da.description) as ab_desc, da.type
+            FROM waha_datasheets_abilities da
+            LEFT JOIN waha_abilities a ON da.ability_id = a.id
+            WHERE {{where}}
+            ORDER BY {_ABILITY_ORDER}, ab_name ASC
+        """, "da.datasheet_id", datasheet_id)
+        composition = rows_by_datasheet(cursor, """
+            SELECT c.description, m.base_size, m.base_size_descr
+            FROM waha_datasheet_unit_composition c
+            LEFT JOIN waha_datasheets_models m ON c.datasheet_id = m.datasheet_id AND c.line_id = m.line_id
+            WHERE {where} ORDER BY c.line_id ASC
+        """, "c.datasheet_id", datasheet_id)
+
+        min_size = None
+        try:
+            size = load_unit_sizes().get(datasheet_id, (None, None))[0]
+            if size is not None:
+                min_size = int(size)
+        except Exception:
+            pass
+
+        leader_names, can_lead_names = (), ()
+        try:
+            graph = load_attachment_graph()
+            leader_names, can_lead_names = graph.leader_names(datasheet_id), graph.can_lead_names(datasheet_id)
+        except Exception:
+            pass
+
+        weapons = {}
+        names = _option_weapon_names(sheet.get("loadout"), parsed)
+        if names:
+            try:
+                weapons = load_weapon_index().lookup_many(names)
+            except Exception:
+                pass
+        cursor.close()
+    finally:
+        conn.close()
+
+    return DatasheetBundle(
+        datasheet_id=datasheet_id,
+        details=_freeze(details),
+        image_url=str(details.get("Image") or details.get("image") or sheet.get("image_url") or "").strip(),
+        loadout=str(sheet.get("loadout") or "").strip(),
+        transport=str(sheet.get("transport") or "").strip(),
+        min_size=min_size,
+        keywords=tuple(str(r.get("keyword") or "").upper() for r in keyword_rows),
+        chapter_keywords=tuple(chapter),
+        models=_freeze(models),
+        wargear=_freeze(wargear),
+        weapons=_freeze(weapons),
+        options=tuple(options),
+        parsed_options=_freeze(parsed),
+        abilities=_freeze(abilities),
+        composition=_freeze(composition),
+        leader_names=tuple(leader_names),
+        can_lead_names=tuple(can_lead_names),
+    )
+
+
+# --- Library picker index ---
+
+def _unit_role_from_keywords(keywords_str):
+    """Derive a role label and sort order from keywords (Character, Epic Hero, Battleline, etc.). Returns (order_int, label)."""
+    if not keywords_str:
+        return (99, "Other")
+    kw = (keywords_str if isinstance(keywords_str, str) else "").upper()
+    if "EPIC HERO" in kw:
+        return (0, "Epic Hero")
+    if "CHARACTER" in kw:
+        return (1, "Character")
+    if "BATTLELINE" in kw:
+        return (2, "Battleline")
+    if "MONSTER" in kw:
+        return (3, "Monster")
+    if "VEHICLE" in kw:
+        return (4, "Vehicle")
+    if "TRANSPORT" in kw:
+        return (5, "Transport")
+    if "INFANTRY" in kw:
+        return (6, "Infantry")
+    if "BEAST" in kw:
+        return (7, "Beast")
+    return (99, "Other")
+
+
+class PickerIndex:
+    """One faction's 40K picker rows (view_master_picker order: by name) plus a NameIndex over their
+    names and each unit's keyword set (casefolded) for chapter filtering."""
+
+    __slots__ = ("faction", "units", "keyword_sets", "names")
+
+    def __init__(self, faction, rows, keywords_by_id, keyword_text_by_id):
+        self.faction = faction
+        units, keyword_sets = [], []
+        for r in rows:
+            sid = clean_id(r.get("id"))
+            order, label = _unit_role_from_keywords(keyword_text_by_id.get(sid, ""))
+            units.append(MappingProxyType(dict(r, _role_order=order, _role_label=label)))
+            keyword_sets.append(keywords_by_id.get(sid, frozenset()))
+        self.units = tuple(units)
+        self.keyword_sets = tuple(keyword_sets)
+        self.names = NameIndex(u.get("name") for u in self.units)
+
+    def search(self, query):
+        return self.names.search(query)
+
+
+@reference_data("waha", maxsize=1)
+def _keyword_sets():
+    """{datasheet_id: frozenset of casefolded keywords} (keyword = %s in SQL is case-insensitive)."""
+    return {
+        sid: frozenset(str(r.get("keyword")).strip().casefold() for r in rows if r.get("keyword"))
+        for sid, rows in load_waha_rows("waha_datasheets_keywords").items()
+    }
+
+
+@reference_data("waha", maxsize=16)
+def load_picker_index(faction):
+    """PickerIndex for one faction name as shown in view_master_picker."""
+    rows = fetch_all(
+        "SELECT * FROM view_master_picker WHERE game_system = '40K' AND faction = %s ORDER BY name",
+        (faction,),
+    )
+    return PickerIndex(faction, rows, _keyword_sets(), keywords_by_datasheet())
+
+
+def search_picker_units(primary_faction, allied_factions, search, subfaction=None, subfactions=(), limit=500):
+    """
+    Library picker results as fresh dicts (with _role_order/_role_label), same rules as the SQL it
+    replaces: name contains `search`; primary-faction units must carry `subfaction` or none of
+    `subfactions` when a chapter is picked; allied factions are unfiltered; sorted by name, capped
+    at `limit`, then deduped by datasheet id.
+    """
+    sub = (subfaction or "").strip().casefold()
+    others = frozenset(str(k).strip().casefold() for k in (subfactions or ()) if k)
+    hits = []
+    for faction in [primary_faction] + [f for f in (allied_factions or []) if f != primary_faction]:
+        if not faction:
+            continue
+        index = load_picker_index(faction)
+        for pos in index.search(search or ""):
+            if sub and faction == primary_faction:
+                kws = index.keyword_sets[pos]
+                if sub not in kws and kws & others:
+                    continue
+            hits.append(index.units[pos])
+    if len(hits) > 1:
+        hits.sort(key=lambda u: str(u.get("name") or "").casefold())
+    out, seen = [], set()
+    for u in hits[:limit]:
+        nid = clean_id(u.get("id"))
+        if nid and nid in seen:
+            continue
+        seen.add(nid)
+        out.append(dict(u))
+    return out
+
+
+@reference_data("waha", maxsize=16)
+def load_detachments(faction_name):
+    """[(detachment id, name)] for a faction name, in waha_detachments order (the sidebar selector)."""
+    rows = fetch_all(
+        "SELECT d.id, d.name FROM waha_detachments d JOIN waha_factions f ON d.faction_id = f.id WHERE f.name = %s",
+        (faction_name,),
+    )
+    return tuple((r["id"], r["name"]) for r in rows)
+
+
+# Faction keywords that are never a chapter choice in the Space Marine chapter selector.
+_CHAPTER_EXCLUDE = ("Adeptus Astartes", "Agents of the Imperium", "Character", "Infantry", "Vehicle",
+                    "Epic Hero", "Battleline", "Imperium")
+
+
+@reference_data("waha", maxsize=8)
+def load_chapter_keywords(faction_name):
+    """Chapter (subfaction) faction keywords for the chapter selector, e.g. 'Blood Angels'."""
+    exclude = (faction_name,) + _CHAPTER_EXCLUDE
+    rows = fetch_all(
+        "SELECT DISTINCT keyword FROM waha_datasheets_keywords dk "
+        "JOIN waha_datasheets d ON dk.datasheet_id = d.waha_datasheet_id "
+        "JOIN waha_factions f ON d.faction_id = f.id "
+        f"WHERE (f.name = %s OR f.id = 'SM') AND dk.keyword NOT IN ({_placeholders(exclude)}) AND dk.is_faction_keyword = 1",
+        (faction_name,) + exclude,
+    )
+    return tuple(r["keyword"] for r in rows)
+
+
+def unit_chapters(datasheet_ids, chapters):
+    """{datasheet_id: chapter keyword} for roster units carrying one of `chapters` as a faction keyword."""
+    wanted = set(chapters or ())
+    if not wanted:
+        return {}
+    keywords = load_waha_rows("waha_datasheets_keywords")
+    out = {}
+    for sid in {clean_id(s) for s in datasheet_ids} - {""}:
+        for r in keywords.get(sid, ()):
+            if str(r.get("is_faction_keyword")) == "1" and r.get("keyword") in wanted:
+                out[sid] = r["keyword"]
+    return out
@@ -0,0 +1,72 @@
+"""
+40K points engine: roster points computed in pandas from cached reference data.
+
+Per entry, matching the SQL get_roster_40k used to run per row:
+    Total_Pts = COALESCE(points_cost * CEIL(quantity / COALESCE(min_size, 1)) + SUM(enhancement cost), 0)
+points_cost comes from waha_datasheets and min_size from view_40k_unit_composition, both via
+reference_cache (loaded once per data version); enhancement costs are one grouped query per list.
+SQL NULL semantics are kept: no points_cost, no quantity or a min_size of 0 make the whole total 0
+(enhancements included), a missing min_size counts as 1.
+"""
+
+import numpy as np
+import pandas as pd
+
+from reference_cache import load_unit_sizes, load_waha_datasheets
+
+
+def _id_key(value):
+    return str(value).strip() if value is not None else ""
+
+
+def _as_number(value):
+    """Whole-number totals as int (what the UI prints), anything else as float."""
+    value = float(value)
+    return int(value) if value.is_integer() else value
+
+
+def fetch_enhancement_costs(cursor, list_id):
+    """{entry_id: summed enhancement cost} for every entry of a list, in one query."""
+    cursor.execute(
+        """
+        SELECT enh.entry_id, COALESCE(SUM(enh.cost), 0) AS cost
+        FROM play_armylist_enhancements enh
+        JOIN play_armylist_entries e ON e.entry_id = enh.entry_id
+        WHERE e.list_id = %s
+        GROUP BY enh.entry_id
+        """,
+        (list_id,),
+    )
+    return {int(r["entry_id"]): r["cost"] for r in cursor.fetchall()}
+
+
+def compute_total_points(entries, enhancement_costs, points_by_id=None, min_size_by_id=None):
+    """
+    Total_Pts per entry as a pandas Series aligned with `entries` (list of dicts with entry_id, Qty,
+    datasheet_id). points_by_id / min_size_by_id default to the reference cache; pass dicts to
+    compute without a DB (e.g. parity checks).
+    """
+    if not entries:
+        return pd.Series([], dtype="float64")
+    df = pd.DataFrame(entries)
+    keys = df["datasheet_id"].map(_id_key)
+    if points_by_id is None:
+        datasheets = load_waha_datasheets()
+        points_by_id = {k: r.get("points_cost") for k, r in datasheets.items()}
+    if min_size_by_id is None:
+        min_size_by_id = {k: sizes[0] for k, sizes in load_unit_sizes().items()}
+    points = pd.to_numeric(keys.map(points_by_id), errors="coerce")
+    min_size = pd.to_numeric(keys.map(min_size_by_id), errors="coerce").fillna(1)
+    qty = pd.to_numeric(df["Qty"], errors="coerce")
+    enh = pd.to_numeric(df["entry_id"].astype(int).map(enhancement_costs), errors="coerce").fillna(0)
+    # x / 0 is NULL in MySQL, which nulls the whole expression (-> 0 after COALESCE)
+    blocks = np.ceil(qty / min_size.where(min_size != 0))
+    return (points * blocks + enh).fillna(0)
+
+
+def apply_roster_points(entries, enhancement_costs, points_by_id=None, min_size_by_id=None):
+    """Set Total_Pts on each entry dict in place; returns the roster total."""
+    totals = compute_total_points(entries, enhancement_costs, points_by_id, min_size_by_id)
+    for row, pts in zip(entries, totals.tolist()):
+        row["Total_Pts"] = _as_number(pts)
+    return _as_number(totals.sum()) if len(totals) else 0
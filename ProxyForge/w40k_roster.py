@@ -5,13 +5,91 @@ All roster rows carry a canonical datasheet_id from the JOIN with waha_datasheet
 Use datasheet_id (not raw unit_id) for any lookups into waha_datasheets_* tables.
 """
 
+from collections import Counter
+
 from database_utils import get_db_connection
+from datasheet_ids import clean_id
+from w40k_points import apply_roster_points, fetch_enhancement_costs
+
+
+# Whether play_armylist_entries has attached_to_entry_id (migrations/add_play_armylist_leader_attachment.sql).
+# None until the first roster load finds out, so older DBs don't pay for a failing query on every rerun.
+_has_attached_col = None
+# MySQL ER_BAD_FIELD_ERROR ("Unknown column"): the only probe failure that means the column is missing.
+_ER_BAD_FIELD_ERROR = 1054
+
+# Column order of roster rows (same as the all-SQL version, so DataFrames built from them match).
+_ROSTER_COLUMNS = ("entry_id", "list_id", "unit_id", "Qty", "datasheet_id", "Unit", "Total_Pts", "wargear_list", "attached_to_entry_id")
+
+_ROSTER_ENTRIES_SQL = """
+    SELECT
+        e.entry_id,
+        e.list_id,
+        e.unit_id,
+        e.quantity AS Qty,
+        d.waha_datasheet_id AS datasheet_id,
+        COALESCE(d.name, 'Unknown unit') AS Unit,
+        (SELECT JSON_ARRAYAGG(option_text) FROM play_armylist_wargear_selections WHERE entry_id = e.entry_id AND (option_text NOT LIKE 'w2|%%' OR option_text = '')) AS wargear_list{attached}
+    FROM play_armylist_entries e
+    JOIN play_armylists l ON e.list_id = l.list_id AND l.game_system = '40K_10E'
+    LEFT JOIN waha_datasheets d ON e.unit_id = d.waha_datasheet_id
+    WHERE e.list_id = %s
+    ORDER BY e.entry_id
+"""
+
+
+def _normalize_roster_rows(rows):
+    for r in rows:
+        if "attached_to_entry_id" not in r:
+            r["attached_to_entry_id"] = None
+    # Normalize datasheet_id to string (no trailing .0) so lookups match
+    for r in rows:
+        if r.get("datasheet_id") is not None:
+            r["datasheet_id"] = clean_id(r["datasheet_id"])
+    return rows
 
 
 def get_roster_40k(conn, list_id):
     """
     Load roster for a 40K list. Returns list of dicts with canonical datasheet_id.
 
+    Each row includes:
+      - entry_id, list_id, quantity (Qty), Unit (name), Total_Pts, wargear_list
+      - unit_id: raw value from play_armylist_entries (for DB updates)
+      - datasheet_id: from waha_datasheets.waha_datasheet_id (JOIN). Use this for
+        all lookups (wargear, composition, abilities, etc.). None if join failed.
+
+    Two flat queries (entries, enhancement costs); Total_Pts is computed by w40k_points from cached
+    points/min sizes. get_roster_40k_sql() is the previous all-SQL version, kept for parity checks.
+    """
+    global _has_attached_col
+    cursor = conn.cursor(dictionary=True)
+    rows = None
+    if _has_attached_col is not False:
+        try:
+            cursor.execute(_ROSTER_ENTRIES_SQL.format(attached=",\n        e.attached_to_entry_id"), (list_id,))
+            rows = cursor.fetchall()
+            _has_attached_col = True
+        except Exception as e:
+            if _has_attached_col or getattr(e, "errno", None) != _ER_BAD_FIELD_ERROR:
+                raise  # e.g. a dropped connection: leave the flag unset so the next load probes again
+            _has_attached_col = False
+    if rows is None:
+        cursor.execute(_ROSTER_ENTRIES_SQL.format(attached=""), (list_id,))
+        rows = cursor.fetchall()
+    rows = [dict(r) for r in rows]
+    enhancement_costs = fetch_enhancement_costs(cursor, list_id) if rows else {}
+    cursor.close()
+    apply_roster_points(rows, enhancement_costs)
+    rows = [{k: r.get(k) for k in _ROSTER_COLUMNS} for r in rows]
+    return _normalize_roster_rows(rows)
+
+
+def get_roster_40k_sql(conn, list_id):
+    """
+    Previous all-SQL roster load (correlated subqueries for min_size and enhancement cost per row).
+    Same output as get_roster_40k(); kept as the reference for scripts/check_40k_points_parity.py.
+
     Each row includes:
       - entry_id, list_id, quantity (Qty), Unit (name), Total_Pts, wargear_list
       - unit_id: raw value from play_armylist_entries (for DB updates)
@@ -73,16 +151,8 @@ def get_roster_40k(conn, list_id):
             (list_id,),
         )
     rows = cursor.fetchall()
-    for r in rows:
-        if r.get("attached_to_entry_id") is None and "attached_to_entry_id" not in r:
-            r["attached_to_entry_id"] = None
     cursor.close()
-    # Normalize datasheet_id to string (no trailing .0) so lookups match
-    for r in rows:
-        if r.get("datasheet_id") is not None:
-            raw = str(r["datasheet_id"]).strip()
-            r["datasheet_id"] = raw[:-2] if raw.endswith(".0") and raw[:-2].isdigit() else raw
-    return rows
+    return _normalize_roster_rows(rows)
 
 
 def add_unit_40k(conn, list_id, waha_datasheet_id, quantity=1):
@@ -126,8 +196,67 @@ def get_datasheet_id_for_entry(conn, entry_id):
     cursor.close()
     if not row or row.get("datasheet_id") is None:
         return None
-    raw = str(row["datasheet_id"]).strip()
-    return raw[:-2] if raw.endswith(".0") and raw[:-2].isdigit() else raw
+    return clean_id(row["datasheet_id"])
+
+
+def encode_wargear_selections(selections, summary=None):
+    """
+    option_text rows for a unit's wargear state, in the format the details dialog reads back:
+    'w2|<option idx>|<count or choice>' per option, 'w2|<idx>|<slot>|<choice>' per slot of a
+    per-N-models option, then the human-readable summary (what the roster's wargear_list shows).
+    """
+    rows = []
+    for idx, sel in enumerate(selections):
+        if isinstance(sel, list):
+            rows.extend(f"w2|{idx}|{slot}|{choice}" for slot, choice in enumerate(sel))
+        else:
+            rows.append(f"w2|{idx}|{sel}")
+    if summary:
+        rows.append(str(summary)[:500])
+    return rows
+
+
+def save_wargear_selections(conn, entry_id, option_texts):
+    """
+    Make an entry's play_armylist_wargear_selections rows equal option_texts (a multiset), touching
+    only the rows that differ: stale rows are deleted by selection_id and missing ones inserted, each
+    with one executemany, in a single transaction. Returns (inserted, deleted); (0, 0) when the
+    stored state already matches.
+    """
+    cursor = conn.cursor(dictionary=True)
+    try:
+        conn.start_transaction()
+        cursor.execute(
+            "SELECT selection_id, option_text, is_active FROM play_armylist_wargear_selections WHERE entry_id = %s ORDER BY selection_id FOR UPDATE",
+            (entry_id,),
+        )
+        wanted = Counter(option_texts)
+        stale = []
+        for r in cursor.fetchall():
+            text = r.get("option_text")
+            if wanted[text] > 0 and str(r.get("is_active")) == "1":
+                wanted[text] -= 1
+            else:
+                stale.append((r["selection_id"],))
+        missing = []
+        for text in option_texts:
+            if wanted[text] > 0:
+                wanted[text] -= 1
+                missing.append((entry_id, text))
+        if stale:
+            cursor.executemany("DELETE FROM play_armylist_wargear_selections WHERE selection_id = %s", stale)
+        if missing:
+            cursor.executemany(
+                "INSERT INTO play_armylist_wargear_selections (entry_id, option_text, is_active) VALUES (%s, %s, 1)",
+                missing,
+            )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+    return len(missing), len(stale)
 
 
 def get_debug_query_results(conn, list_id, datasheet_id=None):
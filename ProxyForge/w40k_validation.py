@@ -0,0 +1,231 @@
+"""
+40K list validation engine: list legality computed in pandas from cached reference data.
+
+Replaces the per-rerun view_list_validation_40k query (plus the enhancement and warlord queries
+show_40k_validation ran next to it) with the same rules evaluated over the roster rows:
+  - Rule of 3: a datasheet may be taken 3 times, Battleline 6, Epic Hero once (times_taken counts
+    roster entries, like the view's COUNT(e.unit_id)).
+  - Faction/chapter: units from ally factions are 'Ally'; a unit with a faction keyword other than
+    the list's faction, 'Adeptus Astartes', 'Imperium', 'Chaos' or the list's chapter is 'INVALID';
+    otherwise the unit's faction must be the list's faction. Proxy mode and the CUSTOM chapter turn
+    mismatches into an info finding.
+  - Enhancements: at most 3 per army, each taken once.
+  - Warlord: at least one Character (a list without one is not battle-ready).
+Keyword and faction data come from reference_cache (loaded once per data version), so validating a
+list costs no queries beyond the roster and its enhancement ids, and validate_lists() checks every
+saved list with three queries in total (scripts/validate_40k_lists.py).
+"""
+from dataclasses import dataclass
+
+import pandas as pd
+
+from datasheet_ids import clean_id
+from reference_cache import load_waha_datasheets, load_waha_faction_names, load_waha_rows, reference_data
+
+# play_armylists.chapter_subfaction value for "Custom (mix chapters)".
+CHAPTER_CUSTOM = "CUSTOM"
+ALLY_FACTIONS = ("Imperial Agents", "Imperial Knights", "Chaos Daemons", "Chaos Knights")
+# Faction keywords every list may carry besides its own faction and chapter.
+SHARED_FACTION_KEYWORDS = ("Adeptus Astartes", "Imperium", "Chaos")
+MAX_ENHANCEMENTS = 3
+
+_ALLY_KEYS = frozenset(f.casefold() for f in ALLY_FACTIONS)
+_SHARED_KEYS = frozenset(k.casefold() for k in SHARED_FACTION_KEYWORDS)
+
+
+@dataclass(frozen=True)
+class Finding:
+    """One validation result. severity is 'error' (not battle-ready), 'warning' or 'info'."""
+    rule: str               # rule_of_three | epic_hero | faction | faction_bypass | enhancement_count | enhancement_unique | warlord
+    severity: str
+    message: str
+    unit_name: str = None
+    datasheet_id: str = None
+    times_taken: int = None
+    max_allowed: int = None
+
+
+@dataclass(frozen=True)
+class ValidationReport:
+    """Findings for one list plus the per-datasheet table view_list_validation_40k used to return."""
+    list_id: int
+    units: pd.DataFrame     # datasheet_id, unit_name, times_taken, max_allowed, faction_status
+    findings: tuple
+    allow_mixed_chapters: bool = False
+
+    def by_rule(self, *rules):
+        return [f for f in self.findings if f.rule in rules]
+
+    @property
+    def errors(self):
+        return [f for f in self.findings if f.severity == "error"]
+
+    @property
+    def is_battle_ready(self):
+        return not self.errors
+
+
+def _fold(value):
+    return (str(value).strip().casefold()) if value is not None else ""
+
+
+@reference_data("waha", maxsize=1)
+def _unit_keywords():
+    """{datasheet_id: (all keywords, faction keywords)}, both casefolded frozensets."""
+    out = {}
+    for sid, rows in load_waha_rows("waha_datasheets_keywords").items():
+        kws = [r for r in rows if r.get("keyword")]
+        out[clean_id(sid)] = (
+            frozenset(_fold(r.get("keyword")) for r in kws),
+            frozenset(_fold(r.get("keyword")) for r in kws if str(r.get("is_faction_keyword")).strip() == "1"),
+        )
+    return out
+
+
+def _faction_status(faction_name, faction_keywords, primary, chapter):
+    if _fold(faction_name) in _ALLY_KEYS:
+        return "Ally"
+    allowed = _SHARED_KEYS | {primary}
+    if any(kw not in allowed and kw != chapter for kw in faction_keywords):
+        return "INVALID"
+    return "Valid" if primary and _fold(faction_name) == primary else "INVALID"
+
+
+def unit_table(roster, faction_primary, chapter_subfaction=None):
+    """
+    Per-datasheet rows of a roster (list of dicts or DataFrame with entry_id, datasheet_id) with
+    unit_name, times_taken, max_allowed and faction_status, as view_list_validation_40k computes
+    them. Entries whose datasheet or faction is unknown are left out, like the view's inner joins.
+    """
+    cols = ["datasheet_id", "unit_name", "times_taken", "max_allowed", "faction_status"]
+    df = roster if isinstance(roster, pd.DataFrame) else pd.DataFrame(list(roster))
+    if df.empty or "datasheet_id" not in df.columns:
+        return pd.DataFrame(columns=cols)
+    datasheets = load_waha_datasheets()
+    factions = load_waha_faction_names()
+    keys = df["datasheet_id"].map(clean_id)
+    faction_of = {k: factions.get(_fold(datasheets[k].get("faction_id"))) for k in keys.unique() if k in datasheets}
+    keys = keys[keys.map(lambda k: faction_of.get(k) is not None)]
+    if keys.empty:
+        return pd.DataFrame(columns=cols)
+    counts = keys.value_counts(sort=False)
+    keywords = _unit_keywords()
+    primary = _fold(faction_primary)
+    chapter = _fold(chapter_subfaction) or None
+    rows = []
+    for sid, taken in counts.items():
+        all_kws, faction_kws = keywords.get(sid, (frozenset(), frozenset()))
+        max_allowed = 1 if "epic hero" in all_kws else 6 if "battleline" in all_kws else 3
+        rows.append((sid, datasheets[sid].get("name"), int(taken), max_allowed,
+                     _faction_status(faction_of[sid], faction_kws, primary, chapter)))
+    return pd.DataFrame(rows, columns=cols)
+
+
+def validate_roster(roster, faction_primary, chapter_subfaction=None, enhancement_ids=(), proxy_mode=False, list_id=None):
+    """
+    Validate one list from its roster rows, its chapter and the enhancement_id of every enhancement
+    taken (one item per play_armylist_enhancements row). Returns a ValidationReport; no DB access
+    beyond the reference cache.
+    """
+    units = unit_table(roster, faction_primary, chapter_subfaction)
+    allow_custom = (chapter_subfaction or "").strip() == CHAPTER_CUSTOM
+    allow_mixed = bool(proxy_mode) or allow_custom
+    findings = []
+
+    mismatches = units[units["faction_status"] == "INVALID"]
+    if not mismatches.empty:
+        if allow_mixed:
+            msg = ("Custom Chapter: Mixed chapters allowed." if allow_custom and not proxy_mode
+                   else "Proxy Mode Active: Chapter/Legion restrictions bypassed.")
+            findings.append(Finding("faction_bypass", "info", msg))
+        else:
+            for r in mismatches.itertuples(index=False):
+                findings.append(Finding("faction", "error", f"{r.unit_name} (Native Chapter Mismatch)",
+                                        unit_name=r.unit_name, datasheet_id=r.datasheet_id))
+
+    over = units[units["times_taken"] > units["max_allowed"]]
+    for r in over.itertuples(index=False):
+        findings.append(Finding(
+            "epic_hero" if r.max_allowed == 1 else "rule_of_three", "error",
+            f"{r.unit_name}: {int(r.times_taken)}/{int(r.max_allowed)}",
+            unit_name=r.unit_name, datasheet_id=r.datasheet_id,
+            times_taken=int(r.times_taken), max_allowed=int(r.max_allowed),
+        ))
+
+    enhancement_ids = list(enhancement_ids or ())
+    taken = [e for e in enhancement_ids if e is not None]   # COUNT(DISTINCT) skips NULLs
+    if len(enhancement_ids) > MAX_ENHANCEMENTS:
+        findings.append(Finding("enhancement_count", "error", f"Max {MAX_ENHANCEMENTS} enhancements per army."))
+    if len(set(taken)) < len(enhancement_ids):
+        findings.append(Finding("enhancement_unique", "error", "Each enhancement can only be taken once."))
+
+    df = roster if isinstance(roster, pd.DataFrame) else pd.DataFrame(list(roster))
+    keywords = _unit_keywords()
+    sids = df["datasheet_id"].map(clean_id) if "datasheet_id" in df.columns else pd.Series([], dtype=object)
+    if not any("character" in keywords.get(sid, (frozenset(),))[0] for sid in sids.unique()):
+        findings.append(Finding("warlord", "error", "List must include at least one Character."))
+
+    return ValidationReport(list_id, units, tuple(findings), allow_mixed)
+
+
+def fetch_enhancement_ids(cursor, list_id):
+    """enhancement_id of every enhancement taken in a list (duplicates kept)."""
+    cursor.execute(
+        """
+        SELECT enh.enhancement_id
+        FROM play_armylist_enhancements enh
+        JOIN play_armylist_entries e ON e.entry_id = enh.entry_id
+        WHERE e.list_id = %s
+        """,
+        (list_id,),
+    )
+    return [r["enhancement_id"] for r in cursor.fetchall()]
+
+
+_BULK_ENTRIES_SQL = """
+    SELECT e.list_id, e.entry_id, d.waha_datasheet_id AS datasheet_id
+    FROM play_armylist_entries e
+    JOIN play_armylists l ON e.list_id = l.list_id AND l.game_system = '40K_10E'{ids}
+    LEFT JOIN waha_datasheets d ON e.unit_id = d.waha_datasheet_id
+    ORDER BY e.list_id, e.entry_id
+"""
+
+_BULK_ENHANCEMENTS_SQL = """
+    SELECT e.list_id, enh.enhancement_id
+    FROM play_armylist_enhancements enh
+    JOIN play_armylist_entries e ON e.entry_id = enh.entry_id
+    JOIN play_armylists l ON e.list_id = l.list_id AND l.game_system = '40K_10E'{ids}
+"""
+
+
+def validate_lists(conn, list_ids=None, proxy_mode=False):
+    """
+    Validate many 40K lists (default: all) with one query each for lists, entries and
+    enhancements. Returns [(list row, ValidationReport)] ordered by list_id.
+    """
+    cursor = conn.cursor(dictionary=True)
+    params = tuple(int(i) for i in list_ids) if list_ids else ()
+    ids = f" AND l.list_id IN ({', '.join(['%s'] * len(params))})" if params else ""
+    try:
+        cursor.execute(f"SELECT l.* FROM play_armylists l WHERE l.game_system = '40K_10E'{ids} ORDER BY l.list_id", params)
+        lists = cursor.fetchall()
+        cursor.execute(_BULK_ENTRIES_SQL.format(ids=ids), params)
+        entries = pd.DataFrame(cursor.fetchall(), columns=["list_id", "entry_id", "datasheet_id"])
+        cursor.execute(_BULK_ENHANCEMENTS_SQL.format(ids=ids), params)
+        enhancements = {}
+        for r in cursor.fetchall():
+            enhancements.setdefault(int(r["list_id"]), []).append(r["enhancement_id"])
+    finally:
+        cursor.close()
+
+    by_list = {int(k): g for k, g in entries.groupby("list_id")} if not entries.empty else {}
+    empty = entries.iloc[0:0]
+    results = []
+    for lst in lists:
+        lid = int(lst["list_id"])
+        report = validate_roster(
+            by_list.get(lid, empty), lst.get("faction_primary"), lst.get("chapter_subfaction"),
+            enhancements.get(lid, ()), proxy_mode=proxy_mode, list_id=lid,
+        )
+        results.append((lst, report))
+    return results
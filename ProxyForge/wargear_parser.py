@@ -0,0 +1,420 @@
+"""
+Wargear text parsing for 40K datasheets (no Streamlit/DB dependencies).
+
+Turns Wahapedia loadout and wargear-option text into structures the builder uses for weapon counts:
+parse_wargear_option() classifies one option line, _compute_base_weapon_counts() reads the default
+loadout, and _apply_wargear_to_counts() applies a unit's selections on top. Kept importable from
+hydrators and scripts as well as the Streamlit UI.
+
+hydrate_waha_full.py stores parse_wargear_option() output per option row (waha_datasheets_options.
+parsed_json, stamped with PARSER_VERSION); readers use parsed_option() to take the stored parse when
+its version matches and re-parse live otherwise. Bump PARSER_VERSION whenever parse output changes.
+"""
+import json
+import re
+
+from text_utils import fix_apostrophe_mojibake
+
+PARSER_VERSION = 1
+
+
+def _strip_html(text):
+    """Remove HTML tags and normalize whitespace for plain-text display."""
+    if not text:
+        return ""
+    s = str(text)
+    # Remove HTML tags
+    s = re.sub(r"<[^>]+>", "", s)
+    # Decode common entities
+    s = s.replace("&nbsp;", " ").replace("&amp;", "&").replace("&lt;", "<").replace("&gt;", ">").replace("&quot;", '"')
+    return " ".join(s.split())
+
+
+def _loadout_to_display(html_text):
+    """Convert loadout HTML to display text, preserving line breaks from <br> so each model line is separate."""
+    if not html_text:
+        return ""
+    s = str(html_text).strip()
+    for br in ("<br>", "<br/>", "<br />", "</br>"):
+        s = s.replace(br, "\n")
+    s = re.sub(r"<[^>]+>", "", s)
+    s = s.replace("&nbsp;", " ").replace("&amp;", "&").replace("&lt;", "<").replace("&gt;", ">").replace("&quot;", '"')
+    # If no <br> in source, split on period+space before "Every"/"The" so each model line is separate
+    if "\n" not in s and re.search(r"\.\s+(Every|The)\s+", s):
+        s = re.sub(r"\.\s+(Every\s+)", r".\n\1", s)
+        s = re.sub(r"\.\s+(The\s+)", r".\n\1", s)
+    lines = [" ".join(ln.split()) for ln in s.split("\n")]
+    return "\n".join(ln for ln in lines if ln)
+
+
+def _parse_loadout_to_model_weapons(loadout_text):
+    """
+    Parse default loadout text into list of (model_label, weapons_list).
+    e.g. 'The Boss Nob is equipped with: slugga; big choppa. Every Boy is equipped with: slugga; choppa.'
+    -> [('Boss Nob', ['slugga', 'big choppa']), ('Boy', ['slugga', 'choppa'])]
+    """
+    if not loadout_text or not str(loadout_text).strip():
+        return []
+    s = _loadout_to_display(loadout_text)
+    out = []
+    # Split into sentences (each model line)
+    for line in re.split(r"\n|\.\s+(?=Every|The|Each)", s):
+        line = line.strip().strip(".")
+        if not line:
+            continue
+        # "The Boss Nob is equipped with: slugga; big choppa" or "Every Boy is equipped with: slugga; choppa"
+        m = re.search(r"(?:The\s+)?(.+?)\s+is\s+equipped\s+with\s*:\s*(.+)", line, re.IGNORECASE)
+        if m:
+            model_label = m.group(1).strip()
+            weapons_str = m.group(2).strip()
+            weapons = [w.strip() for w in re.split(r"[;,]", weapons_str) if w.strip()]
+            if model_label and weapons:
+                out.append((model_label, weapons))
+    return out
+
+
+def _strip_option_html(text):
+    """Strip HTML from wargear option / description text: lists to bullets, remove tags, decode entities."""
+    if not text:
+        return ""
+    s = str(text).strip()
+    # Convert list items to newline + bullet so structure is preserved
+    s = re.sub(r"</li>\s*", "\n", s, flags=re.IGNORECASE)
+    s = re.sub(r"<li[^>]*>", "• ", s, flags=re.IGNORECASE)
+    for br in ("<br>", "<br/>", "<br />", "</br>"):
+        s = s.replace(br, "\n")
+    s = re.sub(r"<[^>]+>", "", s)
+    s = s.replace("&nbsp;", " ").replace("&amp;", "&").replace("&lt;", "<").replace("&gt;", ">").replace("&quot;", '"').replace("&#39;", "'").replace("&apos;", "'")
+    try:
+        import html
+        s = html.unescape(s)
+    except Exception:
+        pass
+    lines = [" ".join(ln.split()) for ln in s.split("\n")]
+    return fix_apostrophe_mojibake("\n".join(ln for ln in lines if ln))
+
+
+def _split_and_list(s):
+    """Split '1 big shoota and 1 close combat weapon' or 'slugga and choppa' into list of items (strip leading 1/one)."""
+    if not s or not s.strip():
+        return []
+    s = s.strip().strip('.').strip(',')
+    # Split on ' and ' but not inside parentheticals
+    parts = re.split(r"\s+and\s+", s, flags=re.IGNORECASE)
+    out = []
+    for p in parts:
+        p = p.strip()
+        # Drop leading "1 " or "one " so we get weapon name only
+        p = re.sub(r"^(?:1|one)\s+", "", p, flags=re.IGNORECASE).strip()
+        if p and len(p) > 1:
+            out.append(p)
+    return out
+
+
+def parse_wargear_option(text):
+    """
+    Parse wargear option text into structured rule for UI and weapon counts.
+    Returns: type in swap_1_1 | swap_multi | any_number | per_N_models | equipped_with | nested | simple,
+    plus who (model type), removed, added; for per_N_models: every_N, slots_per_N, options;
+    for equipped_with: added (list of one item), max (0..N).
+    """
+    if not text:
+        return {"type": "none"}
+    t = text.strip()
+    # Normalize curly/smart apostrophes so "Boss Nob's" matches regex
+    t = t.replace("\u2019", "'").replace("\u2018", "'")
+    t_lower = t.lower()
+
+    # --- "For every N models in this unit, 1 model equipped with X can be equipped with Y" (single or "one of the following")
+    per_equipped = re.search(
+        r"for\s+every\s+(\d+)\s+models\s+in\s+this\s+unit,?\s+1\s+model\s+equipped\s+with\s+(.+?)\s+can\s+be\s+equipped\s+with\s+(.+)",
+        t_lower,
+        re.IGNORECASE | re.DOTALL,
+    )
+    if per_equipped:
+        every_N = int(per_equipped.group(1))
+        removed_str = re.sub(r"^(?:a|an)\s+", "", per_equipped.group(2).strip().strip("."), flags=re.IGNORECASE).strip()
+        rest = per_equipped.group(3).strip().strip(".")
+        removed = _split_and_list(removed_str)
+        if "one of the following" in rest:
+            # Parse "one of the following: • 1 X • 1 Y"
+            rest = re.split(r"one of the following\s*:\s*", rest, flags=re.IGNORECASE)[-1].strip()
+            options_raw = re.split(r"\s+1\s+|\s+one\s+|\s*[•]\s*", rest)
+            option_displays = []
+            for o in options_raw:
+                o = o.strip().strip(',').strip('.').strip()
+                if len(o) > 2:
+                    option_displays.append(o)
+        else:
+            # Single option: "1 Astartes grenade launcher"
+            added_list = _split_and_list(rest)
+            option_displays = [rest.strip()] if rest else []
+            if added_list and not option_displays:
+                option_displays = [" ".join(added_list)]
+        if removed and option_displays:
+            return {
+                "type": "per_N_models",
+                "who": "model",
+                "every_N": every_N,
+                "slots_per_N": 1,
+                "removed": removed,
+                "options": option_displays,
+                "raw_options": option_displays,
+            }
+
+    # --- "For every N models in this unit, M ... can be replaced with one of the following: ..."
+    per_match = re.search(
+        r"for\s+every\s+(\d+)\s+models\s+in\s+this\s+unit,?\s+(?:1\s+)?(\w+)'s\s+(.+?)\s+can\s+be\s+replaced\s+with\s+one\s+of\s+the\s+following\s*:\s*(.+)",
+        t_lower,
+        re.IGNORECASE | re.DOTALL,
+    )
+    if per_match:
+        every_N = int(per_match.group(1))
+        who = per_match.group(2).strip()
+        removed_str = per_match.group(3).strip()
+        rest = per_match.group(4).strip()
+        removed = _split_and_list(removed_str)
+        # Parse options: "1 big shoota and 1 close combat weapon" / "1 rokkit launcha and 1 close combat weapon"
+        options_raw = re.split(r"\s+1\s+|\s+one\s+", rest)
+        fragments = []
+        for o in options_raw:
+            o = o.strip().strip(',').strip('.').replace("\n•", "").replace("•", "").strip()
+            if len(o) > 2:
+                fragments.append(o)
+        # Pair consecutive fragments: "big shoota and" + "close combat weapon" -> "big shoota and close combat weapon"
+        option_displays = []
+        if len(fragments) >= 2:
+            for i in range(0, len(fragments) - 1, 2):
+                option_displays.append(fragments[i] + " " + fragments[i + 1])
+        else:
+            option_displays = [re.sub(r"^(?:1|one)\s+", "", o, flags=re.IGNORECASE).strip() for o in fragments if o]
+        options_list = list(option_displays)
+        return {
+            "type": "per_N_models",
+            "who": who,
+            "every_N": every_N,
+            "slots_per_N": 1,
+            "removed": removed,
+            "options": option_displays,
+            "raw_options": options_list,
+        }
+
+    # --- "Any number of X can each have their Y and Z replaced with A and B"
+    any_match = re.search(
+        r"any\s+number\s+of\s+(.+?)\s+can\s+each\s+have\s+(?:their\s+)?(.+?)\s+replaced\s+with\s+(.+)",
+        t_lower,
+        re.IGNORECASE | re.DOTALL,
+    )
+    if any_match:
+        who = any_match.group(1).strip()
+        removed_str = any_match.group(2).strip()
+        added_str = any_match.group(3).strip()
+        removed = _split_and_list(removed_str)
+        added = _split_and_list(added_str)
+        return {"type": "any_number", "who": who, "removed": removed, "added": added}
+
+    # --- "The X's A and B can be replaced with 1 C and 1 D" (multi swap); accept straight or curly apostrophe
+    multi_swap = re.search(
+        r"(?:the\s+)?(.+?)['\u2019]s\s+(.+?)\s+can\s+be\s+replaced\s+with\s+(.+)",
+        t_lower,
+        re.IGNORECASE | re.DOTALL,
+    )
+    if multi_swap:
+        who = multi_swap.group(1).strip()
+        left = multi_swap.group(2).strip()
+        right = multi_swap.group(3).strip().strip('.')
+        # --- "The X's A can be replaced with one of the following: • 1 B • 1 C" → nested (radio to pick which)
+        if "one of the following" in right.lower():
+            removed = _split_and_list(left)
+            parts = re.split(r"one of the following\s*:\s*", right, flags=re.IGNORECASE)
+            rest = (parts[-1].strip() if len(parts) > 1 else "").replace("\n", " ")
+            options_list = []
+            for frag in re.split(r"\s*[•]\s*", rest):
+                frag = frag.strip().strip(',').strip('.').strip()
+                if len(frag) > 2:
+                    options_list.append(frag)
+            if removed and options_list:
+                return {"type": "nested", "target": removed[0] if len(removed) == 1 else left, "options": options_list}
+        if " and " in left and (" and " in right or re.search(r"1\s+\w+", right)):
+            removed = _split_and_list(left)
+            added = _split_and_list(right)
+            if len(removed) >= 1 and len(added) >= 1:
+                return {"type": "swap_multi", "who": who, "removed": removed, "added": added}
+        # --- "The X's A can be replaced with 1 B" (1:1 swap)
+        removed = _split_and_list(left)
+        added = _split_and_list(right)
+        if len(removed) == 1 and len(added) == 1:
+            return {"type": "swap_1_1", "who": who, "removed": removed[0], "added": added[0]}
+        if len(removed) >= 1 and len(added) >= 1:
+            return {"type": "swap_multi", "who": who, "removed": removed, "added": added}
+
+    # --- Fallback: "model's X can be replaced with Y" (1:1)
+    swap_match = re.search(
+        r"(?:model's|unit's|this\s+model's?)\s+(.*?)\s+can\s+be\s+replaced\s+with\s+(?:1\s+)?(.*)",
+        t,
+        re.IGNORECASE,
+    )
+    if swap_match:
+        target = swap_match.group(1).strip()
+        replacement = swap_match.group(2).strip().strip(".")
+        removed = _split_and_list(target)
+        added = _split_and_list(replacement)
+        if len(removed) == 1 and len(added) == 1:
+            return {"type": "swap_1_1", "who": "Model", "removed": removed[0], "added": added[0]}
+        if removed and added:
+            return {"type": "swap_multi", "who": "Model", "removed": removed, "added": added}
+
+    # --- "This model can be equipped with 1 X" / "with one X" / "with up to N X" (add optional wargear, no swap)
+    equipped = re.search(
+        r"this\s+model\s+can\s+be\s+equipped\s+with\s+(?:up\s+to\s+)?(?:1|one)\s+(.+?)(?:\.|$)",
+        t_lower,
+        re.IGNORECASE | re.DOTALL,
+    )
+    if equipped:
+        item = equipped.group(1).strip().strip(".").strip()
+        if len(item) > 1:
+            return {"type": "equipped_with", "added": [item], "max": 1}
+    equipped_n = re.search(
+        r"this\s+model\s+can\s+be\s+equipped\s+with\s+up\s+to\s+(\d+)\s+(.+?)(?:\.|$)",
+        t_lower,
+        re.IGNORECASE | re.DOTALL,
+    )
+    if equipped_n:
+        n = int(equipped_n.group(1))
+        item = equipped_n.group(2).strip().strip(".").strip()
+        if n >= 1 and len(item) > 1:
+            return {"type": "equipped_with", "added": [item], "max": min(n, 10)}
+
+    # Legacy: nested "one of the following" without "for every N models"
+    if "one of the following:" in t_lower:
+        parts = re.split(r"one of the following:", t, flags=re.IGNORECASE)
+        header = parts[0]
+        options_raw = re.split(r"\s1\s|\sone\s", parts[1])
+        options_list = []
+        for o in options_raw:
+            cleaned = o.strip().strip(',').strip('.').replace("\n•", "").replace("•", "").strip()
+            if len(cleaned) > 2:
+                options_list.append(cleaned)
+        target_match = re.search(r"(?:model's|unit's)\s+(.*?)\s+can be", header, re.IGNORECASE)
+        target = target_match.group(1).strip() if target_match else "Equipment"
+        return {"type": "nested", "target": target, "options": options_list}
+
+    return {"type": "simple", "text": text}
+
+
+def _compute_base_weapon_counts(loadout_text, quantity):
+    """
+    From default loadout text and unit quantity, return dict weapon_name -> count.
+    First model line = 1 model (e.g. Boss Nob), rest = quantity - 1 (e.g. Boyz).
+    If the only line (or a line) is "Every model" / "Each model" equipped with X, that line counts as quantity.
+    """
+    model_weapons = _parse_loadout_to_model_weapons(loadout_text)
+    if not model_weapons:
+        return {}
+    counts = {}
+    for i, (model_label, weapons) in enumerate(model_weapons):
+        label_lower = (model_label or "").strip().lower()
+        if label_lower.startswith("every model") or label_lower.startswith("each model") or label_lower == "every model" or label_lower == "each model":
+            n = max(0, quantity)
+        else:
+            n = 1 if i == 0 else max(0, quantity - 1)
+        if i == 0 and quantity == 0 and not (label_lower.startswith("every model") or label_lower.startswith("each model")):
+            n = 0
+        for w in weapons:
+            w = w.strip()
+            if w:
+                counts[w] = counts.get(w, 0) + n
+    return counts
+
+
+def normalize_weapon_name(name):
+    """Weapon name as compared everywhere: stripped, lower-cased, inner whitespace collapsed."""
+    if not name:
+        return ""
+    return re.sub(r"\s+", " ", str(name).strip().lower())
+
+
+def _weapon_name_matches(a, b):
+    """True if weapon names match for count updates (normalize and compare)."""
+    na, nb = normalize_weapon_name(a), normalize_weapon_name(b)
+    return na == nb or nb in na or na in nb
+
+
+def _apply_wargear_to_counts(base_counts, options_with_parsed, selections, quantity):
+    """
+    Apply wargear selections to base weapon counts. selections: list of same length as options_with_parsed;
+    each element is either an int (count for swap/any_number) or a list of choice strings (per slot for per_N_models).
+    Returns new dict weapon_name -> count (copy, not mutate base_counts).
+    """
+    counts = dict(base_counts)
+    for idx, (desc, parsed) in enumerate(options_with_parsed):
+        if idx >= len(selections):
+            continue
+        sel = selections[idx]
+        ptype = parsed.get("type")
+
+        def subtract(weapons, n):
+            for w in (weapons if isinstance(weapons, list) else [weapons]):
+                for k in list(counts.keys()):
+                    if _weapon_name_matches(k, w):
+                        counts[k] = max(0, (counts.get(k, 0) - n))
+                        break
+
+        def add(weapons, n):
+            for w in (weapons if isinstance(weapons, list) else [weapons]):
+                key = w.strip()
+                if key:
+                    # Try to match existing key for consistency
+                    for k in list(counts.keys()):
+                        if _weapon_name_matches(k, w):
+                            counts[k] = counts.get(k, 0) + n
+                            break
+                    else:
+                        counts[key] = counts.get(key, 0) + n
+
+        if ptype == "swap_1_1" and isinstance(sel, int) and sel > 0:
+            subtract([parsed["removed"]], sel)
+            add([parsed["added"]], sel)
+        elif ptype == "swap_multi" and isinstance(sel, int) and sel > 0:
+            subtract(parsed["removed"], sel)
+            add(parsed["added"], sel)
+        elif ptype == "any_number" and isinstance(sel, int) and sel > 0:
+            subtract(parsed["removed"], sel)
+            add(parsed["added"], sel)
+        elif ptype == "per_N_models" and isinstance(sel, list):
+            every_N = parsed.get("every_N") or 10
+            slots = (quantity // every_N) * (parsed.get("slots_per_N") or 1)
+            for choice in sel[:slots]:
+                if not choice:
+                    continue
+                # choice is full option string e.g. "big shoota and close combat weapon"
+                added_list = _split_and_list(choice)
+                subtract(parsed["removed"], 1)
+                add(added_list, 1)
+        elif ptype == "nested" and isinstance(sel, str) and sel and sel != "Default":
+            # Legacy nested: one choice for all slots
+            added_list = _split_and_list(sel)
+            subtract([parsed.get("target", "")], 1)
+            add(added_list, 1)
+        elif ptype == "equipped_with" and isinstance(sel, int) and sel > 0:
+            add(parsed.get("added", []), sel)
+    return counts
+
+
+def encode_parsed(parsed):
+    """parse_wargear_option() result as the JSON stored in waha_datasheets_options.parsed_json."""
+    return json.dumps(parsed, ensure_ascii=False, sort_keys=True)
+
+
+def parsed_option(desc, parsed_json=None, parser_version=None):
+    """Parse for one option description: the precompiled one if it was produced by this PARSER_VERSION,
+    otherwise parse_wargear_option(desc) live. desc is the HTML-stripped description."""
+    if parsed_json and parser_version is not None:
+        try:
+            if int(parser_version) == PARSER_VERSION:
+                parsed = json.loads(parsed_json)
+                if isinstance(parsed, dict):
+                    return parsed
+        except (TypeError, ValueError):
+            pass
+    return parse_wargear_option(desc)
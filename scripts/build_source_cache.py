@@ -0,0 +1,76 @@
+"""
+Build the binary source cache (ProxyForge/source_cache.py) for the OPR JSON and Wahapedia CSV files.
+
+Parses every data/opr/*.json and data/wahapedia/*.csv (including Cleaned_CSVs/) whose cache entry is
+missing or stale (source hash changed) and writes it to PROXYFORGE_SOURCE_CACHE_DIR (default
+data/cache/sources). Run after the fetchers so the app's cold start and the hydrators load binary
+caches instead of re-parsing text. Prints text-parse vs cached-load timings per file.
+
+Run from repo root:
+  python scripts/build_source_cache.py
+  python scripts/build_source_cache.py --opr-only -v
+"""
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+REPO = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO / "ProxyForge"))
+import source_cache  # noqa: E402
+
+OPR_DIR = REPO / "data" / "opr"
+WAHA_DIR = REPO / "data" / "wahapedia"
+
+
+def _sources(opr: bool, waha: bool) -> list[tuple[Path, str]]:
+    files = []
+    if opr:
+        files += [(p, "json") for p in sorted(OPR_DIR.glob("*.json"))]
+    if waha:
+        files += [(p, "csv") for p in sorted(WAHA_DIR.glob("*.csv")) + sorted((WAHA_DIR / "Cleaned_CSVs").glob("*.csv"))]
+    return files
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Build the binary cache of OPR/Wahapedia source files")
+    ap.add_argument("--opr-only", action="store_true", help="Only data/opr/*.json")
+    ap.add_argument("--waha-only", action="store_true", help="Only data/wahapedia CSVs")
+    ap.add_argument("-v", "--verbose", action="store_true", help="Print timings per file")
+    args = ap.parse_args()
+
+    files = _sources(not args.waha_only, not args.opr_only)
+    if not files:
+        print("No source files found under data/opr or data/wahapedia.")
+        return 0
+    parse_s = cached_s = 0.0
+    failed = 0
+    for path, kind in files:
+        load = source_cache.load_json if kind == "json" else source_cache.load_csv_rows
+        parse = source_cache._parse_json if kind == "json" else source_cache.read_csv_rows
+        try:
+            t0 = time.perf_counter()
+            load(path)  # builds the cache entry if missing or stale
+            t1 = time.perf_counter()
+            parse(path)
+            t2 = time.perf_counter()
+            load(path)
+            t3 = time.perf_counter()
+        except Exception as e:
+            failed += 1
+            print(f"  {path.relative_to(REPO)}: {e}")
+            continue
+        parse_s += t2 - t1
+        cached_s += t3 - t2
+        if args.verbose:
+            print(f"  {path.relative_to(REPO)}: build {(t1 - t0) * 1000:.1f} ms, "
+                  f"text {(t2 - t1) * 1000:.1f} ms, cached {(t3 - t2) * 1000:.1f} ms")
+    print(f"Cached {len(files) - failed}/{len(files)} file(s) in {source_cache.SOURCE_CACHE_DIR}. "
+          f"Text parse {parse_s * 1000:.1f} ms, cached load {cached_s * 1000:.1f} ms.")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,135 @@
+"""
+Parity check for the 40K points engine (ProxyForge/w40k_points.py).
+
+Loads every 40K list (or --list-id) twice: get_roster_40k_sql() (previous all-SQL version with
+correlated subqueries) and get_roster_40k() (flat queries + points computed in pandas from the
+reference cache). Reports any entry whose Total_Pts or other columns differ, plus timings.
+--selftest checks the engine's SQL NULL/zero semantics on synthetic rows without querying the DB.
+
+Run from repo root (uses .env for DB):
+  python scripts/check_40k_points_parity.py
+  python scripts/check_40k_points_parity.py --list-id 12 -v
+  python scripts/check_40k_points_parity.py --selftest
+Exit code 1 if any difference is found.
+"""
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from decimal import Decimal
+from pathlib import Path
+
+try:
+    from dotenv import load_dotenv
+    load_dotenv(Path(__file__).resolve().parents[1] / ".env")
+except ImportError:
+    pass
+
+REPO = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO / "ProxyForge"))
+from database_utils import get_db_connection  # noqa: E402
+from w40k_points import compute_total_points  # noqa: E402
+from w40k_roster import get_roster_40k, get_roster_40k_sql  # noqa: E402
+
+# (entry, enhancement cost, points_cost, min_size, expected Total_Pts) -- expected values are what the
+# SQL expression COALESCE(points * CEIL(qty / COALESCE(min_size, 1)) + enh, 0) returns in MySQL.
+SELFTEST_CASES = [
+    ({"entry_id": 1, "Qty": 10, "datasheet_id": "a"}, 0, 85, 10, 85),
+    ({"entry_id": 2, "Qty": 20, "datasheet_id": "a"}, 0, 85, 10, 170),
+    ({"entry_id": 3, "Qty": 11, "datasheet_id": "a"}, 0, 85, 10, 170),       # partial block rounds up
+    ({"entry_id": 4, "Qty": 1, "datasheet_id": "b"}, 25, 70, 1, 95),          # enhancement added
+    ({"entry_id": 5, "Qty": 3, "datasheet_id": "c"}, 0, 40, None, 120),       # no composition row -> min 1
+    ({"entry_id": 6, "Qty": 5, "datasheet_id": "d"}, 15, None, 5, 0),         # no points -> whole total 0
+    ({"entry_id": 7, "Qty": 5, "datasheet_id": "e"}, 15, 60, 0, 0),           # min_size 0 -> x/0 is NULL -> 0
+    ({"entry_id": 8, "Qty": None, "datasheet_id": "a"}, 0, 85, 10, 0),        # no quantity -> 0
+    ({"entry_id": 9, "Qty": 2, "datasheet_id": None}, 20, None, None, 0),     # unknown unit (join failed)
+    ({"entry_id": 10, "Qty": 6, "datasheet_id": " f "}, Decimal("10"), Decimal("55"), 3, 120),
+]
+
+
+def _num(v):
+    if v is None:
+        return None
+    try:
+        return float(v)
+    except (TypeError, ValueError):
+        return v
+
+
+def selftest() -> int:
+    entries = [dict(c[0]) for c in SELFTEST_CASES]
+    enh = {c[0]["entry_id"]: c[1] for c in SELFTEST_CASES if c[1]}
+    points = {str(c[0]["datasheet_id"]).strip(): c[2] for c in SELFTEST_CASES if c[0]["datasheet_id"] is not None}
+    sizes = {str(c[0]["datasheet_id"]).strip(): c[3] for c in SELFTEST_CASES if c[0]["datasheet_id"] is not None}
+    got = compute_total_points(entries, enh, points, sizes).tolist()
+    failures = 0
+    for (entry, _, _, _, expected), actual in zip(SELFTEST_CASES, got):
+        if _num(actual) != _num(expected):
+            failures += 1
+            print(f"  entry {entry['entry_id']}: expected {expected}, got {actual}")
+    print(f"Selftest: {len(SELFTEST_CASES) - failures}/{len(SELFTEST_CASES)} cases match SQL semantics.")
+    return 1 if failures else 0
+
+
+def compare_list(conn, list_id, verbose=False):
+    """Return (diff lines, sql seconds, engine seconds) for one list."""
+    t0 = time.perf_counter()
+    old = get_roster_40k_sql(conn, list_id)
+    t1 = time.perf_counter()
+    new = get_roster_40k(conn, list_id)
+    t2 = time.perf_counter()
+    diffs = []
+    if [r["entry_id"] for r in old] != [r["entry_id"] for r in new]:
+        diffs.append(f"list {list_id}: entry ids differ ({len(old)} vs {len(new)} rows)")
+        return diffs, t1 - t0, t2 - t1
+    for a, b in zip(old, new):
+        for key in sorted(set(a) | set(b)):
+            va, vb = a.get(key), b.get(key)
+            if key == "Total_Pts":
+                va, vb = _num(va), _num(vb)
+            if va != vb:
+                diffs.append(f"list {list_id} entry {a['entry_id']} {key}: sql={a.get(key)!r} engine={b.get(key)!r}")
+        if verbose:
+            print(f"  list {list_id} entry {a['entry_id']}: {a.get('Unit')} x{a.get('Qty')} = {b.get('Total_Pts')} pts")
+    return diffs, t1 - t0, t2 - t1
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Compare SQL and in-Python 40K roster points")
+    ap.add_argument("--list-id", type=int, action="append", help="List to check (repeatable; default: all 40K lists)")
+    ap.add_argument("--selftest", action="store_true", help="Check engine semantics on synthetic rows only")
+    ap.add_argument("-v", "--verbose", action="store_true", help="Print every entry")
+    args = ap.parse_args()
+    if args.selftest:
+        return selftest()
+
+    conn = get_db_connection()
+    try:
+        list_ids = args.list_id
+        if not list_ids:
+            cur = conn.cursor(dictionary=True)
+            cur.execute("SELECT list_id FROM play_armylists WHERE game_system = '40K_10E' ORDER BY list_id")
+            list_ids = [int(r["list_id"]) for r in cur.fetchall()]
+            cur.close()
+        # Warm the reference cache so engine timings reflect a normal rerun, not the first load.
+        if list_ids:
+            get_roster_40k(conn, list_ids[0])
+        all_diffs, sql_s, engine_s = [], 0.0, 0.0
+        for list_id in list_ids:
+            diffs, a, b = compare_list(conn, list_id, args.verbose)
+            all_diffs.extend(diffs)
+            sql_s += a
+            engine_s += b
+    finally:
+        conn.close()
+
+    for d in all_diffs:
+        print(d)
+    print(f"Checked {len(list_ids)} list(s): {len(all_diffs)} difference(s). "
+          f"SQL {sql_s * 1000:.1f} ms, engine {engine_s * 1000:.1f} ms.")
+    return 1 if all_diffs else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,139 @@
+"""
+Parity check for the OPR roster loader (ProxyForge/opr_roster.py).
+
+Loads every OPR list (or --list-id) twice: through the GetArmyRoster stored procedure and through
+get_roster_opr() (list header once, flat entry/unit/upgrade queries, points computed in Python).
+Reports any entry whose Total_Pts or other columns differ, plus timings.
+--selftest checks the points formula's SQL NULL semantics on synthetic values without the DB.
+
+Run from repo root (uses .env for DB; needs migrations/create_procedure_GetArmyRoster.sql):
+  python scripts/check_opr_roster_parity.py
+  python scripts/check_opr_roster_parity.py --list-id 3 -v
+  python scripts/check_opr_roster_parity.py --selftest
+Exit code 1 if any difference is found.
+"""
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from decimal import Decimal
+from pathlib import Path
+
+try:
+    from dotenv import load_dotenv
+    load_dotenv(Path(__file__).resolve().parents[1] / ".env")
+except ImportError:
+    pass
+
+REPO = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO / "ProxyForge"))
+from database_utils import get_db_connection  # noqa: E402
+from opr_roster import compute_opr_points, get_roster_opr  # noqa: E402
+
+# (base_cost, summed upgrade cost, quantity, expected Total_Pts) -- expected values are what
+# (o.base_cost + COALESCE(SUM(up.cost), 0)) * e.quantity returns in MySQL.
+SELFTEST_CASES = [
+    (100, None, 1, 100),
+    (100, Decimal("25"), 1, 125),                # upgrades added before multiplying
+    (60, Decimal("10"), 3, 210),
+    (None, Decimal("10"), 2, None),              # unit not matched (wrong army/system) -> NULL
+    (80, None, None, None),                      # no quantity -> NULL
+    (45, Decimal("0"), 0, 0),
+]
+
+
+def _num(v):
+    if v is None:
+        return None
+    try:
+        return float(v)
+    except (TypeError, ValueError):
+        return v
+
+
+def _text(v):
+    return v.decode() if isinstance(v, (bytes, bytearray)) else v
+
+
+def selftest() -> int:
+    failures = 0
+    for base, upgrades, qty, expected in SELFTEST_CASES:
+        actual = compute_opr_points(base, upgrades, qty)
+        if _num(actual) != _num(expected):
+            failures += 1
+            print(f"  base={base} upgrades={upgrades} qty={qty}: expected {expected}, got {actual}")
+    print(f"Selftest: {len(SELFTEST_CASES) - failures}/{len(SELFTEST_CASES)} cases match SQL semantics.")
+    return 1 if failures else 0
+
+
+def _procedure_rows(conn, list_id):
+    cur = conn.cursor(dictionary=True)
+    try:
+        cur.callproc("GetArmyRoster", (list_id,))
+        rows = []
+        for result in cur.stored_results():
+            rows = [dict(zip(result.column_names, r)) if not isinstance(r, dict) else dict(r) for r in result.fetchall()]
+        return sorted(rows, key=lambda r: r["entry_id"])
+    finally:
+        cur.close()
+
+
+def compare_list(conn, list_id, verbose=False):
+    """Return (diff lines, procedure seconds, loader seconds) for one list."""
+    t0 = time.perf_counter()
+    old = _procedure_rows(conn, list_id)
+    t1 = time.perf_counter()
+    new = get_roster_opr(conn, list_id)
+    t2 = time.perf_counter()
+    diffs = []
+    if [r["entry_id"] for r in old] != [r["entry_id"] for r in new]:
+        diffs.append(f"list {list_id}: entry ids differ ({len(old)} vs {len(new)} rows)")
+        return diffs, t1 - t0, t2 - t1
+    for a, b in zip(old, new):
+        for key in sorted(set(a) | set(b)):
+            va, vb = _text(a.get(key)), _text(b.get(key))
+            if key == "Total_Pts":
+                va, vb = _num(va), _num(vb)
+            if va != vb:
+                diffs.append(f"list {list_id} entry {a['entry_id']} {key}: procedure={a.get(key)!r} loader={b.get(key)!r}")
+        if verbose:
+            print(f"  list {list_id} entry {a['entry_id']}: {b.get('Unit')} x{b.get('Qty')} = {b.get('Total_Pts')} pts")
+    return diffs, t1 - t0, t2 - t1
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Compare GetArmyRoster with the Python OPR roster loader")
+    ap.add_argument("--list-id", type=int, action="append", help="List to check (repeatable; default: all OPR lists)")
+    ap.add_argument("--selftest", action="store_true", help="Check the points formula on synthetic values only")
+    ap.add_argument("-v", "--verbose", action="store_true", help="Print every entry")
+    args = ap.parse_args()
+    if args.selftest:
+        return selftest()
+
+    conn = get_db_connection()
+    try:
+        list_ids = args.list_id
+        if not list_ids:
+            cur = conn.cursor(dictionary=True)
+            cur.execute("SELECT list_id FROM play_armylists WHERE game_system = 'OPR' ORDER BY list_id")
+            list_ids = [int(r["list_id"]) for r in cur.fetchall()]
+            cur.close()
+        all_diffs, proc_s, loader_s = [], 0.0, 0.0
+        for list_id in list_ids:
+            diffs, a, b = compare_list(conn, list_id, args.verbose)
+            all_diffs.extend(diffs)
+            proc_s += a
+            loader_s += b
+    finally:
+        conn.close()
+
+    for d in all_diffs:
+        print(d)
+    print(f"Checked {len(list_ids)} list(s): {len(all_diffs)} difference(s). "
+          f"GetArmyRoster {proc_s * 1000:.1f} ms, loader {loader_s * 1000:.1f} ms.")
+    return 1 if all_diffs else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -27,6 +27,9 @@ _REPO_ROOT = _BASE.parent.parent
 JSON_PATH = _REPO_ROOT / "data" / "mmf" / "mmf_download.json"
 LAST_SYNC_PATH = _REPO_ROOT / "data" / "mmf" / "last_sync.json"
 
+sys.path.insert(0, str(_REPO_ROOT / "ProxyForge"))
+from ref_data_version import bump_data_version  # noqa: E402
+
 
 def hydrate_mmf_library(force=False):
     try:
@@ -151,6 +154,7 @@ def hydrate_mmf_library(force=False):
             )
             cursor.execute(sql_base, val)
 
+    bump_data_version(cursor, "mmf", "mmf_hydrator.py")
     conn.commit()
     conn.close()
     print(f"✅ Digital Library Hydrated!")
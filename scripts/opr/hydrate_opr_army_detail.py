@@ -12,6 +12,7 @@ Uses .env for DB (MYSQL_HOST, MYSQL_USER, MYSQL_PASSWORD, MYSQL_DATABASE).
 import argparse
 import json
 import os
+import sys
 from pathlib import Path
 
 try:
@@ -23,6 +24,9 @@ except ImportError:
 import mysql.connector
 
 _REPO = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(_REPO / "ProxyForge"))
+from ref_data_version import bump_data_version  # noqa: E402
+
 DEFAULT_FILE = _REPO / "data" / "opr" / "army_details.json"
 
 
@@ -92,6 +96,7 @@ def main():
             row.get("spells"),
         ))
         count += 1
+    bump_data_version(cursor, "opr", "hydrate_opr_army_detail.py")
     conn.commit()
     cursor.close()
     conn.close()
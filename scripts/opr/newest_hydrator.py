@@ -1,5 +1,5 @@
-import json
 import os
+import sys
 import mysql.connector
 from pathlib import Path
 
@@ -31,13 +31,16 @@ _port = (os.environ.get("MYSQL_PORT") or "").strip()
 if _port:
     DB_CONFIG["port"] = int(_port)
 
+sys.path.insert(0, str(_REPO_ROOT / "ProxyForge"))
+from ref_data_version import bump_data_version  # noqa: E402
+from source_cache import load_json  # noqa: E402
+
 # Default: data/opr/data.json (same output as scripts/opr/fetch_opr_json.py)
 JSON_PATH = _REPO_ROOT / "data" / "opr" / "data.json"
 
 def dual_system_sync():
     try:
-        with open(JSON_PATH, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        data = load_json(JSON_PATH)
     except FileNotFoundError:
         print(f"❌ JSON not found at {JSON_PATH}")
         return
@@ -84,6 +87,7 @@ def dual_system_sync():
         cursor.execute(sql, val)
         count += 1
 
+    bump_data_version(cursor, "opr", "newest_hydrator.py")
     conn.commit()
     cursor.close()
     conn.close()
@@ -0,0 +1,105 @@
+"""
+Validate saved 40K lists in bulk with the list validation engine (ProxyForge/w40k_validation.py).
+
+Runs validate_lists() over every 40K list (or --list-id): three queries in total, rules evaluated in
+pandas against the cached keyword/faction reference data. Prints each list's findings and a summary.
+--compare-view also reads view_list_validation_40k per list and reports any unit whose times_taken,
+max_allowed or faction_status differs from the engine (parity check for the view it replaces).
+
+Run from repo root (uses .env for DB):
+  python scripts/validate_40k_lists.py
+  python scripts/validate_40k_lists.py --list-id 12 --proxy
+  python scripts/validate_40k_lists.py --compare-view --json-out validation.json
+Exit code 1 if any list is not battle-ready (or, with --compare-view, any difference is found).
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import time
+from dataclasses import asdict
+from pathlib import Path
+
+try:
+    from dotenv import load_dotenv
+    load_dotenv(Path(__file__).resolve().parents[1] / ".env")
+except ImportError:
+    pass
+
+REPO = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO / "ProxyForge"))
+from database_utils import get_db_connection  # noqa: E402
+from w40k_validation import validate_lists  # noqa: E402
+
+
+def compare_with_view(conn, list_id, report):
+    """Differences between view_list_validation_40k and the engine's unit table for one list."""
+    cur = conn.cursor(dictionary=True)
+    cur.execute(
+        "SELECT unit_name, times_taken, max_allowed, faction_status FROM view_list_validation_40k WHERE list_id = %s",
+        (list_id,),
+    )
+    view_rows = sorted((str(r["unit_name"]), int(r["times_taken"]), int(r["max_allowed"]), str(r["faction_status"]))
+                       for r in cur.fetchall())
+    cur.close()
+    engine_rows = sorted((str(r.unit_name), int(r.times_taken), int(r.max_allowed), str(r.faction_status))
+                         for r in report.units.itertuples(index=False))
+    diffs = []
+    for row in sorted(set(view_rows) ^ set(engine_rows)):
+        side = "view" if row in view_rows else "engine"
+        diffs.append(f"list {list_id}: only in {side}: {row[0]} taken={row[1]} max={row[2]} status={row[3]}")
+    return diffs
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Validate saved 40K lists with the in-Python validation engine")
+    ap.add_argument("--list-id", type=int, action="append", help="List to check (repeatable; default: all 40K lists)")
+    ap.add_argument("--proxy", action="store_true", help="Validate as in Proxy Mode (chapter restrictions bypassed)")
+    ap.add_argument("--compare-view", action="store_true", help="Also diff against view_list_validation_40k")
+    ap.add_argument("--json-out", type=Path, help="Write findings per list as JSON")
+    ap.add_argument("-q", "--quiet", action="store_true", help="Only print the summary")
+    args = ap.parse_args()
+
+    conn = get_db_connection()
+    try:
+        t0 = time.perf_counter()
+        results = validate_lists(conn, args.list_id, proxy_mode=args.proxy)
+        elapsed = time.perf_counter() - t0
+        view_diffs = []
+        if args.compare_view:
+            for lst, report in results:
+                view_diffs.extend(compare_with_view(conn, lst["list_id"], report))
+    finally:
+        conn.close()
+
+    not_ready = 0
+    out = []
+    for lst, report in results:
+        ready = report.is_battle_ready
+        not_ready += 0 if ready else 1
+        if not args.quiet:
+            print(f"[{lst['list_id']}] {lst.get('list_name')} ({lst.get('faction_primary')}): "
+                  f"{'battle-ready' if ready else 'NOT battle-ready'}")
+            for f in report.findings:
+                print(f"    {f.severity:<7} {f.rule:<18} {f.message}")
+        out.append({
+            "list_id": lst["list_id"],
+            "list_name": lst.get("list_name"),
+            "battle_ready": ready,
+            "findings": [asdict(f) for f in report.findings],
+        })
+    for d in view_diffs:
+        print(d)
+
+    if args.json_out:
+        args.json_out.write_text(json.dumps(out, indent=2, default=str), encoding="utf-8")
+    summary = f"Validated {len(results)} list(s) in {elapsed * 1000:.1f} ms: {not_ready} not battle-ready."
+    if args.compare_view:
+        summary += f" {len(view_diffs)} difference(s) vs view_list_validation_40k."
+    print(summary)
+    return 1 if (not_ready or view_diffs) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,276 @@
+"""
+Benchmark and regression corpus for the 40K wargear parser (ProxyForge/wargear_parser.py).
+
+Loads every option row from data/wahapedia/Datasheets_options.csv and each unit's default loadout
+from Datasheets.csv, then per row: strips the option HTML, runs parse_wargear_option(), computes
+the base weapon counts from the loadout and applies a "max" selection of the option with
+_apply_wargear_to_counts(). Timings are reported per stage (aggregate, per option type, slowest
+rows); outputs are compared with a golden snapshot so a faster parser can be shown identical.
+
+No database needed. Run from repo root:
+  python scripts/wahapedia/bench_wargear_parser.py                  # benchmark + compare to golden
+  python scripts/wahapedia/bench_wargear_parser.py --check          # compare only (exit 1 on diff)
+  python scripts/wahapedia/bench_wargear_parser.py --update-golden  # rewrite the golden snapshot
+  python scripts/wahapedia/bench_wargear_parser.py --repeat 20 --top 15 --json-out bench.json
+"""
+from __future__ import annotations
+
+import argparse
+import csv
+import hashlib
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+
+REPO = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(REPO / "ProxyForge"))
+from wargear_parser import (  # noqa: E402
+    PARSER_VERSION,
+    _apply_wargear_to_counts,
+    _compute_base_weapon_counts,
+    _strip_option_html,
+    parse_wargear_option,
+)
+
+DEFAULT_DATA_DIR = REPO / "data" / "wahapedia"
+DEFAULT_GOLDEN = Path(__file__).resolve().parent / "wargear_parser_golden.json"
+UNIT_QUANTITY = 10
+
+
+def _read_pipe_csv(path: Path) -> list[dict]:
+    with open(path, encoding="utf-8-sig", errors="replace", newline="") as f:
+        rows = []
+        for r in csv.DictReader(f, delimiter="|"):
+            rows.append({(k or "").strip(): (v or "") for k, v in r.items() if k})
+        return rows
+
+
+def load_corpus(data_dir: Path) -> list[dict]:
+    """One dict per option row: key ('datasheet_id:line'), raw description, unit loadout."""
+    loadouts = {}
+    for r in _read_pipe_csv(data_dir / "Datasheets.csv"):
+        loadouts[r.get("id", "").strip()] = r.get("loadout") or ""
+    corpus = []
+    for r in _read_pipe_csv(data_dir / "Datasheets_options.csv"):
+        ds_id = r.get("datasheet_id", "").strip()
+        if not ds_id:
+            continue
+        corpus.append({
+            "key": f"{ds_id}:{r.get('line', '').strip()}",
+            "raw": r.get("description") or "",
+            "loadout": loadouts.get(ds_id, ""),
+        })
+    return corpus
+
+
+def max_selection(parsed: dict, quantity: int):
+    """Selection that exercises the option fully (the selection shape the builder stores for its type)."""
+    ptype = parsed.get("type")
+    if ptype in ("swap_1_1", "swap_multi"):
+        return 1
+    if ptype == "any_number":
+        return quantity
+    if ptype == "equipped_with":
+        return parsed.get("max") or 1
+    if ptype == "per_N_models":
+        opts = parsed.get("options") or []
+        slots = (quantity // (parsed.get("every_N") or 10)) * (parsed.get("slots_per_N") or 1)
+        return [opts[0] if opts else ""] * slots
+    if ptype == "nested":
+        opts = parsed.get("options") or []
+        return opts[0] if opts else "Default"
+    return 0
+
+
+def run_row(row: dict) -> dict:
+    desc = _strip_option_html(row["raw"])
+    parsed = parse_wargear_option(desc)
+    base = _compute_base_weapon_counts(row["loadout"], UNIT_QUANTITY)
+    final = _apply_wargear_to_counts(base, [(desc, parsed)], [max_selection(parsed, UNIT_QUANTITY)], UNIT_QUANTITY)
+    # The stripped text is stored as a hash to keep the golden file small; the CSV is the source of the text.
+    return {"desc_sha1": hashlib.sha1(desc.encode("utf-8")).hexdigest()[:16], "parsed": parsed, "final_counts": final}
+
+
+def snapshot(corpus: list[dict]) -> dict:
+    """Outputs for the whole corpus. Base counts are stored once per datasheet (shared by its options)."""
+    base_counts = {}
+    for r in corpus:
+        ds_id = r["key"].split(":", 1)[0]
+        if ds_id not in base_counts:
+            base_counts[ds_id] = _compute_base_weapon_counts(r["loadout"], UNIT_QUANTITY)
+    return {
+        "parser_version": PARSER_VERSION,
+        "quantity": UNIT_QUANTITY,
+        "base_counts": base_counts,
+        "rows": {r["key"]: run_row(r) for r in corpus},
+    }
+
+
+def dump_snapshot(snap: dict) -> str:
+    """Compact JSON with one datasheet/row per line so golden diffs stay readable in git."""
+    def _lines(mapping):
+        return ",\n".join(f"  {json.dumps(k)}: {json.dumps(v, ensure_ascii=False, sort_keys=True)}" for k, v in sorted(mapping.items()))
+    return (
+        "{\n"
+        f'"parser_version": {snap["parser_version"]},\n'
+        f'"quantity": {snap["quantity"]},\n'
+        f'"base_counts": {{\n{_lines(snap["base_counts"])}\n}},\n'
+        f'"rows": {{\n{_lines(snap["rows"])}\n}}\n'
+        "}\n"
+    )
+
+
+def _best_of(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def benchmark(corpus: list[dict], repeat: int) -> dict:
+    """Best-of-`repeat` wall time per row for each stage, in microseconds."""
+    rows = []
+    for row in corpus:
+        desc = _strip_option_html(row["raw"])
+        parsed = parse_wargear_option(desc)
+        sel = [max_selection(parsed, UNIT_QUANTITY)]
+        base = _compute_base_weapon_counts(row["loadout"], UNIT_QUANTITY)
+        pairs = [(desc, parsed)]
+        rows.append({
+            "key": row["key"],
+            "type": parsed.get("type"),
+            "strip_us": _best_of(lambda: _strip_option_html(row["raw"]), repeat) * 1e6,
+            "parse_us": _best_of(lambda: parse_wargear_option(desc), repeat) * 1e6,
+            "base_us": _best_of(lambda: _compute_base_weapon_counts(row["loadout"], UNIT_QUANTITY), repeat) * 1e6,
+            "apply_us": _best_of(lambda: _apply_wargear_to_counts(base, pairs, sel, UNIT_QUANTITY), repeat) * 1e6,
+        })
+    return {"repeat": repeat, "rows": rows}
+
+
+def _stage_summary(values: list[float]) -> dict:
+    if not values:
+        return {"total_ms": 0.0, "mean_us": 0.0, "p50_us": 0.0, "p95_us": 0.0, "max_us": 0.0}
+    ordered = sorted(values)
+    return {
+        "total_ms": round(sum(values) / 1000.0, 3),
+        "mean_us": round(statistics.fmean(values), 2),
+        "p50_us": round(ordered[len(ordered) // 2], 2),
+        "p95_us": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 2),
+        "max_us": round(ordered[-1], 2),
+    }
+
+
+def summarize(bench: dict, top: int) -> dict:
+    rows = bench["rows"]
+    stages = ("strip_us", "parse_us", "base_us", "apply_us")
+    by_type = {}
+    for r in rows:
+        t = by_type.setdefault(r["type"], {"rows": 0, "parse_us": 0.0, "apply_us": 0.0})
+        t["rows"] += 1
+        t["parse_us"] += r["parse_us"]
+        t["apply_us"] += r["apply_us"]
+    for t in by_type.values():
+        t["parse_mean_us"] = round(t.pop("parse_us") / t["rows"], 2)
+        t["apply_mean_us"] = round(t.pop("apply_us") / t["rows"], 2)
+    slowest = sorted(rows, key=lambda r: r["parse_us"] + r["apply_us"], reverse=True)[:top]
+    return {
+        "rows": len(rows),
+        "repeat": bench["repeat"],
+        "parser_version": PARSER_VERSION,
+        "stages": {s[:-3]: _stage_summary([r[s] for r in rows]) for s in stages},
+        "by_type": dict(sorted(by_type.items(), key=lambda kv: -kv[1]["rows"])),
+        "slowest": [{k: (round(v, 2) if isinstance(v, float) else v) for k, v in r.items()} for r in slowest],
+    }
+
+
+def compare(current: dict, golden: dict, limit: int = 20) -> list[str]:
+    """Human-readable differences between two snapshots (empty list = identical)."""
+    diffs = []
+    for ds_id in sorted(set(current["base_counts"]) | set(golden.get("base_counts", {}))):
+        a, b = golden.get("base_counts", {}).get(ds_id), current["base_counts"].get(ds_id)
+        if a != b:
+            diffs.append(f"{ds_id} [base_counts]\n    golden:  {json.dumps(a, ensure_ascii=False)}"
+                         f"\n    current: {json.dumps(b, ensure_ascii=False)}")
+    cur, old = current["rows"], golden.get("rows", {})
+    for key in sorted(set(old) - set(cur)):
+        diffs.append(f"{key}: missing from current corpus")
+    for key in sorted(set(cur) - set(old)):
+        diffs.append(f"{key}: new row (not in golden)")
+    for key in sorted(set(cur) & set(old)):
+        for field in ("desc_sha1", "parsed", "final_counts"):
+            if cur[key][field] != old[key].get(field):
+                diffs.append(f"{key} [{field}]\n    golden:  {json.dumps(old[key].get(field), ensure_ascii=False)}"
+                             f"\n    current: {json.dumps(cur[key][field], ensure_ascii=False)}")
+    if len(diffs) > limit:
+        diffs = diffs[:limit] + [f"... and {len(diffs) - limit} more"]
+    return diffs
+
+
+def _print_summary(s: dict) -> None:
+    print(f"Rows: {s['rows']}  (best of {s['repeat']} runs per row, parser version {s['parser_version']})")
+    print(f"{'stage':<8}{'total ms':>10}{'mean us':>10}{'p50 us':>10}{'p95 us':>10}{'max us':>10}")
+    for name, st in s["stages"].items():
+        print(f"{name:<8}{st['total_ms']:>10}{st['mean_us']:>10}{st['p50_us']:>10}{st['p95_us']:>10}{st['max_us']:>10}")
+    print("\nBy option type:")
+    for t, v in s["by_type"].items():
+        print(f"  {str(t):<14} rows={v['rows']:<5} parse mean={v['parse_mean_us']}us  apply mean={v['apply_mean_us']}us")
+    print("\nSlowest rows (parse + apply):")
+    for r in s["slowest"]:
+        print(f"  {r['key']:<16} {str(r['type']):<14} parse={r['parse_us']}us apply={r['apply_us']}us")
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Benchmark wargear parsing/count application and check against a golden snapshot")
+    ap.add_argument("--data-dir", type=Path, default=DEFAULT_DATA_DIR, help="Directory containing Wahapedia CSVs")
+    ap.add_argument("--golden", type=Path, default=DEFAULT_GOLDEN, help="Golden snapshot JSON path")
+    ap.add_argument("--update-golden", action="store_true", help="Write the current outputs as the golden snapshot")
+    ap.add_argument("--check", action="store_true", help="Only compare outputs with the golden snapshot (no timing)")
+    ap.add_argument("--repeat", type=int, default=5, help="Timed runs per row; the best is kept (default 5)")
+    ap.add_argument("--top", type=int, default=10, help="How many slowest rows to list")
+    ap.add_argument("--json-out", type=Path, help="Also write the timing summary as JSON")
+    args = ap.parse_args()
+
+    for name in ("Datasheets_options.csv", "Datasheets.csv"):
+        if not (args.data_dir / name).is_file():
+            print(f"Missing {args.data_dir / name}")
+            return 1
+    corpus = load_corpus(args.data_dir)
+    current = snapshot(corpus)
+
+    if args.update_golden:
+        args.golden.write_text(dump_snapshot(current), encoding="utf-8")
+        print(f"Wrote {len(current['rows'])} rows to {args.golden}")
+        return 0
+
+    status = 0
+    if args.golden.is_file():
+        golden = json.loads(args.golden.read_text(encoding="utf-8"))
+        diffs = compare(current, golden)
+        if diffs:
+            print(f"Golden mismatch ({args.golden.name}):")
+            for d in diffs:
+                print(f"  {d}")
+            status = 1
+        else:
+            print(f"Outputs identical to golden ({len(current['rows'])} rows).")
+    else:
+        print(f"No golden snapshot at {args.golden}; run with --update-golden to create it.")
+        status = 1 if args.check else 0
+    if args.check:
+        return status
+
+    print()
+    summary = summarize(benchmark(corpus, max(1, args.repeat)), args.top)
+    _print_summary(summary)
+    if args.json_out:
+        args.json_out.write_text(json.dumps(summary, indent=2) + "\n", encoding="utf-8")
+        print(f"\nWrote {args.json_out}")
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,98 @@
+"""
+Check w40k_datasheets.WeaponIndex (weapon name -> waha_weapons row) against the waha_weapons dump.
+
+Builds the index from the INSERT rows of MySQLDumps/wargaming_erp_waha_weapons.sql (in weapon_id
+order, like load_weapon_index()) and checks that every dumped name resolves to itself, that profile
+heads resolve to one of their profiles ('plasma pistol' -> 'Plasma pistol  standard'), and that
+ambiguous or partial names resolve to nothing instead of another weapon's profile.
+
+No database needed. Run from repo root:
+  python scripts/wahapedia/check_weapon_index.py
+  python scripts/wahapedia/check_weapon_index.py --dump path/to/wargaming_erp_waha_weapons.sql
+"""
+from __future__ import annotations
+
+import argparse
+import re
+import sys
+from pathlib import Path
+
+REPO = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(REPO / "ProxyForge"))
+from w40k_datasheets import WeaponIndex  # noqa: E402
+from wargear_parser import normalize_weapon_name  # noqa: E402
+
+DEFAULT_DUMP = REPO / "MySQLDumps" / "wargaming_erp_waha_weapons.sql"
+
+_STR = r"'((?:[^'\\]|\\.)*)'"
+_NUM = r"(-?\d+|NULL)"
+# (weapon_id, name, range_val, attacks_val, strength_val, ap_val, damage_val)
+_ROW_RE = re.compile(r"\(" + ",".join((_STR, _STR, _STR, _STR, _NUM, _NUM, _STR)) + r"\)")
+
+# wanted name -> expected waha name (normalized), or None when it must not resolve
+CASES = {
+    "Bolt rifle": None,                       # only 'Brutalis bolt rifles' / 'Blood fist bolt rifles'
+    "master-crafted bolt rifle": None,        # must not fall back to a shorter name inside it
+    "pistol": None,                           # single word shared by many weapons
+    "Artisan plasma pistol": "artisan plasma pistol",
+    "Shock lance": "cerastus shock lance",    # contained in exactly one weapon name
+    "Storm bolter": "storm bolter",
+}
+# wanted name -> profile head every match must have ('Plasma pistol  standard' has no dash)
+PROFILE_CASES = {
+    "plasma pistol": "plasma pistol",
+    "Plasma gun": "plasma gun",
+    "astartes grenade launcher": "astartes grenade launcher",
+}
+
+
+def _unescape(value):
+    return re.sub(r"\\(.)", r"\1", value)
+
+
+def load_dump_rows(path):
+    text = Path(path).read_text(encoding="utf-8")
+    rows = []
+    for stmt in re.findall(r"INSERT INTO `waha_weapons` VALUES (.*?);\n", text, re.DOTALL):
+        for wid, name, rng, att, _strength, ap, dmg in _ROW_RE.findall(stmt):
+            rows.append({
+                "weapon_id": _unescape(wid), "name": _unescape(name), "range_val": rng,
+                "attacks_val": att, "ap_val": None if ap == "NULL" else int(ap), "damage_val": dmg,
+            })
+    return sorted(rows, key=lambda r: r["weapon_id"])
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Check WeaponIndex lookups against the waha_weapons dump")
+    ap.add_argument("--dump", type=Path, default=DEFAULT_DUMP, help="waha_weapons SQL dump")
+    args = ap.parse_args()
+
+    rows = load_dump_rows(args.dump)
+    if not rows:
+        print(f"No waha_weapons rows found in {args.dump}.")
+        return 1
+    index = WeaponIndex(rows)
+    failures = []
+
+    for r in rows:
+        found = index.lookup(r["name"])
+        if normalize_weapon_name(r["name"]) and (found is None or normalize_weapon_name(found["name"]) != normalize_weapon_name(r["name"])):
+            failures.append(f"{r['name']!r} -> {found and found['name']!r} (expected itself)")
+    for wanted, expected in CASES.items():
+        found = index.lookup(wanted)
+        got = normalize_weapon_name(found["name"]) if found is not None else None
+        if got != expected:
+            failures.append(f"{wanted!r} -> {got!r} (expected {expected!r})")
+    for wanted, head in PROFILE_CASES.items():
+        found = index.lookup(wanted)
+        if found is None or not re.match(re.escape(head) + r"(\s+[-–—]\s+|\s{2,})", found["name"].strip().lower()):
+            failures.append(f"{wanted!r} -> {found and found['name']!r} (expected a {head!r} profile)")
+
+    for f in failures:
+        print(f"  {f}")
+    print(f"Checked {len(rows)} dumped names and {len(CASES) + len(PROFILE_CASES)} lookup cases: {len(failures)} failure(s).")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
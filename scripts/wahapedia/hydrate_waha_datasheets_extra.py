@@ -13,6 +13,7 @@ import argparse
 import csv
 import os
 import re
+import sys
 from pathlib import Path
 
 try:
@@ -24,6 +25,9 @@ except ImportError:
 import mysql.connector
 
 _REPO = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(_REPO / "ProxyForge"))
+from ref_data_version import bump_data_version  # noqa: E402
+
 _DATA_DIR = _REPO / "data" / "wahapedia"
 _CLEANED_DIR = _DATA_DIR / "Cleaned_CSVs"
 # Prefer root Datasheets.csv first so ids (000000001) match DB from full hydrator; then cleaned options.
@@ -149,6 +153,7 @@ def main():
                     if cursor.rowcount > 0:
                         updated += 1
                         break
+    bump_data_version(cursor, "waha", "hydrate_waha_datasheets_extra.py")
     conn.commit()
     if updated == 0 and count > 0:
         cursor.execute("SELECT waha_datasheet_id FROM waha_datasheets LIMIT 5")
@@ -19,6 +19,7 @@ import argparse
 import csv
 import os
 import re
+import sys
 from pathlib import Path
 
 try:
@@ -30,6 +31,11 @@ except ImportError:
 import mysql.connector
 
 REPO = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(REPO / "ProxyForge"))
+from ref_data_version import bump_data_version  # noqa: E402
+from source_cache import load_csv_rows  # noqa: E402
+from wargear_parser import PARSER_VERSION, encode_parsed, parse_wargear_option, _strip_option_html  # noqa: E402
+
 DEFAULT_DATA_DIR = REPO / "data" / "wahapedia"
 DB_CONFIG = {
     "host": os.environ.get("MYSQL_HOST", "127.0.0.1"),
@@ -122,9 +128,12 @@ def _normalize_row_keys(row: dict) -> dict:
 
 
 def read_csv(path: Path, delimiter: str | None = None, encoding: str = ENCODING_SIG) -> list[dict]:
-    """Read CSV; use utf-8-sig for BOM. Delimiter auto-detected from first line if None. Keys normalized (BOM stripped)."""
+    """Read CSV; use utf-8-sig for BOM. Delimiter auto-detected from first line if None. Keys normalized (BOM stripped).
+    With the defaults, rows come from the binary source cache (ProxyForge/source_cache.py) while the file is unchanged."""
     if not path.exists():
         return []
+    if delimiter is None and encoding == ENCODING_SIG:
+        return load_csv_rows(path)
     if delimiter is None:
         delimiter = _detect_delimiter(path, encoding)
     rows = []
@@ -460,6 +469,36 @@ def run_datasheets_options(cursor, data_dir: Path, dry_run: bool, verbose: bool)
     return n
 
 
+def run_datasheets_options_parse(cursor, data_dir: Path, dry_run: bool, verbose: bool) -> int:
+    """Store parse_wargear_option() output for every waha_datasheets_options row (migrations/add_waha_options_parsed.sql)."""
+    try:
+        cursor.execute("SELECT datasheet_id, line_id, description FROM waha_datasheets_options")
+        rows = cursor.fetchall()
+    except mysql.connector.Error as e:
+        if verbose:
+            print(f"    (skipped: {e})")
+        return 0
+    updates = []
+    for ds_id, line, desc in rows:
+        desc = _strip_option_html(desc or "")
+        parsed = encode_parsed(parse_wargear_option(desc)) if desc else None
+        updates.append((parsed, PARSER_VERSION, ds_id, line))
+    if dry_run or not updates:
+        return len(updates)
+    try:
+        cursor.executemany(
+            "UPDATE waha_datasheets_options SET parsed_json = %s, parser_version = %s WHERE datasheet_id = %s AND line_id = %s",
+            updates,
+        )
+    except mysql.connector.Error as e:
+        # parsed_json/parser_version columns missing: the builder parses live, nothing to store.
+        print(f"    datasheets_options_parse skipped ({e}); run migrations/add_waha_options_parsed.sql")
+        return 0
+    if verbose:
+        print(f"    parser version {PARSER_VERSION}")
+    return len(updates)
+
+
 def run_datasheets_leader(cursor, data_dir: Path, dry_run: bool, verbose: bool) -> int:
     path = _resolve_path(data_dir, "Datasheets_leader.csv")
     rows = read_csv(path)
@@ -637,6 +676,7 @@ STEPS = [
     ("abilities_csv_merge", run_abilities_csv_merge),
     ("datasheets_wargear", run_datasheets_wargear),
     ("datasheets_options", run_datasheets_options),
+    ("datasheets_options_parse", run_datasheets_options_parse),
     ("datasheets_leader", run_datasheets_leader),
     ("stratagems", run_stratagems),
     ("enhancements", run_enhancements),
@@ -701,6 +741,7 @@ def main():
             raise
 
     if not args.dry_run:
+        bump_data_version(cursor, "waha", "hydrate_waha_full.py")
         conn.commit()
     cursor.close()
     conn.close()